@@ -0,0 +1,339 @@
+"""
+FILE: bom_batch.py
+
+PURPOSE:
+Non-interactive batch mode.  Compares every BOM pair listed in a
+manifest, spreading the pairs across a pool of worker processes.
+
+The manifest is either a CSV file with the columns
+
+	bom1,label1,bom2,label2[,output]
+
+or a JSON file holding a list of objects with the same keys (or an
+object with a "pairs" list).  Relative paths are taken relative to the
+manifest.  Each pair gets its own comparison workbook (and/or CSV and
+JSON Lines files, see --format), and a summary report (CSV and JSON) is
+written once every pair is done.
+
+Usage:
+	python bom_batch.py manifest.csv --workers 8 --out-dir results
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import bom_external
+import compare_bom_xlsx
+from bom_cache import BomCache
+from bom_desc import DES_THRESHOLD, DescriptionScorer
+from bom_header import HEADER_SYNONYMS, HeaderClassifier, load_synonym_file
+from bom_timing import NULL_TIMER, PhaseTimer
+
+PHASES = ["open", "header", "rows", "table", "compare", "describe", "write"]
+SUMMARY_FIELDS = ["index","label1","label2","bom1","bom2","output","status","error",
+				"rows1","rows2","matched","only1","only2","fuzzy","des_flagged","qty_changed","index_error","seconds"] + [phase + "_seconds" for phase in PHASES]
+
+
+class ManifestError(Exception):
+	pass
+
+
+# -------------------------------------- #
+# Local Methods
+# -------------------------------------- #
+def safe_name(text):
+	# Keep labels usable as part of a file name
+	return re.sub(r"[^A-Za-z0-9._-]+", "_", str(text)).strip("_") or "BOM"
+
+def read_manifest(filename):
+	# Returns a list of dictionaries with bom1/label1/bom2/label2/output keys
+	base_dir = os.path.dirname(os.path.abspath(filename))
+	if filename.lower().endswith(".json"):
+		with open(filename) as f:
+			entries = json.load(f)
+		if isinstance(entries, dict):
+			entries = entries.get("pairs", [])
+	else:
+		with open(filename, newline = "") as f:
+			entries = [row for row in csv.DictReader(f)]
+
+	pairs = []
+	for n, entry in enumerate(entries, 1):
+		entry = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in entry.items() if k}
+		if (not entry.get("bom1")) or (not entry.get("bom2")):
+			raise ManifestError("Manifest entry " + str(n) + " needs both bom1 and bom2")
+		pair = {
+			"index":	n,
+			"bom1":		os.path.join(base_dir, entry["bom1"]),
+			"bom2":		os.path.join(base_dir, entry["bom2"]),
+			"label1":	entry.get("label1") or os.path.splitext(os.path.basename(entry["bom1"]))[0],
+			"label2":	entry.get("label2") or os.path.splitext(os.path.basename(entry["bom2"]))[0],
+			"output":	entry.get("output") or "",
+		}
+		pairs.append(pair)
+	return pairs
+
+def assign_outputs(pairs, out_dir, formats = ("xlsx",)):
+	# Every pair gets its own results file(s), one per output format.  Names
+	# that would collide get the manifest index added.
+	used = set()
+	for pair in pairs:
+		if pair["output"]:
+			output = pair["output"]
+			if not os.path.isabs(output):
+				output = os.path.join(out_dir, output)
+		else:
+			output = os.path.join(out_dir, "Comparison_" + safe_name(pair["label1"]) + "_vs_" + safe_name(pair["label2"]) + "." + formats[0])
+		root, ext = os.path.splitext(output)
+		if root in used:
+			root = root + "_" + str(pair["index"])
+		used.add(root)
+		pair["output"] = root + ext
+		pair["outputs"] = [pair["output"]] + [root + "." + fmt for fmt in formats if ("." + fmt) != ext.lower()]
+	return pairs
+
+
+# ----------------------------------------------------------------------- #
+# Worker process
+# ----------------------------------------------------------------------- #
+worker_cache = None					# Parsed BOM cache of this worker process
+worker_fuzzy = None					# bom_fuzzy.FuzzyMatcher when fuzzy QPN matching is on
+worker_des_scorer = None			# bom_desc.DescriptionScorer sharing the cached vocabulary
+worker_external_rows = None			# Lines above which BOMs are compared out of core
+worker_index = None					# bom_index.BomIndex the parsed BOMs are stored in, if any
+
+def init_worker(max_worker_mb, synonym_file, cache_dir = None, use_cache = True, fuzzy = False, fuzzy_threshold = None,
+				des_threshold = DES_THRESHOLD, external_rows = None, index_file = None):
+	global worker_cache, worker_fuzzy, worker_des_scorer, worker_external_rows, worker_index
+	# Per-row diagnostics are far too expensive across thousands of pairs
+	logging.basicConfig(level = logging.WARNING, format = ' %(asctime)s -  %(levelname)s - %(message)s')
+	worker_cache = BomCache(cache_dir, enabled = None if use_cache else False)
+	if synonym_file:
+		compare_bom_xlsx.load_header_synonyms(synonym_file)
+	worker_fuzzy = compare_bom_xlsx.fuzzy_matcher(fuzzy_threshold) if fuzzy else None
+	worker_des_scorer = DescriptionScorer(worker_cache, des_threshold)
+	worker_external_rows = external_rows
+	if index_file:
+		import bom_index
+		worker_index = bom_index.BomIndex(index_file)
+
+	# Cap the address space of each worker so one huge BOM can't take the
+	# machine down.  The pair fails with MemoryError instead.
+	if max_worker_mb:
+		try:
+			import resource
+			limit = int(max_worker_mb) * 1024 * 1024
+			resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+		except (ImportError, ValueError, OSError) as e:
+			logging.warning("Could not limit worker memory: %s", e)
+
+def run_pair(pair):
+	result = dict(pair)
+	result.update({"status": "ok", "error": "", "rows1": 0, "rows2": 0, "matched": 0, "only1": 0, "only2": 0, "fuzzy": 0, "des_flagged": 0, "qty_changed": 0, "index_error": ""})
+	timer = PhaseTimer()
+	start = time.perf_counter()
+	try:
+		bom1 = bom_external.load(pair["bom1"], pair["label1"], cache = worker_cache, timer = timer, threshold = worker_external_rows)
+		bom2 = bom_external.load(pair["bom2"], pair["label2"], cache = worker_cache, timer = timer, threshold = worker_external_rows)
+		if worker_index is not None:
+			# The index is a by-product; a failure there doesn't fail the pair
+			try:
+				with timer.phase("index"):
+					worker_index.add(bom1, pair["bom1"])
+					worker_index.add(bom2, pair["bom2"])
+			except Exception as e:
+				logging.warning("Could not index %s / %s: %s", pair["bom1"], pair["bom2"], e)
+				result["index_error"] = type(e).__name__ + ": " + str(e)
+		comparison = bom_external.compare(bom1, bom2, timer, worker_fuzzy, worker_des_scorer)
+		comparison.render(pair.get("outputs") or pair["output"])
+		result.update(comparison.summary())
+		worker_des_scorer.save()
+	except Exception as e:
+		result["status"] = "error"
+		result["error"] = type(e).__name__ + ": " + str(e)
+	result["seconds"] = round(time.perf_counter() - start, 3)
+	for phase in PHASES:
+		result[phase + "_seconds"] = round(timer.phases.get(phase, 0.0), 3)
+	result["sheets_skipped"] = timer.counters.get("sheets_skipped", 0)
+	return result
+
+
+def load_job(job):
+	# (BOM, PhaseTimer) of one (filename, label) job
+	filename, label = job
+	timer = PhaseTimer()
+	bom = bom_external.load(filename, label, cache = worker_cache, timer = timer, threshold = worker_external_rows)
+	return bom, timer
+
+
+# ----------------------------------------------------------------------- #
+# Concurrent parsing
+# ----------------------------------------------------------------------- #
+class ConcurrentLoader:
+	# Parses workbooks side by side, one worker process per workbook, so
+	# two BOMs take about as long as the larger one instead of both.
+	# submit() starts a parse and returns at once (so the caller can do
+	# something else meanwhile, i.e. ask for labels); result() waits for it.
+	# The workers' phase timings are merged into timer.
+
+	def __init__(self, workers, synonym_file = None, cache_dir = None, use_cache = True, external_rows = None, timer = None):
+		self.timer = timer or NULL_TIMER
+		self.pool = multiprocessing.Pool(processes = max(workers, 1), initializer = init_worker,
+										initargs = (0, synonym_file, cache_dir, use_cache, False, None, DES_THRESHOLD, external_rows))
+
+	def submit(self, filename, label = None):
+		return self.pool.apply_async(load_job, ((filename, label),))
+
+	def result(self, pending):
+		bom, timer = pending.get()
+		self.timer.merge(timer)
+		return bom
+
+	def close(self):
+		self.pool.close()
+		self.pool.join()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		if exc[0] is None:
+			self.close()
+		else:
+			self.pool.terminate()
+
+
+def local_classifier(synonym_file = None):
+	# A HeaderClassifier with the synonyms of synonym_file added, leaving
+	# the shared one alone.  None (the shared classifier) without a file.
+	if not synonym_file:
+		return None
+	synonyms = {field: list(patterns) for field, patterns in HEADER_SYNONYMS.items()}
+	load_synonym_file(synonym_file, synonyms)
+	return HeaderClassifier(synonyms)
+
+def load_boms(files, labels = None, workers = None, synonym_file = None, cache_dir = None, use_cache = True,
+			external_rows = None, timer = None):
+	# Parse every workbook, concurrently unless workers is 1.  Workers are
+	# set up the same way as the batch mode workers (logging, cache, synonyms).
+	# With one worker the workbooks are parsed right here, with a cache and
+	# classifier of their own: this process's logging, shared classifier
+	# and worker globals are left as they are.
+	labels = labels or [None] * len(files)
+	workers = min(workers or os.cpu_count() or 1, max(len(files), 1))
+	if workers <= 1:
+		cache = BomCache(cache_dir, enabled = None if use_cache else False)
+		classifier = local_classifier(synonym_file)
+		return [bom_external.load(f, l, cache = cache, classifier = classifier, timer = timer, threshold = external_rows)
+				for f, l in zip(files, labels)]
+	with ConcurrentLoader(workers, synonym_file, cache_dir, use_cache, external_rows, timer) as loader:
+		pending = [loader.submit(f, l) for f, l in zip(files, labels)]
+		return [loader.result(p) for p in pending]
+
+
+# ----------------------------------------------------------------------- #
+# Batch driver
+# ----------------------------------------------------------------------- #
+def run_batch(pairs, workers = None, max_tasks_per_child = 20, max_worker_mb = 0, synonym_file = None,
+			cache_dir = None, use_cache = True, progress = print, fuzzy = False, fuzzy_threshold = None,
+			des_threshold = DES_THRESHOLD, external_rows = None, index_file = None):
+	# Compare every pair on a process pool.  Workers are replaced after
+	# max_tasks_per_child pairs so memory can't creep up over a long run.
+	# Results come back in manifest order.
+	workers = workers or os.cpu_count() or 1
+	workers = min(workers, max(len(pairs), 1))
+	results = []
+	with multiprocessing.Pool(processes = workers, initializer = init_worker,
+							initargs = (max_worker_mb, synonym_file, cache_dir, use_cache, fuzzy, fuzzy_threshold, des_threshold, external_rows,
+										index_file),
+							maxtasksperchild = max_tasks_per_child or None) as pool:
+		for result in pool.imap_unordered(run_pair, pairs):
+			results.append(result)
+			progress("[" + str(len(results)) + "/" + str(len(pairs)) + "] " + result["status"] + ": "
+					+ result["label1"] + " vs " + result["label2"] + " (" + str(result["seconds"]) + " s)")
+	results.sort(key = lambda r: r["index"])
+	return results
+
+def write_summary(results, filename, elapsed = None):
+	# Write <filename>.csv and <filename>.json
+	root = os.path.splitext(filename)[0]
+	with open(root + ".csv", "w", newline = "") as f:
+		writer = csv.DictWriter(f, fieldnames = SUMMARY_FIELDS, extrasaction = "ignore")
+		writer.writeheader()
+		writer.writerows(results)
+
+	failed = [r for r in results if r["status"] != "ok"]
+	report = {
+		"pairs":		len(results),
+		"succeeded":	len(results) - len(failed),
+		"failed":		len(failed),
+		"elapsed_seconds":	round(elapsed, 3) if elapsed is not None else None,
+		"phase_seconds":	{phase: round(sum(r.get(phase + "_seconds", 0.0) for r in results), 3) for phase in PHASES},
+		"results":		[{k: r.get(k) for k in SUMMARY_FIELDS} for r in results],
+	}
+	with open(root + ".json", "w") as f:
+		json.dump(report, f, indent = 2)
+	return report
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Compare many BOM pairs listed in a manifest (CSV or JSON).")
+	parser.add_argument("manifest", help = "CSV or JSON manifest of BOM pairs")
+	parser.add_argument("-o", "--out-dir", default = "comparison_results", help = "Directory for comparison workbooks and the summary")
+	parser.add_argument("-j", "--workers", type = int, default = 0, help = "Worker processes (default: one per core)")
+	parser.add_argument("--max-tasks-per-child", type = int, default = 20, help = "Pairs a worker handles before it is replaced")
+	parser.add_argument("--max-worker-mb", type = int, default = 0, help = "Address space limit per worker in MB (0 = no limit)")
+	parser.add_argument("--format", action = "append", choices = ["xlsx", "csv", "json", "jsonl"], default = None,
+						help = "Output format, may be given more than once (default: xlsx)")
+	parser.add_argument("--summary", default = None, help = "Summary report path (default: <out-dir>/batch_summary)")
+	parser.add_argument("--synonyms", default = compare_bom_xlsx.SYNONYM_FILE, help = "Extra header synonym file")
+	parser.add_argument("--cache-dir", default = None, help = "Parsed BOM cache directory")
+	parser.add_argument("--no-cache", action = "store_true", help = "Always parse workbooks, bypassing the parsed BOM cache")
+	parser.add_argument("--fuzzy", action = "store_true", help = "Propose pairs of near-miss QPNs in each comparison")
+	parser.add_argument("--fuzzy-threshold", type = float, default = None, help = "Lowest score of a proposed pair (0..1)")
+	parser.add_argument("--des-threshold", type = float, default = DES_THRESHOLD, help = "Flag matched QPNs whose DES similarity is below this (0..1)")
+	parser.add_argument("--external-rows", type = int, default = compare_bom_xlsx.EXTERNAL_ROWS,
+						help = "Compare out of core (sorted runs on disk) above this many BOM lines, 0 = never")
+	parser.add_argument("--index", default = None, help = "Also store the parsed BOMs in this SQLite part index (see bom_index.py)")
+	args = parser.parse_args(argv)
+
+	try:
+		pairs = read_manifest(args.manifest)
+	except (OSError, ValueError, ManifestError) as e:
+		print("**Could not read manifest: " + str(e))
+		return 2
+
+	os.makedirs(args.out_dir, exist_ok = True)
+	assign_outputs(pairs, args.out_dir, args.format or ["xlsx"])
+	synonym_file = os.path.abspath(args.synonyms) if os.path.isfile(args.synonyms) else None
+
+	print("Comparing " + str(len(pairs)) + " BOM pair(s)")
+	start = time.perf_counter()
+	results = run_batch(pairs, args.workers, args.max_tasks_per_child, args.max_worker_mb, synonym_file,
+						args.cache_dir, not args.no_cache, fuzzy = args.fuzzy, fuzzy_threshold = args.fuzzy_threshold,
+						des_threshold = args.des_threshold, external_rows = args.external_rows,
+						index_file = os.path.abspath(args.index) if args.index else None)
+	elapsed = time.perf_counter() - start
+
+	summary = args.summary or os.path.join(args.out_dir, "batch_summary")
+	report = write_summary(results, summary, elapsed)
+	print("Done: " + str(report["succeeded"]) + " succeeded, " + str(report["failed"]) + " failed in "
+			+ str(round(elapsed, 1)) + " s.  Summary: " + os.path.splitext(summary)[0] + ".csv/.json")
+	return 1 if report["failed"] else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
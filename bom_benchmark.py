@@ -0,0 +1,263 @@
+"""
+FILE: bom_benchmark.py
+
+PURPOSE:
+Benchmark suite for compare_bom_xlsx.
+
+For each case a pair of synthetic workbooks is generated (bom_synth.py,
+kept in --work-dir between runs) and compared in a fresh Python process,
+so every case starts cold and its peak memory is its own.  Each phase is
+timed separately:
+
+	open		-- opening the workbook and listing its sheets
+	header		-- rejecting small sheets and finding the header row
+	rows		-- extracting and cleaning the BOM rows
+	table		-- building the columnar BomTable
+	compare		-- key set comparison
+	describe	-- DES similarity of the matched QPNs
+	write		-- writing Comparison_Results.xlsx
+
+Results are appended to bench_results.jsonl together with the git
+commit and parser version, and each case is compared against the last
+recorded run of the same case so regressions show up across versions.
+
+Usage:
+	python bom_benchmark.py --rows 1000,10000,100000
+	python bom_benchmark.py --rows 500000 --header-offset 5 --blank-gap-every 100
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import bom_synth
+import compare_bom_xlsx
+from bom_timing import PhaseTimer
+
+RESULTS_FILE	= "bench_results.jsonl"
+DEFAULT_ROWS	= "1000,10000,100000"
+REGRESSION_PCT	= 10.0				# Slower than the previous run by more than this -> flagged
+PHASES			= ["open", "header", "rows", "table", "compare", "describe", "write"]
+
+
+# -------------------------------------- #
+# Local Methods
+# -------------------------------------- #
+def git_commit():
+	try:
+		out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+							cwd = os.path.dirname(os.path.abspath(__file__)))
+		commit = out.stdout.strip()
+		dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output = True, text = True,
+							cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+		return commit + ("-dirty" if dirty else "") if commit else "unknown"
+	except OSError:
+		return "unknown"
+
+def peak_rss_mb():
+	# Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		peak = peak / 1024.0
+	return round(peak / 1024.0, 1)
+
+def case_name(case):
+	# Every generator setting is part of the name, so the history never
+	# compares runs on different workbooks
+	name = str(case["rows"]) + "r"
+	if case["header_offset"]:
+		name += "_off" + str(case["header_offset"])
+	if case["blank_gap_every"]:
+		name += "_gap" + str(case["blank_gap_every"])
+	if not case["changelog"]:
+		name += "_nolog"
+	name += "_a%gr%gm%g" % (case["added"], case["removed"], case["modified"])
+	if not case["vary_headers"]:
+		name += "_samehdr"
+	name += "_s" + str(case["seed"])
+	return name + "_" + case["reader"]
+
+
+# ----------------------------------------------------------------------- #
+# One case, run in its own process
+# ----------------------------------------------------------------------- #
+def run_case(case):
+	if case.get("tracemalloc"):
+		import tracemalloc
+		tracemalloc.start()
+
+	timer = PhaseTimer()
+	start = time.perf_counter()
+	bom1 = compare_bom_xlsx.Bom.load(case["bom1"], "A", reader = case["reader"], timer = timer)
+	bom2 = compare_bom_xlsx.Bom.load(case["bom2"], "B", reader = case["reader"], timer = timer)
+	comparison = compare_bom_xlsx.compare(bom1, bom2, timer = timer)
+	comparison.render(case["output"])
+	elapsed = time.perf_counter() - start
+
+	result = {
+		"phases":		{name: round(seconds, 4) for name, seconds in timer.phases.items()},
+		"counters":		dict(timer.counters),
+		"total_seconds":	round(elapsed, 4),
+		"rows_per_second":	round(timer.counters.get("rows", 0) / max(timer.phases.get("rows", 0.0), 1e-9)),
+		"peak_rss_mb":	peak_rss_mb(),
+		"summary":		comparison.summary(),
+	}
+	if case.get("tracemalloc"):
+		result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0), 1)
+		tracemalloc.stop()
+
+	# The comparison must find exactly what the generator put in
+	expected = case["expected"]
+	got = result["summary"]
+	result["correct"] = (got["matched"] == expected["matched"] and got["only1"] == expected["removed"]
+						and got["only2"] == expected["added"])
+	return result
+
+def run_case_subprocess(case):
+	proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+						capture_output = True, text = True)
+	if proc.returncode != 0:
+		raise RuntimeError("Benchmark case " + case["name"] + " failed:\n" + proc.stderr)
+	return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ----------------------------------------------------------------------- #
+# Results history
+# ----------------------------------------------------------------------- #
+def load_history(filename):
+	# Last recorded result of every case
+	last = {}
+	if not os.path.isfile(filename):
+		return last
+	with open(filename) as f:
+		for line in f:
+			line = line.strip()
+			if line:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					continue
+				last[record.get("case")] = record
+	return last
+
+def find_regressions(record, previous, threshold = REGRESSION_PCT):
+	# (what, previous, current, percent) for every phase / metric that got worse
+	if not previous:
+		return []
+	regressions = []
+	checks = [(name, previous["phases"].get(name), record["phases"].get(name)) for name in PHASES]
+	checks.append(("total", previous.get("total_seconds"), record.get("total_seconds")))
+	checks.append(("peak_rss_mb", previous.get("peak_rss_mb"), record.get("peak_rss_mb")))
+	for what, before, after in checks:
+		# Ignore phases too short to time reliably
+		if (not before) or (after is None) or ((what != "peak_rss_mb") and (before < 0.01)):
+			continue
+		change = 100.0 * (after - before) / before
+		if change > threshold:
+			regressions.append((what, before, after, round(change, 1)))
+	return regressions
+
+def print_record(record):
+	phases = record["phases"]
+	print("  " + record["case"] + ": " + "  ".join(name + " " + "%.3f" % phases.get(name, 0.0) for name in PHASES)
+		+ "  | total " + "%.3f" % record["total_seconds"] + " s, " + str(record["rows_per_second"]) + " rows/s, peak "
+		+ str(record["peak_rss_mb"]) + " MB" + ("" if record["correct"] else "  **WRONG RESULT**"))
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Benchmark compare_bom_xlsx on synthetic BOM workbooks.")
+	parser.add_argument("--rows", default = DEFAULT_ROWS, help = "Comma separated row counts (default: " + DEFAULT_ROWS + ")")
+	parser.add_argument("--added", type = float, default = 1.0, help = "Percent of QPNs added in the revised BOM")
+	parser.add_argument("--removed", type = float, default = 1.0, help = "Percent of QPNs removed in the revised BOM")
+	parser.add_argument("--modified", type = float, default = 2.0, help = "Percent of QPNs modified in the revised BOM")
+	parser.add_argument("--header-offset", type = int, default = 2, help = "Title rows above the header")
+	parser.add_argument("--blank-gap-every", type = int, default = 0, help = "Blank row after every N data rows")
+	parser.add_argument("--no-changelog", action = "store_true", help = "Leave out the revision history sheet")
+	parser.add_argument("--same-headers", action = "store_true", help = "Spell the revised BOM's header like the first one's")
+	parser.add_argument("--seed", type = int, default = 0, help = "Random seed of the generated workbooks")
+	parser.add_argument("--reader", choices = ["native", "openpyxl"], default = "native")
+	parser.add_argument("--repeat", type = int, default = 1, help = "Runs per case, the fastest is kept")
+	parser.add_argument("--tracemalloc", action = "store_true", help = "Also record the Python heap peak (slower)")
+	parser.add_argument("--work-dir", default = os.path.join(tempfile.gettempdir(), "bom_benchmark"),
+						help = "Where the synthetic workbooks are generated and kept")
+	parser.add_argument("--results", default = RESULTS_FILE, help = "JSON Lines file the results are appended to")
+	parser.add_argument("--threshold", type = float, default = REGRESSION_PCT, help = "Regression threshold in percent")
+	parser.add_argument("--run-case", default = None, help = argparse.SUPPRESS)
+	args = parser.parse_args(argv)
+
+	if args.run_case:
+		print(json.dumps(run_case(json.loads(args.run_case))))
+		return 0
+
+	history = load_history(args.results)
+	commit = git_commit()
+	regressed = False
+	print("Benchmarking commit " + commit)
+	for rows in [int(n) for n in args.rows.split(",") if n.strip()]:
+		case = {"rows": rows, "header_offset": args.header_offset, "blank_gap_every": args.blank_gap_every,
+				"changelog": not args.no_changelog, "added": args.added, "removed": args.removed, "modified": args.modified,
+				"vary_headers": not args.same_headers, "seed": args.seed, "reader": args.reader, "tracemalloc": args.tracemalloc}
+		case["name"] = case_name(case)
+
+		# Workbooks are reused between runs; the seed makes them identical anyway
+		prefix = "synthetic_" + case["name"].rsplit("_", 1)[0]
+		case["bom1"] = os.path.join(args.work_dir, prefix + "_" + str(rows) + "_A.xlsx")
+		case["bom2"] = os.path.join(args.work_dir, prefix + "_" + str(rows) + "_B.xlsx")
+		expected_file = os.path.join(args.work_dir, prefix + "_" + str(rows) + "_expected.json")
+		settings = [args.added, args.removed, args.modified, args.seed, not args.same_headers]
+		expected = None
+		if os.path.isfile(case["bom1"]) and os.path.isfile(case["bom2"]) and os.path.isfile(expected_file):
+			with open(expected_file) as f:
+				saved = json.load(f)
+			if saved.get("settings") == settings:
+				expected = saved["expected"]
+		if expected is None:
+			print("  generating " + str(rows) + " row workbooks...")
+			expected = bom_synth.generate_pair(args.work_dir, rows, args.seed, args.added, args.removed, args.modified,
+												args.header_offset, case["changelog"], args.blank_gap_every,
+												vary_headers = case["vary_headers"], prefix = prefix)[2]
+			with open(expected_file, "w") as f:
+				json.dump({"settings": settings, "expected": expected}, f)
+		case["expected"] = expected
+		case["output"] = os.path.join(args.work_dir, "Comparison_" + case["name"] + ".xlsx")
+
+		best = None
+		for i in range(max(args.repeat, 1)):
+			result = run_case_subprocess(case)
+			if (best is None) or (result["total_seconds"] < best["total_seconds"]):
+				best = result
+
+		record = {"case": case["name"], "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+				"parser_version": compare_bom_xlsx.PARSER_VERSION, "python": platform.python_version(),
+				"machine": platform.machine(), "added_pct": args.added, "removed_pct": args.removed,
+				"modified_pct": args.modified}
+		record.update(best)
+		print_record(record)
+		for what, before, after, change in find_regressions(record, history.get(record["case"]), args.threshold):
+			regressed = True
+			print("    REGRESSION " + what + ": " + str(before) + " -> " + str(after) + " (+" + str(change) + "%) vs "
+				+ str(history[record["case"]].get("commit")))
+		with open(args.results, "a") as f:
+			f.write(json.dumps(record) + "\n")
+
+	print("Results appended to " + args.results)
+	return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+FILE: bom_cache.py
+
+PURPOSE:
+Persistent on-disk cache of parsed (normalized) BOMs.
+
+Entries are keyed by the SHA-256 of the workbook contents plus a parser
+fingerprint, so an unchanged workbook is never parsed twice and a parser
+change can never hand back stale data.  Each entry is one pickle file;
+the least recently used entries are evicted once the cache grows past
+its size limit, and an entry bigger than the per-entry limit is not
+kept at all.
+
+Set COMPARE_BOM_NO_CACHE=1 (or pass enabled=False) to bypass the cache,
+and COMPARE_BOM_CACHE_DIR to move it.
+
+AUTHOR:
+Clinton G.
+
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR	= os.path.join(os.path.expanduser("~"), ".cache", "compare_bom")
+DEFAULT_MAX_BYTES	= 512 * 1024 * 1024
+MAX_ENTRY_BYTES		= 64 * 1024 * 1024
+HASH_CHUNK			= 1024 * 1024
+ENTRY_EXT			= ".bom"
+
+
+def renamed(value, filename):
+	# Entries are keyed by content, so a hit may have been parsed from a
+	# copy under another name.  A parsed table gets the name asked for.
+	if isinstance(value, dict) and ("file" in value):
+		return dict(value, file = os.path.basename(filename))
+	return value
+
+
+def file_digest(filename):
+	# SHA-256 of the file contents, read in chunks
+	h = hashlib.sha256()
+	with open(filename, "rb") as f:
+		chunk = f.read(HASH_CHUNK)
+		while chunk:
+			h.update(chunk)
+			chunk = f.read(HASH_CHUNK)
+	return h.hexdigest()
+
+
+class BomCache:
+
+	def __init__(self, directory = None, max_bytes = DEFAULT_MAX_BYTES, enabled = None, max_entry_bytes = MAX_ENTRY_BYTES):
+		self.directory = directory or os.environ.get("COMPARE_BOM_CACHE_DIR") or DEFAULT_CACHE_DIR
+		self.max_bytes = max_bytes
+		self.max_entry_bytes = max_entry_bytes
+		self.total = None					# Bytes on disk; None until first scanned
+		if enabled is None:
+			enabled = os.environ.get("COMPARE_BOM_NO_CACHE", "") in ("", "0")
+		self.enabled = enabled
+		self.hits = 0
+		self.misses = 0
+
+	def key(self, filename, fingerprint = ""):
+		# Content hash plus parser fingerprint
+		return hashlib.sha256((file_digest(filename) + ":" + str(fingerprint)).encode("utf-8")).hexdigest()
+
+	def _path(self, key):
+		return os.path.join(self.directory, key[:2], key + ENTRY_EXT)
+
+	def get(self, key):
+		# Returns the cached object, or None
+		if not self.enabled:
+			return None
+		path = self._path(key)
+		try:
+			with open(path, "rb") as f:
+				value = pickle.load(f)
+		except FileNotFoundError:
+			self.misses += 1
+			return None
+		except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+			logging.warning("Dropping unreadable cache entry %s: %s", path, e)
+			self._remove(path)
+			self.misses += 1
+			return None
+
+		# Mark the entry as recently used for LRU eviction
+		try:
+			os.utime(path)
+		except OSError:
+			pass
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		if not self.enabled:
+			return
+		path = self._path(key)
+		tmp = None
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok = True)
+			# Write to a temporary file and rename, so concurrent readers
+			# (i.e. batch workers) never see a partial entry
+			fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path), suffix = ".tmp")
+			with os.fdopen(fd, "wb") as f:
+				pickle.dump(value, f, protocol = pickle.HIGHEST_PROTOCOL)
+				size = f.tell()
+			if self.max_entry_bytes and (size > self.max_entry_bytes):
+				logging.info("Not caching %s: %d bytes is over the entry limit", path, size)
+				return
+			try:
+				replaced = os.stat(path).st_size
+			except OSError:
+				replaced = 0
+			os.replace(tmp, path)
+			tmp = None
+		except OSError as e:
+			logging.warning("Could not write cache entry %s: %s", path, e)
+			return
+		finally:
+			# Never leave a partial entry behind, whatever went wrong
+			if tmp is not None:
+				self._remove(tmp)
+		if self.total is not None:
+			self.total += size - replaced
+		self.evict()
+
+	def get_or_parse(self, filename, parse, fingerprint = ""):
+		# Return the cached value for filename, parsing (and caching) on a miss
+		if not self.enabled:
+			return parse(filename)
+		key = self.key(filename, fingerprint)
+		value = self.get(key)
+		if value is None:
+			value = parse(filename)
+			self.put(key, value)
+			return value
+		return renamed(value, filename)
+
+	def entries(self):
+		# (last used, size, path) of every entry
+		found = []
+		if not os.path.isdir(self.directory):
+			return found
+		for (path, dirs, files) in os.walk(self.directory):
+			for name in files:
+				if not name.endswith(ENTRY_EXT):
+					continue
+				full = os.path.join(path, name)
+				try:
+					st = os.stat(full)
+				except OSError:
+					continue
+				found.append((st.st_mtime, st.st_size, full))
+		return found
+
+	def evict(self):
+		# Drop least recently used entries until the cache fits in max_bytes.
+		# The directory is only scanned when the running total says it is
+		# over the limit (or on the first call).
+		if not self.max_bytes:
+			return
+		if (self.total is not None) and (self.total <= self.max_bytes):
+			return
+		entries = self.entries()
+		total = sum(e[1] for e in entries)
+		if total > self.max_bytes:
+			entries.sort()
+			for last_used, size, path in entries:
+				if total <= self.max_bytes:
+					break
+				self._remove(path)
+				total -= size
+		self.total = total
+
+	def clear(self):
+		for last_used, size, path in self.entries():
+			self._remove(path)
+		self.total = 0
+
+	def _remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
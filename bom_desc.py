@@ -0,0 +1,204 @@
+"""
+FILE: bom_desc.py
+
+PURPOSE:
+Description (DES) similarity of matched QPNs.
+
+Descriptions are tokenized and canonicalized first: abbreviations are
+expanded to one spelling (CAPACITOR -> CAP), and component values are
+rewritten in one notation (10k, 10K OHM, 10KΩ -> 10K; 0.1uF, 100nF ->
+100NF; 4K7 -> 4.7K).  A description becomes a small frozenset of
+tokens, and each pair is scored on its two sets (Jaccard index), so the
+cost of a pair only depends on the length of its two descriptions.
+
+Only pairs scoring below the threshold, or whose component values
+differ, are flagged.  The tokens of the descriptions seen are kept in
+the parsed BOM cache (at most MAX_CACHED_DES of them), so later runs
+only tokenize descriptions they haven't met before.  Processes saving
+at the same time (batch workers) merge what they tokenized.
+
+AUTHOR:
+Clinton G.
+
+"""
+import hashlib
+import re
+from collections import OrderedDict
+
+DES_THRESHOLD		= 0.6			# Jaccard index below which a DES pair is flagged
+VOCABULARY_VERSION	= 2				# Bump whenever tokenize() output (or the cached form) changes
+MAX_CACHED_DES		= 200000		# Tokenized descriptions kept between runs
+MAX_TOKEN_SETS		= 50000			# Token sets kept in memory (least recently used go first)
+
+# ----------------------------------------------------------------------- #
+# Canonical spellings -- every key is replaced by its value
+# ----------------------------------------------------------------------- #
+ABBREVIATIONS = {
+	"CAPACITOR":	"CAP",
+	"CAPS":			"CAP",
+	"RESISTOR":		"RES",
+	"RESISTORS":	"RES",
+	"INDUCTOR":		"IND",
+	"CONNECTOR":	"CONN",
+	"CON":			"CONN",
+	"HDR":			"HEADER",
+	"CERAMIC":		"CER",
+	"TANTALUM":		"TANT",
+	"ELECTROLYTIC":	"ELEC",
+	"TRANSISTOR":	"XSTR",
+	"MOSFET":		"FET",
+	"REGULATOR":	"REG",
+	"OSCILLATOR":	"OSC",
+	"CRYSTAL":		"XTAL",
+	"POSITION":		"POS",
+	"POSITIONS":	"POS",
+	"PIN":			"POS",
+	"PINS":			"POS",
+	"SMT":			"SMD",
+	"OHM":			"",				# Resistance is implied by the value
+	"OHMS":			"",
+}
+
+TOKEN_RE	= re.compile(r"[A-Z0-9][A-Z0-9.%/]*")
+VALUE_RE	= re.compile(r"^(\d+(?:\.\d+)?|\.\d+)(MEG|[PNUMKG])?(OHMS?|F|H|V|A|W|HZ)?$")
+RKM_RE		= re.compile(r"^(\d+)([RKMPNU])(\d+)(F|H)?$")			# 4K7, 4R7, 2N2 (IEC 60062)
+PREFIXES	= [(1e-12, "P"), (1e-9, "N"), (1e-6, "U"), (1e-3, "M"), (1.0, ""), (1e3, "K"), (1e6, "MEG"), (1e9, "G")]
+MULTIPLIER	= {"P": 1e-12, "N": 1e-9, "U": 1e-6, "K": 1e3, "MEG": 1e6, "G": 1e9, "R": 1.0, "": 1.0}
+
+
+def format_value(value, unit):
+	# 1e-7, "F" -> "100NF"
+	for scale, prefix in reversed(PREFIXES):
+		if abs(value) >= scale * 0.9999:
+			break
+	mantissa = round(value / scale, 4)
+	if mantissa == int(mantissa):
+		mantissa = int(mantissa)
+	return str(mantissa) + prefix + unit
+
+def canonical_value(token):
+	# Component value in canonical form, or None when the token isn't one.
+	# A bare number (i.e. a package code such as 0402) is not a value.
+	m = VALUE_RE.match(token)
+	if (m is not None) and (m.group(2) or m.group(3)):
+		prefix = m.group(2) or ""
+		unit = m.group(3) or ""
+		if unit.startswith("OHM"):
+			unit = ""
+		if prefix == "M":
+			# M is milli for F/H/V/A/W, but mega for resistances
+			multiplier = 1e-3 if unit else 1e6
+		else:
+			multiplier = MULTIPLIER[prefix]
+		return format_value(float(m.group(1)) * multiplier, unit)
+	m = RKM_RE.match(token)
+	if m is not None:
+		prefix = m.group(2)
+		multiplier = 1e6 if prefix == "M" else MULTIPLIER[prefix]
+		return format_value(float(m.group(1) + "." + m.group(3)) * multiplier, m.group(4) or "")
+	return None
+
+def tokenize(text):
+	# (word tokens, value tokens) of a description, canonicalized
+	# Ohm signs go (resistance is implied by the value), micro signs become U
+	text = text.replace("\u03a9", " ").replace("\u2126", " ").replace("\u00b5", "U").replace("\u03bc", "U").upper()
+	# Keep a value and its unit together: "10 K" -> "10K", "16 V" -> "16V", "10 pin" -> "10POS"
+	text = re.sub(r"(\d)\s+(MEG|[PNUMKG]?(?:F|H|HZ|V|A|W|OHMS?)|[KM])\b", r"\1\2", text)
+	text = re.sub(r"(\d)\s*(?:PIN|POS|POSITION)S?\b", r"\1POS", text)
+	words = []
+	values = []
+	for token in TOKEN_RE.findall(text):
+		token = token.rstrip(".")
+		value = canonical_value(token)
+		if value is not None:
+			values.append(value)
+			continue
+		token = ABBREVIATIONS.get(token, token)
+		if token:
+			words.append(token)
+	return words, values
+
+
+def jaccard(set1, set2):
+	union = len(set1 | set2)
+	return len(set1 & set2) / union if union else 1.0
+
+
+class DescriptionScorer:
+	# cache -- a bom_cache.BomCache to keep the tokens in between runs
+
+	def __init__(self, cache = None, threshold = DES_THRESHOLD):
+		self.cache = cache
+		self.threshold = threshold
+		self.sets = OrderedDict()	# Description -> (all tokens, value tokens) frozensets, least recently used first
+		self.tokens = {}			# Description -> (word tokens, value tokens), oldest first
+		self.changed = False
+		if (cache is not None) and cache.enabled:
+			self.tokens = self.load() or {}
+
+	def cache_key(self):
+		return hashlib.sha256(("description-vocabulary:" + str(VOCABULARY_VERSION)).encode("utf-8")).hexdigest()
+
+	def load(self):
+		saved = self.cache.get(self.cache_key())
+		return saved if isinstance(saved, dict) else None
+
+	def save(self):
+		# Merge with what other processes saved meanwhile, keeping the newest
+		# MAX_CACHED_DES descriptions
+		if (self.cache is None) or (not self.changed):
+			return
+		tokens = self.load() or {}
+		tokens.update(self.tokens)
+		if len(tokens) > MAX_CACHED_DES:
+			tokens = dict(list(tokens.items())[len(tokens) - MAX_CACHED_DES:])
+		self.cache.put(self.cache_key(), tokens)
+		if len(self.tokens) > MAX_CACHED_DES:
+			# A long running process (the comparison service) keeps no more
+			# than it saves
+			self.tokens = tokens
+		self.changed = False
+
+	def token_sets(self, text):
+		sets = self.sets.get(text)
+		if sets is not None:
+			self.sets.move_to_end(text)
+			return sets
+		tokens = self.tokens.get(text)
+		if tokens is None:
+			tokens = tokenize(text)
+			self.tokens[text] = tokens
+			self.changed = True
+		words, values = tokens
+		sets = (frozenset(words + values), frozenset(values))
+		self.sets[text] = sets
+		if len(self.sets) > MAX_TOKEN_SETS:
+			self.sets.popitem(last = False)
+		return sets
+
+	def score(self, text1, text2):
+		if text1 == text2:
+			return 1.0
+		return jaccard(self.token_sets(text1)[0], self.token_sets(text2)[0])
+
+	def flag(self, pairs):
+		# pairs -- (key, DES 1, DES 2).  Returns {key: score} for the pairs
+		# scoring below the threshold or listing different component values.
+		# Identical strings are skipped, and each distinct pair of strings
+		# is only scored once.
+		flagged = {}
+		scored = {}
+		for key, text1, text2 in pairs:
+			if text1 == text2:
+				continue
+			result = scored.get((text1, text2))
+			if result is None:
+				tokens1, values1 = self.token_sets(text1)
+				tokens2, values2 = self.token_sets(text2)
+				score = jaccard(tokens1, tokens2)
+				bad = (score < self.threshold) or (values1 and values2 and values1 != values2)
+				result = round(score, 3) if bad else -1
+				scored[(text1, text2)] = result
+			if result >= 0:
+				flagged[key] = result
+		return flagged
@@ -0,0 +1,447 @@
+"""
+FILE: bom_external.py
+
+PURPOSE:
+Out-of-core comparison, for BOMs too large to hold in memory (i.e.
+flattened top level product BOMs with millions of lines across
+variants).
+
+While a BOM is parsed its rows are kept in memory up to a threshold
+(compare_bom_xlsx.EXTERNAL_ROWS).  A BOM that stays below it becomes an
+ordinary in-memory Bom, so everyday comparisons are unchanged.  Past the
+threshold the rows are sorted by QPN in runs of RUN_ROWS lines and
+spilled to temporary files, and memory stays at about one run however
+long the BOM is.
+
+The comparison is a single merge pass over the sorted runs of both
+BOMs.  The lines of a QPN are aggregated as they go by (as BomTable
+does), matched QPNs are written straight to the result writers (their
+DES scored in batches), and the QPNs only one BOM lists are spilled,
+still sorted, and written after the matched section.  Every section
+comes out in QPN order rather than sheet order.
+
+Fuzzy QPN matching needs every unmatched QPN at once, so it only runs
+while neither BOM has more than FUZZY_MAX_UNMATCHED of them.
+
+AUTHOR:
+Clinton G.
+
+"""
+import heapq
+import logging
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import weakref
+from operator import itemgetter
+
+import compare_bom_xlsx
+from bom_cache import renamed
+from bom_desc import DescriptionScorer
+from bom_fuzzy import FuzzyMatcher
+from bom_levels import TreeFlattener
+from bom_refdes import ref_delta
+from bom_table import NAN, format_quantity, parse_quantities, parse_quantity, quantity_changed, quantity_difference, quantity_unit, same_unit
+from bom_timing import NULL_TIMER, PhaseTimer
+from bom_writers import SECTION_FUZZY, SECTION_MATCH, SECTION_ONLY1, SECTION_ONLY2, delta_value, open_writer
+
+RUN_ROWS			= 200000		# Lines per sorted run spilled to disk
+SPILL_BATCH			= 10000			# Lines per pickle record of a spill file
+DES_BATCH			= 10000			# Matched QPNs whose DES are scored at once
+FUZZY_MAX_UNMATCHED	= 200000
+
+
+# ----------------------------------------------------------------------- #
+# Spill files
+# ----------------------------------------------------------------------- #
+class SpillFile:
+	# Rows pickled in batches to a temporary file, read back lazily in order
+
+	def __init__(self, directory, prefix):
+		fd, self.path = tempfile.mkstemp(dir = directory, prefix = prefix, suffix = ".run")
+		self.file = os.fdopen(fd, "wb")
+		self.batch = []
+		self.count = 0
+
+	def append(self, row):
+		self.batch.append(row)
+		self.count += 1
+		if len(self.batch) >= SPILL_BATCH:
+			self.flush()
+
+	def flush(self):
+		if self.batch:
+			pickle.dump(self.batch, self.file, protocol = pickle.HIGHEST_PROTOCOL)
+			self.batch = []
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+	def __getstate__(self):
+		# A closed spill file travels as its path (worker process -> parent)
+		return {"path": self.path, "file": None, "batch": [], "count": self.count}
+
+	def __iter__(self):
+		with open(self.path, "rb") as f:
+			while True:
+				try:
+					batch = pickle.load(f)
+				except EOFError:
+					return
+				for row in batch:
+					yield row
+
+
+class RunSorter:
+	# parse_bom() row_sink.  Keeps (QPN, DES, REF, QTY) rows in sheet order
+	# until there are more than threshold of them, then writes sorted runs
+	# of (QPN, line, DES, REF, QTY).
+
+	def __init__(self, threshold, run_rows = RUN_ROWS, spill_dir = None):
+		self.threshold = threshold
+		self.run_rows = run_rows
+		self.spill_dir = spill_dir
+		self.rows = []
+		self.lines = 0				# Lines spilled so far
+		self.runs = []
+		self.directory = None		# Spill directory, once spilling
+
+	def __call__(self, row):
+		self.rows.append(row)
+		if len(self.rows) > (self.run_rows if self.runs else self.threshold):
+			self.spill()
+
+	@property
+	def spilled(self):
+		return bool(self.runs)
+
+	def spill(self):
+		if self.directory is None:
+			self.directory = tempfile.mkdtemp(prefix = "compare_bom_", dir = self.spill_dir)
+		for start in range(0, len(self.rows), self.run_rows):
+			chunk = self.rows[start:start + self.run_rows]
+			first = self.lines + start
+			run = [(chunk[i][0], first + i, chunk[i][1], chunk[i][2], chunk[i][3]) for i in range(len(chunk))]
+			run.sort(key = itemgetter(0))			# Stable, so lines of a QPN stay in order
+			spill = SpillFile(self.directory, "run")
+			for row in run:
+				spill.append(row)
+			spill.close()
+			self.runs.append(spill)
+		self.lines += len(self.rows)
+		self.rows = []
+
+	def finish(self):
+		if self.runs and self.rows:
+			self.spill()
+
+
+# ----------------------------------------------------------------------- #
+# BOM held as sorted runs
+# ----------------------------------------------------------------------- #
+def aggregate(lines):
+	# (QPN, (DES, REF, QTY)) of the lines of one QPN, the same way BomTable
+	# aggregates: DES of the first line, distinct references joined,
+	# quantities summed when they are in one base unit
+	qpn, line, des, ref, qty = lines[0]
+	if len(lines) == 1:
+		return qpn, (des, ref, qty)
+	refs = dict.fromkeys(l[3] for l in lines if l[3])
+	total = 0.0 if same_unit(l[4] for l in lines) else NAN
+	for l in lines:
+		total += parse_quantity(l[4])
+	if math.isnan(total):
+		qty = ", ".join(l[4] for l in lines)
+	else:
+		qty = format_quantity(total, quantity_unit(lines[0][4]))
+	return qpn, (des, ",".join(refs), qty)
+
+
+class ExternalBom:
+	# A BOM as runs of (QPN, line, DES, REF, QTY) sorted by QPN and line,
+	# either spill files or lists.  label / source / sheets as on a Bom.
+	# The spill directory is removed by close(), or once the BOM is garbage
+	# collected.  Pickling hands the spill files over to the unpickled copy
+	# (a worker process sending the BOM it parsed to the parent).
+
+	def __init__(self, runs, label, source = "", sheets = None, lines = 0, directory = None):
+		self.runs = runs
+		self.label = label
+		self.source = source
+		self.sheets = sheets or []
+		self.lines = lines
+		self.directory = directory
+		self.cleanup = None
+		self.own_directory()
+
+	def own_directory(self):
+		if self.directory is not None:
+			self.cleanup = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+	def __getstate__(self):
+		if self.cleanup is not None:
+			self.cleanup.detach()
+		state = dict(self.__dict__)
+		state["cleanup"] = None
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.own_directory()
+
+	@classmethod
+	def from_bom(cls, bom):
+		# An in-memory Bom as one sorted run, to compare against a spilled one
+		run = [(row[0], line, row[1], row[2], row[3]) for line, row in enumerate(bom.entries.rows())]
+		run.sort(key = itemgetter(0))
+		return cls([run], bom.label, bom.source, bom.sheets, len(run))
+
+	def groups(self):
+		# The (QPN, line, DES, REF, QTY) lines of each QPN, in QPN order
+		group = []
+		for row in heapq.merge(*self.runs, key = itemgetter(0, 1)):
+			if group and (row[0] != group[0][0]):
+				yield group
+				group = []
+			group.append(row)
+		if group:
+			yield group
+
+	def entries(self):
+		# (QPN, (DES, REF, QTY)) in QPN order
+		for group in self.groups():
+			yield aggregate(group)
+
+	def close(self):
+		# Remove the spill files
+		if self.cleanup is not None:
+			self.cleanup()
+			self.cleanup = None
+		self.directory = None
+
+
+def merge_join(entries1, entries2):
+	# (QPN, entry 1 or None, entry 2 or None) from two QPN ordered streams
+	end = (None, None)
+	key1, entry1 = next(entries1, end)
+	key2, entry2 = next(entries2, end)
+	while (key1 is not None) or (key2 is not None):
+		if (key2 is None) or ((key1 is not None) and (key1 < key2)):
+			yield key1, entry1, None
+			key1, entry1 = next(entries1, end)
+		elif (key1 is None) or (key2 < key1):
+			yield key2, None, entry2
+			key2, entry2 = next(entries2, end)
+		else:
+			yield key1, entry1, entry2
+			key1, entry1 = next(entries1, end)
+			key2, entry2 = next(entries2, end)
+
+
+# ----------------------------------------------------------------------- #
+# Loading and comparing
+# ----------------------------------------------------------------------- #
+def load(filename, label = None, cache = None, classifier = None, reader = None, verbose = False, timer = None,
+		threshold = None, spill_dir = None):
+	# A compare_bom_xlsx.Bom, or an ExternalBom when the file has more than
+	# threshold lines (default compare_bom_xlsx.EXTERNAL_ROWS, 0 = never).
+	# Only in-memory BOMs are put in the parsed BOM cache; a cached table
+	# of more than threshold lines (i.e. cached by an in-memory load) is
+	# spilled like a parsed one.  Multi-level BOMs are rolled up as they
+	# are read, before the rows are sorted.
+	threshold = compare_bom_xlsx.EXTERNAL_ROWS if threshold is None else threshold
+	if not threshold:
+		return compare_bom_xlsx.Bom.load(filename, label, cache, classifier, reader, verbose, timer)
+	timer = timer or NULL_TIMER
+	key = None
+	table = None
+	if (cache is not None) and cache.enabled:
+		key = cache.key(filename, compare_bom_xlsx.parser_fingerprint(classifier))
+		table = cache.get(key)
+		if (table is not None) and (len(table["rows"]) <= threshold):
+			table = compare_bom_xlsx.flatten_table(renamed(table, filename), filename, cache, classifier, reader, timer)
+			with timer.phase("table"):
+				return compare_bom_xlsx.Bom(table, label)
+
+	sorter = RunSorter(threshold, spill_dir = spill_dir)
+	flattener = TreeFlattener(sorter, os.path.dirname(os.path.abspath(filename)),
+							lambda f: compare_bom_xlsx.read_bom_table(f, False, cache, classifier, reader))
+	cached = table is not None
+	if cached:
+		table = renamed(table, filename)
+		with timer.phase("rows"):
+			for row in table["rows"]:
+				flattener(row)
+	else:
+		table = compare_bom_xlsx.parse_bom(filename, verbose, classifier, reader, timer, flattener)
+	flattener.finish()
+	if not sorter.spilled:
+		# Only a multi-level table rolls up to threshold lines or less
+		table["rows"] = sorter.rows
+		if (key is not None) and (not cached) and (not flattener.multilevel):
+			cache.put(key, table)			# The cache holds parse_bom() rows, not rolled-up ones
+		with timer.phase("table"):
+			return compare_bom_xlsx.Bom(table, label)
+
+	with timer.phase("rows"):
+		sorter.finish()
+	logging.info("%s has %d lines, spilled to %d sorted run(s)", filename, sorter.lines, len(sorter.runs))
+	label = label or os.path.splitext(table["file"])[0] or "BOM"
+	return ExternalBom(sorter.runs, label, table["file"], table["sheets"], sorter.lines, sorter.directory)
+
+
+def compare(bom1, bom2, timer = None, fuzzy = None, des_scorer = None, spill_dir = None):
+	# compare_bom_xlsx.compare(), or the out-of-core comparison when either
+	# BOM was too large to hold in memory
+	if isinstance(bom1, ExternalBom) or isinstance(bom2, ExternalBom):
+		return ExternalComparison(bom1, bom2, timer, fuzzy, des_scorer, spill_dir)
+	return compare_bom_xlsx.compare(bom1, bom2, timer, fuzzy, des_scorer)
+
+
+class ExternalComparison:
+	# The interface of compare_bom_xlsx.BomComparison that the command
+	# line tools use (summary, render, print), but nothing is compared
+	# until render(), which runs the merge pass straight into the writers.
+	# summary() has the counts once render() has run.
+
+	def __init__(self, bom1, bom2, timer = None, fuzzy = None, des_scorer = None, spill_dir = None):
+		self.bom1 = bom1 if isinstance(bom1, ExternalBom) else ExternalBom.from_bom(bom1)
+		self.bom2 = bom2 if isinstance(bom2, ExternalBom) else ExternalBom.from_bom(bom2)
+		self.timer = timer or NULL_TIMER
+		self.matcher = (FuzzyMatcher() if fuzzy is True else fuzzy) or None
+		self.scorer = des_scorer or DescriptionScorer()
+		self.spill_dir = spill_dir
+		self.qty_changes_only = False
+		self.counts = None
+
+	def summary(self):
+		counts = self.counts or {}
+		return {"label1": self.bom1.label, "label2": self.bom2.label,
+				"rows1": counts.get("matched", 0) + counts.get("only1", 0), "rows2": counts.get("matched", 0) + counts.get("only2", 0),
+				"matched": counts.get("matched", 0), "only1": counts.get("only1", 0), "only2": counts.get("only2", 0),
+				"fuzzy": counts.get("fuzzy", 0), "des_flagged": counts.get("des_flagged", 0), "qty_changed": counts.get("qty_changed", 0),
+				"lines1": self.bom1.lines, "lines2": self.bom2.lines, "external": True}
+
+	def print(self):
+		# Listing every QPN on the console makes no sense at this size
+		s = self.summary()
+		if self.counts is None:
+			print("Comparing " + s["label1"] + " (" + str(s["lines1"]) + " lines) and " + s["label2"] + " (" + str(s["lines2"])
+				+ " lines) out of core; the sections go straight to the comparison file")
+			return
+		print(str(s["matched"]) + " QPNs matched (" + str(s["des_flagged"]) + " with differing DES, " + str(s["qty_changed"])
+			+ " with a QTY change), " + str(s["only1"]) + " only in "
+			+ s["label1"] + ", " + str(s["only2"]) + " only in " + s["label2"] + (", " + str(s["fuzzy"]) + " fuzzy pairs" if s["fuzzy"] else ""))
+
+	def render(self, filename = compare_bom_xlsx.RESULTS_FILE, qty_changes_only = False):
+		# Run the comparison into one output or a list of them (.xlsx, .csv, .json, .jsonl)
+		self.qty_changes_only = qty_changes_only
+		filenames = [filename] if isinstance(filename, str) else list(filename)
+		logging.info("Creating comparison BOM out of core: %s", ", ".join(filenames))
+		writers = []
+		try:
+			for name in filenames:
+				writers.append(open_writer(name, self.bom1.label, self.bom2.label))
+			self.run(writers)
+		finally:
+			for writer in writers:
+				writer.close()
+
+	def run(self, writers):
+		# The merge pass.  Phases are timed per batch on a local timer, the
+		# merge itself being whatever time is left ("compare").
+		timer = PhaseTimer()
+		start = time.perf_counter()
+		counts = {"matched": 0, "only1": 0, "only2": 0, "fuzzy": 0, "des_flagged": 0, "qty_changed": 0}
+		with tempfile.TemporaryDirectory(prefix = "compare_bom_", dir = self.spill_dir) as directory:
+			only1 = SpillFile(directory, "only1")
+			only2 = SpillFile(directory, "only2")
+			for writer in writers:
+				writer.begin_section(SECTION_MATCH)
+			batch = []
+			for key, entry1, entry2 in merge_join(self.bom1.entries(), self.bom2.entries()):
+				if entry2 is None:
+					only1.append((key, entry1))
+				elif entry1 is None:
+					only2.append((key, entry2))
+				else:
+					batch.append((key, entry1, entry2))
+					if len(batch) >= DES_BATCH:
+						self.write_matches(writers, batch, timer, counts)
+						batch = []
+			self.write_matches(writers, batch, timer, counts)
+			only1.close()
+			only2.close()
+			counts["only1"] = only1.count
+			counts["only2"] = only2.count
+
+			with timer.phase("write"):
+				for writer in writers:
+					writer.begin_section(SECTION_ONLY1)
+				for key, entry in only1:
+					delta = ref_delta(entry, None)
+					for writer in writers:
+						writer.write_row(key, entry, None, delta)
+				for writer in writers:
+					writer.begin_section(SECTION_ONLY2)
+				for key, entry in only2:
+					delta = ref_delta(None, entry)
+					for writer in writers:
+						writer.write_row(key, None, entry, delta)
+
+			if self.matcher is not None:
+				self.write_fuzzy(writers, only1, only2, timer, counts)
+
+		timer.phases["compare"] = max(time.perf_counter() - start - timer.total(), 0.0)
+		self.timer.merge(timer)
+		self.counts = counts
+		self.bom1.close()
+		self.bom2.close()
+
+	def write_matches(self, writers, batch, timer, counts):
+		with timer.phase("describe"):
+			des_flags = self.scorer.flag((key, entry1[0], entry2[0]) for key, entry1, entry2 in batch)
+		with timer.phase("quantity"):
+			qty_deltas = quantity_difference(parse_quantities([entry1[2] for key, entry1, entry2 in batch]),
+											parse_quantities([entry2[2] for key, entry1, entry2 in batch]))
+		counts["matched"] += len(batch)
+		counts["des_flagged"] += len(des_flags)
+		with timer.phase("write"):
+			for (key, entry1, entry2), qty_delta in zip(batch, qty_deltas):
+				if quantity_changed(qty_delta, entry1[2], entry2[2]):
+					counts["qty_changed"] += 1
+				elif self.qty_changes_only:
+					continue
+				delta = ref_delta(entry1, entry2)
+				des_score = des_flags.get(key)
+				for writer in writers:
+					writer.write_row(key, entry1, entry2, delta, des_score = des_score, qty_delta = delta_value(qty_delta))
+
+	def write_fuzzy(self, writers, only1, only2, timer, counts):
+		if max(only1.count, only2.count) > FUZZY_MAX_UNMATCHED:
+			logging.warning("Skipping fuzzy QPN matching: %d / %d unmatched QPNs, more than %d",
+							only1.count, only2.count, FUZZY_MAX_UNMATCHED)
+			return
+		with timer.phase("fuzzy"):
+			pairs = self.matcher.match([key for key, entry in only1], [key for key, entry in only2])
+		if not pairs:
+			return
+		# Only the entries of paired QPNs are read back into memory
+		wanted1 = set(pair[0] for pair in pairs)
+		wanted2 = set(pair[1] for pair in pairs)
+		entries1 = {key: entry for key, entry in only1 if key in wanted1}
+		entries2 = {key: entry for key, entry in only2 if key in wanted2}
+		with timer.phase("write"):
+			for writer in writers:
+				writer.begin_section(SECTION_FUZZY)
+			for key1, key2, score in pairs:
+				entry1 = entries1[key1]
+				entry2 = entries2[key2]
+				delta = ref_delta(entry1, entry2)
+				for writer in writers:
+					writer.write_row(key1, entry1, entry2, delta, key2, score)
+		counts["fuzzy"] = len(pairs)
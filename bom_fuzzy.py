@@ -0,0 +1,140 @@
+"""
+FILE: bom_fuzzy.py
+
+PURPOSE:
+Propose likely pairs among the QPNs that only one of two BOMs lists,
+i.e. "12-3456-01 REV B" vs "12-3456-01" or "0012345" vs "12345".
+
+QPNs are first normalized by a list of regex rules (upper case, drop
+separators, revision suffixes and leading zeros by default).  Equal
+normalized QPNs pair with a score of 1.0.  The rest are looked up in a
+positional 4-gram index of the other BOM's unmatched QPNs (4-gram +
+offset, probed at offsets -1..+1 so a dropped or added character still
+lines up).  Each QPN is only scored against the few QPNs sharing one of
+its 4-grams, instead of against every other QPN, so the work grows
+about linearly with the number of unmatched QPNs.  Scores are the Dice
+coefficient of the trigram sets, and every QPN is paired at most once
+(best scores first).
+
+Extra rules can be loaded from a CSV file, one rule per line:
+
+	name,pattern,replacement
+
+AUTHOR:
+Clinton G.
+
+"""
+import csv
+import re
+
+FUZZY_THRESHOLD	= 0.6				# Pairs scoring below this are not proposed
+NGRAM			= 3					# Scoring grams
+INDEX_GRAM		= 4					# Candidate lookup grams
+MAX_POSTING		= 100				# Grams shared (at one offset) by more QPNs than this are too common to be useful
+RULES_FILE		= "qpn_rules.csv"
+
+# ----------------------------------------------------------------------- #
+# Normalization rules -- (name, pattern, replacement), applied in order
+# to the upper cased QPN
+# ----------------------------------------------------------------------- #
+DEFAULT_RULES = [
+	("revision",		r"[\s_.-]*REV(ISION)?[\s_.-]*[A-Z0-9]{1,2}$",	""),	# "... REV B", "-REV02"
+	("separators",		r"[\s_.\-/]+",									""),
+	("leading zeros",	r"(?<![0-9])0+(?=[0-9])",						""),
+]
+
+
+def load_rules_file(filename, rules = None):
+	# Returns the rule list with the rules of the file added
+	rules = list(DEFAULT_RULES if rules is None else rules)
+	with open(filename, newline = "") as f:
+		for line in csv.reader(f):
+			if (len(line) < 2) or line[0].strip().startswith("#"):
+				continue
+			rules.append((line[0].strip(), line[1].strip(), line[2] if len(line) > 2 else ""))
+	return rules
+
+
+class QpnNormalizer:
+
+	def __init__(self, rules = None):
+		self.rules = [(name, re.compile(pattern), replacement) for name, pattern, replacement in (rules or DEFAULT_RULES)]
+
+	def __call__(self, qpn):
+		text = qpn.upper().strip()
+		for name, pattern, replacement in self.rules:
+			text = pattern.sub(replacement, text)
+		return text
+
+
+def ngrams(text, n = NGRAM):
+	# Character n-grams in order, padded so short QPNs still get some
+	text = "^" + text + "$"
+	if len(text) <= n:
+		return [text]
+	return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class FuzzyMatcher:
+
+	def __init__(self, rules = None, threshold = FUZZY_THRESHOLD, max_posting = MAX_POSTING):
+		self.normalize = QpnNormalizer(rules)
+		self.threshold = threshold
+		self.max_posting = max_posting
+
+	def match(self, qpns1, qpns2):
+		# [(QPN from qpns1, QPN from qpns2, score)], best scores first
+		norm1 = [self.normalize(q) for q in qpns1]
+		norm2 = [self.normalize(q) for q in qpns2]
+		candidates = []
+
+		# Normalized QPNs that are equal pair outright
+		exact = {}
+		for j in range(len(norm2)):
+			exact.setdefault(norm2[j], []).append(j)
+		for i in range(len(norm1)):
+			for j in exact.get(norm1[i], ()):
+				candidates.append((1.0, i, j))
+
+		# Positional index of the second list.  Candidates are found by the
+		# longer (more selective) INDEX_GRAM grams, then scored by trigrams.
+		grams2 = [set(ngrams(text)) for text in norm2]
+		index = {}
+		for j in range(len(norm2)):
+			keys = ngrams(norm2[j], INDEX_GRAM)
+			for pos in range(len(keys)):
+				index.setdefault((pos, keys[pos]), []).append(j)
+
+		t = self.threshold
+		for i in range(len(norm1)):
+			grams1 = set(ngrams(norm1[i]))
+			keys = ngrams(norm1[i], INDEX_GRAM)
+			seen = set()
+			for pos in range(len(keys)):
+				for offset in (-1, 0, 1):
+					posting = index.get((pos + offset, keys[pos]))
+					if (posting is not None) and (len(posting) <= self.max_posting):
+						seen.update(posting)
+			for j in seen:
+				if norm1[i] == norm2[j]:
+					continue						# Already an exact candidate
+				score = 2.0 * len(grams1 & grams2[j]) / (len(grams1) + len(grams2[j]))
+				if score >= t:
+					candidates.append((score, i, j))
+
+		# Greedy one-to-one assignment, best score first (ties in BOM order)
+		candidates.sort(key = lambda c: (-c[0], c[1], c[2]))
+		used1 = set()
+		used2 = set()
+		pairs = []
+		for score, i, j in candidates:
+			if (i in used1) or (j in used2):
+				continue
+			used1.add(i)
+			used2.add(j)
+			pairs.append((qpns1[i], qpns2[j], round(score, 3)))
+		return pairs
+
+
+def fuzzy_pairs(qpns1, qpns2, rules = None, threshold = FUZZY_THRESHOLD):
+	return FuzzyMatcher(rules, threshold).match(list(qpns1), list(qpns2))
@@ -0,0 +1,130 @@
+"""
+FILE: bom_header.py
+
+PURPOSE:
+Locate the QPN / QTY / DES / REF header of a BOM sheet.
+
+All header spellings live in one synonym table.  The table is compiled
+into a single alternation with one named group per field, so any cell
+is classified with a single regex match.  New ERP spellings are added
+to the table (or loaded from a synonym file) rather than as another
+regex pass.
+
+Sheets that can't hold a BOM (i.e. revision or changelog sheets) are
+rejected after the first few rows, without reading the rest of the
+sheet.
+
+AUTHOR:
+Clinton G.
+
+"""
+import csv
+import re
+
+# ----------------------------------------------------------------------- #
+# Synonym table.  Header text has all white space removed before it is
+# matched, and matching ignores case.  Fields are tried in this order.
+# ----------------------------------------------------------------------- #
+HEADER_SYNONYMS = {
+	"QPN":	["QPN", "COMPONENT.?PART"],
+	"DES":	["DES", "DESCRIPTION", "Part.?Description"],
+	"REF":	["REF", "REF.DES", "REFERENCE"],				# IFS BOMs often put this information in the NOTES column
+	"QTY":	["QTY", "QUANTITY", "Qty.{1,20}"],
+	"LEVEL":	["LEVEL", "LVL", "BOM.?LEVEL", "INDENT(?:ED)?(?:.?LEVEL)?"],		# Multi-level BOMs, see bom_levels.py
+	"SUBBOM":	["SUB.?BOM(?:.?FILE)?", "SUB.?ASSEMBLY.?(?:FILE|BOM|WORKBOOK)"],
+	"UOM":	["UOM", "U/M", "UNIT.?OF.?MEASURE", "UNITS?"],				# Unit of the QTY column, see bom_table.py
+}
+
+BOM_HEADER			= ["QPN","QTY","DES","REF","LEVEL","SUBBOM","UOM"]	# The IFS BOM dictates the first four
+OPTIONAL_HEADER		= ["REF","LEVEL","SUBBOM","UOM"]			# Cable drawings etc. don't carry a REF column
+HEADER_SEARCH_ROWS	= 10							# Give up on a sheet if no header in this many rows
+
+default_classifier	= None							# Shared HeaderClassifier, see get_classifier()
+
+
+def add_header_synonym(field, pattern, synonyms = HEADER_SYNONYMS):
+	# Register another spelling for a header field
+	global default_classifier
+	synonyms.setdefault(field.upper(), []).append(pattern)
+	if synonyms is HEADER_SYNONYMS:
+		default_classifier = None			# Recompile the shared classifier on next use
+
+def load_synonym_file(filename, synonyms = HEADER_SYNONYMS):
+	# Each line of the file is: FIELD,pattern  (i.e. "QPN,PART.?NO")
+	with open(filename, newline = "") as f:
+		for line in csv.reader(f):
+			if (len(line) < 2) or line[0].strip().startswith("#"):
+				continue
+			add_header_synonym(line[0].strip(), line[1].strip(), synonyms)
+
+
+class HeaderClassifier:
+
+	def __init__(self, synonyms = None, required = None, optional = None, search_rows = HEADER_SEARCH_ROWS):
+		self.synonyms = HEADER_SYNONYMS if synonyms is None else synonyms
+		self.optional = list(OPTIONAL_HEADER if optional is None else optional)
+		self.fields = list(BOM_HEADER if required is None else required)
+		self.search_rows = search_rows
+		self.compile()
+
+	def compile(self):
+		# One alternation, one named group per field
+		groups = []
+		for field in self.synonyms:
+			groups.append("(?P<%s>%s)" % (field, "|".join("(?:%s)" % p for p in self.synonyms[field])))
+		self._regex = re.compile("|".join(groups), re.IGNORECASE)
+
+	def classify(self, value):
+		# Return the field a header cell belongs to, or None
+		if value is None:
+			return None
+		m = self._regex.fullmatch(str(value).replace(" ",""))
+		if m is None:
+			return None
+		return m.lastgroup
+
+	def find_header(self, rows):
+		# Consume rows from the iterator until the header is found.  Returns
+		# (columns, header_row) where columns maps field -> 1-based column
+		# (0 for a missing optional field), or (missing_fields, None) when the
+		# sheet has no header within the first search_rows rows.
+		# The rest of a row is skipped once every required field is found and
+		# the header cells run out (a blank cell), so optional columns next to
+		# the required ones are still picked up.
+		wanted = set(self.fields)
+		required = wanted.difference(self.optional)
+		r = 0
+		missing = wanted
+		for row in rows:
+			r += 1
+			columns = {}
+			found = 0					# Required fields found so far
+			for c in range(len(row)):
+				value = row[c]
+				if (value is None) or (str(value).strip() == ""):
+					if found == len(required):
+						break			# End of the header, nothing more to look for
+					continue
+				field = self.classify(value)
+				if (field in wanted) and (field not in columns):
+					columns[field] = c + 1
+					if field in required:
+						found += 1
+					if len(columns) == len(wanted):
+						break					# Every column found, no need to look further
+			missing = wanted.difference(columns)
+			if missing.issubset(self.optional):
+				for field in missing:
+					columns[field] = 0
+				return columns, r
+			if r >= self.search_rows:
+				break
+		return sorted(missing), None
+
+
+def get_classifier():
+	# Shared classifier, compiled on first use
+	global default_classifier
+	if default_classifier is None:
+		default_classifier = HeaderClassifier()
+	return default_classifier
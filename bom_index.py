@@ -0,0 +1,469 @@
+"""
+FILE: bom_index.py
+
+PURPOSE:
+Persistent part index.  Parsed BOMs are stored in a SQLite database so
+questions across runs ("which assemblies use this QPN", "when did its
+quantity change") and comparisons of BOMs seen before don't need the
+workbooks to be read again.
+
+Each BOM is stored once per (content hash, assembly, revision): the
+source file, its sheets, every line as read (lines) and every QPN as
+the comparison sees it (parts, aggregated the same way as BomTable).
+Rows go in with executemany() in batches of INSERT_BATCH, one
+transaction per BOM.  parts is indexed on QPN, boms on assembly and
+revision.  Two stored BOMs are compared with joins on parts, straight
+into the usual comparison writers.
+
+BOMs get into the index with the add subcommand below, or with --index
+on compare_bom_xlsx.py / bom_batch.py while they are compared anyway.
+
+Usage:
+	python bom_index.py add PCBA-100_A01.xlsx --assembly PCBA-100 --revision A01
+	python bom_index.py list
+	python bom_index.py query 100-2000-01
+	python bom_index.py compare PCBA-100@A01 PCBA-100@A02 -o Comparison_Results.xlsx
+
+A stored BOM is named by its id (see list), ASSEMBLY@REVISION, an
+assembly (its latest BOM) or a workbook file (matched by content hash).
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import bom_external
+import compare_bom_xlsx
+from bom_cache import file_digest
+from bom_desc import DES_THRESHOLD, DescriptionScorer
+from bom_refdes import ref_delta
+from bom_table import DELTA_DIGITS, NAN, parse_quantity, quantity_changed
+from bom_timing import NULL_TIMER, PhaseTimer
+from bom_writers import SECTION_MATCH, SECTION_ONLY1, SECTION_ONLY2, delta_value, open_writer
+
+INDEX_FILE		= "bom_index.sqlite"
+INSERT_BATCH	= 10000					# Rows per executemany()
+DES_BATCH		= 10000					# Matched QPNs whose DES are scored at once
+BUSY_TIMEOUT	= 60.0					# Seconds to wait for another process writing the index
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boms (
+	id			INTEGER PRIMARY KEY,
+	assembly	TEXT NOT NULL,
+	revision	TEXT NOT NULL DEFAULT '',
+	label		TEXT NOT NULL,
+	source		TEXT NOT NULL,
+	digest		TEXT NOT NULL,
+	modified	TEXT,
+	indexed		TEXT NOT NULL,
+	lines		INTEGER NOT NULL,
+	parts		INTEGER NOT NULL,
+	UNIQUE (digest, assembly, revision)
+);
+CREATE INDEX IF NOT EXISTS boms_assembly ON boms (assembly, revision);
+CREATE TABLE IF NOT EXISTS sheets (
+	bom_id		INTEGER NOT NULL REFERENCES boms (id) ON DELETE CASCADE,
+	position	INTEGER NOT NULL,
+	name		TEXT NOT NULL,
+	data_start	INTEGER,
+	PRIMARY KEY (bom_id, position)
+);
+CREATE TABLE IF NOT EXISTS lines (
+	bom_id		INTEGER NOT NULL REFERENCES boms (id) ON DELETE CASCADE,
+	line		INTEGER NOT NULL,
+	qpn			TEXT NOT NULL,
+	des			TEXT NOT NULL,
+	ref			TEXT NOT NULL,
+	qty			TEXT NOT NULL,
+	PRIMARY KEY (bom_id, line)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS parts (
+	bom_id		INTEGER NOT NULL REFERENCES boms (id) ON DELETE CASCADE,
+	qpn			TEXT NOT NULL,
+	line		INTEGER NOT NULL,
+	des			TEXT NOT NULL,
+	ref			TEXT NOT NULL,
+	qty			TEXT NOT NULL,
+	qty_value	REAL,
+	PRIMARY KEY (bom_id, qpn)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS parts_qpn ON parts (qpn);
+"""
+
+BOM_FIELDS = ["id", "assembly", "revision", "label", "source", "digest", "modified", "indexed", "lines", "parts"]
+
+
+class IndexLookupError(LookupError):
+	pass
+
+
+# -------------------------------------- #
+# Local Methods
+# -------------------------------------- #
+def timestamp(seconds = None):
+	return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(seconds))
+
+def batches(rows, size = INSERT_BATCH):
+	# Lists of up to size rows
+	rows = iter(rows)
+	batch = list(itertools.islice(rows, size))
+	while batch:
+		yield batch
+		batch = list(itertools.islice(rows, size))
+
+def quantity_value(qty):
+	# QTY text -> REAL column, NULL when it isn't a number
+	value = parse_quantity(qty)
+	return None if math.isnan(value) else value
+
+def bom_rows(bom):
+	# (lines, parts) row generators of a compare_bom_xlsx.Bom or an
+	# bom_external.ExternalBom.  Lines are (line, QPN, DES, REF, QTY), parts
+	# (QPN, first line, DES, REF, QTY, QTY value).
+	if isinstance(bom, bom_external.ExternalBom):
+		# Read back from the sorted runs, once for each table
+		def lines():
+			for group in bom.groups():
+				for qpn, line, des, ref, qty in group:
+					yield (line, qpn, des, ref, qty)
+		def parts():
+			for group in bom.groups():
+				qpn, entry = bom_external.aggregate(group)
+				yield (qpn, group[0][1], entry[0], entry[1], entry[2], quantity_value(entry[2]))
+		return lines(), parts()
+	table = bom.entries
+	def lines():
+		for line, row in enumerate(table.rows()):
+			yield (line, row[0], row[1], row[2], row[3])
+	def parts():
+		for qpn, line in table.index.items():
+			entry = table[qpn]
+			yield (qpn, line, entry[0], entry[1], entry[2], quantity_value(entry[2]))
+	return lines(), parts()
+
+
+# ----------------------------------------------------------------------- #
+# The index
+# ----------------------------------------------------------------------- #
+class BomIndex:
+
+	def __init__(self, filename = INDEX_FILE):
+		self.filename = filename
+		self.db = sqlite3.connect(filename, timeout = BUSY_TIMEOUT)
+		self.db.execute("PRAGMA foreign_keys = ON")
+		self.db.execute("PRAGMA journal_mode = WAL")			# Readers don't wait for a batch run adding BOMs
+		self.db.execute("PRAGMA synchronous = NORMAL")
+		self.db.executescript(SCHEMA)
+
+	def close(self):
+		self.db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	# ----------------------------------------------------------------------- #
+	# Adding BOMs
+	# ----------------------------------------------------------------------- #
+	def add(self, bom, filename, assembly = None, revision = "", digest = None):
+		# Store a parsed BOM read from filename.  Returns (id, True), or
+		# (id, False) when the same workbook is already stored for this
+		# assembly and revision.  assembly defaults to the file name.
+		digest = digest or file_digest(filename)
+		assembly = assembly or os.path.splitext(os.path.basename(filename))[0]
+		revision = revision or ""
+		key = (digest, assembly, revision)
+		row = self.db.execute("SELECT id FROM boms WHERE digest = ? AND assembly = ? AND revision = ?", key).fetchone()
+		if row is not None:
+			return row[0], False
+
+		lines, parts = bom_rows(bom)
+		with self.db:
+			# Another process may have stored the same BOM since the check
+			# above; the insert itself decides, inside the write transaction
+			cursor = self.db.execute("INSERT INTO boms (assembly, revision, label, source, digest, modified, indexed, lines, parts)"
+									" VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0) ON CONFLICT (digest, assembly, revision) DO NOTHING",
+									(assembly, revision, bom.label, os.path.basename(filename), digest,
+									timestamp(os.path.getmtime(filename)), timestamp()))
+			if cursor.rowcount == 0:
+				row = self.db.execute("SELECT id FROM boms WHERE digest = ? AND assembly = ? AND revision = ?", key).fetchone()
+				return row[0], False
+			bom_id = cursor.lastrowid
+			self.db.executemany("INSERT INTO sheets (bom_id, position, name, data_start) VALUES (?, ?, ?, ?)",
+								[(bom_id, i, sheet["name"], sheet.get("data_start")) for i, sheet in enumerate(bom.sheets)])
+			line_count = part_count = 0
+			for batch in batches(lines):
+				self.db.executemany("INSERT INTO lines (bom_id, line, qpn, des, ref, qty) VALUES (?, ?, ?, ?, ?, ?)",
+									[(bom_id,) + row for row in batch])
+				line_count += len(batch)
+			for batch in batches(parts):
+				self.db.executemany("INSERT INTO parts (bom_id, qpn, line, des, ref, qty, qty_value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+									[(bom_id,) + row for row in batch])
+				part_count += len(batch)
+			self.db.execute("UPDATE boms SET lines = ?, parts = ? WHERE id = ?", (line_count, part_count, bom_id))
+		logging.info("Indexed %s as %s@%s (id %d, %d lines)", filename, assembly, revision, bom_id, line_count)
+		return bom_id, True
+
+	def remove(self, bom_id):
+		with self.db:
+			self.db.execute("DELETE FROM boms WHERE id = ?", (bom_id,))
+
+	# ----------------------------------------------------------------------- #
+	# Looking things up
+	# ----------------------------------------------------------------------- #
+	def boms(self, assembly = None):
+		# Every stored BOM (of one assembly), as dictionaries
+		sql = "SELECT " + ", ".join(BOM_FIELDS) + " FROM boms"
+		args = ()
+		if assembly:
+			sql += " WHERE assembly = ?"
+			args = (assembly,)
+		return [dict(zip(BOM_FIELDS, row)) for row in self.db.execute(sql + " ORDER BY assembly, modified, id", args)]
+
+	def bom(self, bom_id):
+		row = self.db.execute("SELECT " + ", ".join(BOM_FIELDS) + " FROM boms WHERE id = ?", (bom_id,)).fetchone()
+		if row is None:
+			raise IndexLookupError("No stored BOM with id " + str(bom_id))
+		return dict(zip(BOM_FIELDS, row))
+
+	def resolve(self, name):
+		# Id of the stored BOM called name: an id, ASSEMBLY@REVISION, an
+		# assembly (its latest BOM) or a workbook (by content hash)
+		if str(name).isdigit():
+			return self.bom(int(name))["id"]
+		if os.path.isfile(name):
+			row = self.db.execute("SELECT id FROM boms WHERE digest = ? ORDER BY id DESC", (file_digest(name),)).fetchone()
+		elif "@" in name:
+			assembly, revision = name.rsplit("@", 1)
+			row = self.db.execute("SELECT id FROM boms WHERE assembly = ? AND revision = ? ORDER BY id DESC",
+								(assembly, revision)).fetchone()
+		else:
+			row = self.db.execute("SELECT id FROM boms WHERE assembly = ? ORDER BY modified DESC, id DESC", (name,)).fetchone()
+		if row is None:
+			raise IndexLookupError("No stored BOM matches " + str(name))
+		return row[0]
+
+	def where_used(self, qpn, assembly = None, like = False):
+		# Every stored BOM line of a QPN (a LIKE pattern when like is set),
+		# by assembly and then oldest first: dictionaries of the BOM fields
+		# plus qpn, des, ref, qty
+		sql = ("SELECT " + ", ".join("b." + f for f in BOM_FIELDS) + ", p.qpn, p.des, p.ref, p.qty"
+				" FROM parts p JOIN boms b ON b.id = p.bom_id WHERE p.qpn " + ("LIKE" if like else "=") + " ?")
+		args = [qpn]
+		if assembly:
+			sql += " AND b.assembly = ?"
+			args.append(assembly)
+		sql += " ORDER BY p.qpn, b.assembly, b.modified, b.id"
+		fields = BOM_FIELDS + ["qpn", "des", "ref", "qty"]
+		return [dict(zip(fields, row)) for row in self.db.execute(sql, args)]
+
+	def compare(self, bom_id1, bom_id2, timer = None, des_scorer = None):
+		return IndexedComparison(self, bom_id1, bom_id2, timer, des_scorer)
+
+
+# ----------------------------------------------------------------------- #
+# Comparing two stored BOMs
+# ----------------------------------------------------------------------- #
+MATCH_SQL = ("SELECT a.qpn, a.des, a.ref, a.qty, b.des, b.ref, b.qty, b.qty_value - a.qty_value FROM parts a"
+			" JOIN parts b ON b.bom_id = ? AND b.qpn = a.qpn WHERE a.bom_id = ? ORDER BY a.line")
+ONLY_SQL = ("SELECT a.qpn, a.des, a.ref, a.qty FROM parts a WHERE a.bom_id = ?"
+			" AND NOT EXISTS (SELECT 1 FROM parts b WHERE b.bom_id = ? AND b.qpn = a.qpn) ORDER BY a.line")
+
+
+class IndexedComparison:
+	# The interface of compare_bom_xlsx.BomComparison that the command
+	# line tools use (summary, render, print).  Sections come straight
+	# from joins on the parts table, in sheet order as usual; render()
+	# runs the queries into the writers.  QTY deltas come from the join too
+	# (qty_value), NULL where a QTY isn't a number.  Fuzzy QPN matching
+	# isn't done.
+
+	def __init__(self, index, bom_id1, bom_id2, timer = None, des_scorer = None):
+		self.index = index
+		self.bom1 = index.bom(bom_id1)
+		self.bom2 = index.bom(bom_id2)
+		self.timer = timer or NULL_TIMER
+		self.scorer = des_scorer or DescriptionScorer()
+		self.counts = None
+
+	def label(self, bom):
+		return bom["label"] if bom["label"] else bom["assembly"]
+
+	def summary(self):
+		if self.counts is None:
+			self.count()
+		return {"label1": self.label(self.bom1), "label2": self.label(self.bom2),
+				"rows1": self.bom1["parts"], "rows2": self.bom2["parts"],
+				"matched": self.counts["matched"], "only1": self.counts["only1"], "only2": self.counts["only2"],
+				"fuzzy": 0, "des_flagged": self.counts.get("des_flagged", 0), "qty_changed": self.counts.get("qty_changed", 0)}
+
+	def count(self):
+		with self.timer.phase("compare"):
+			db = self.index.db
+			id1 = self.bom1["id"]
+			id2 = self.bom2["id"]
+			matched = db.execute("SELECT COUNT(*) FROM parts a JOIN parts b ON b.bom_id = ? AND b.qpn = a.qpn WHERE a.bom_id = ?",
+								(id2, id1)).fetchone()[0]
+		self.counts = {"matched": matched, "only1": self.bom1["parts"] - matched, "only2": self.bom2["parts"] - matched}
+
+	def print(self):
+		s = self.summary()
+		print(s["label1"] + " (" + self.bom1["source"] + ") vs " + s["label2"] + " (" + self.bom2["source"] + "): "
+			+ str(s["matched"]) + " QPNs matched, " + str(s["only1"]) + " only in " + s["label1"] + ", "
+			+ str(s["only2"]) + " only in " + s["label2"]
+			+ (", " + str(s["des_flagged"]) + " with differing DES" if s["des_flagged"] else "")
+			+ (", " + str(s["qty_changed"]) + " with a QTY change" if s["qty_changed"] else ""))
+
+	def render(self, filename = compare_bom_xlsx.RESULTS_FILE, qty_changes_only = False):
+		# Write the comparison to one output or a list of them (.xlsx, .csv, .json, .jsonl).
+		# qty_changes_only leaves out the matched QPNs whose QTY is unchanged.
+		filenames = [filename] if isinstance(filename, str) else list(filename)
+		label1 = self.label(self.bom1)
+		label2 = self.label(self.bom2)
+		writers = []
+		try:
+			for name in filenames:
+				writers.append(open_writer(name, label1, label2))
+			self.run(writers, qty_changes_only)
+		finally:
+			for writer in writers:
+				writer.close()
+
+	def run(self, writers, qty_changes_only = False):
+		timer = PhaseTimer()
+		start = time.perf_counter()
+		db = self.index.db
+		id1 = self.bom1["id"]
+		id2 = self.bom2["id"]
+		counts = {"matched": 0, "only1": 0, "only2": 0, "des_flagged": 0, "qty_changed": 0}
+
+		for writer in writers:
+			writer.begin_section(SECTION_MATCH)
+		for batch in batches(db.execute(MATCH_SQL, (id2, id1)), DES_BATCH):
+			with timer.phase("describe"):
+				des_flags = self.scorer.flag((row[0], row[1], row[4]) for row in batch)
+			counts["matched"] += len(batch)
+			counts["des_flagged"] += len(des_flags)
+			with timer.phase("write"):
+				for row in batch:
+					entry1 = row[1:4]
+					entry2 = row[4:7]
+					qty_delta = NAN if row[7] is None else round(row[7], DELTA_DIGITS)
+					if quantity_changed(qty_delta, entry1[2], entry2[2]):
+						counts["qty_changed"] += 1
+					elif qty_changes_only:
+						continue
+					delta = ref_delta(entry1, entry2)
+					for writer in writers:
+						writer.write_row(row[0], entry1, entry2, delta, des_score = des_flags.get(row[0]), qty_delta = delta_value(qty_delta))
+
+		for section, first, second in ((SECTION_ONLY1, id1, id2), (SECTION_ONLY2, id2, id1)):
+			for writer in writers:
+				writer.begin_section(section)
+			with timer.phase("write"):
+				for row in db.execute(ONLY_SQL, (first, second)):
+					entry = row[1:4]
+					entry1, entry2 = (entry, None) if section == SECTION_ONLY1 else (None, entry)
+					delta = ref_delta(entry1, entry2)
+					for writer in writers:
+						writer.write_row(row[0], entry1, entry2, delta)
+					counts[section] += 1
+
+		timer.phases["compare"] = max(time.perf_counter() - start - timer.total(), 0.0)
+		self.timer.merge(timer)
+		self.counts = counts
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def print_table(header, rows):
+	widths = [max([len(str(h))] + [len(str(r[i])) for r in rows]) for i, h in enumerate(header)]
+	print("  ".join(str(h).ljust(w) for h, w in zip(header, widths)))
+	for r in rows:
+		print("  ".join(str(v).ljust(w) for v, w in zip(r, widths)))
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Persistent SQLite index of parsed BOMs.")
+	parser.add_argument("--db", default = INDEX_FILE, help = "Index database (default: " + INDEX_FILE + ")")
+	commands = parser.add_subparsers(dest = "command", required = True)
+
+	add = commands.add_parser("add", help = "Parse BOM workbooks and store them")
+	add.add_argument("files", nargs = "+", help = "BOM workbooks (.xlsx, .csv, .tsv)")
+	add.add_argument("-a", "--assembly", default = None, help = "Assembly (default: the file name)")
+	add.add_argument("-r", "--revision", default = "", help = "Revision (i.e. A02)")
+	add.add_argument("-l", "--label", default = None, help = "Label (default: the file name)")
+	add.add_argument("--synonyms", default = compare_bom_xlsx.SYNONYM_FILE, help = "Extra header synonym file")
+
+	listing = commands.add_parser("list", help = "List the stored BOMs")
+	listing.add_argument("-a", "--assembly", default = None, help = "Only this assembly")
+
+	query = commands.add_parser("query", help = "Show every stored BOM using a QPN, with its quantity")
+	query.add_argument("qpns", nargs = "+", help = "QPNs (SQL LIKE patterns with --like, i.e. 100-2%%)")
+	query.add_argument("-a", "--assembly", default = None, help = "Only this assembly")
+	query.add_argument("--like", action = "store_true", help = "Match QPNs as LIKE patterns")
+
+	compare = commands.add_parser("compare", help = "Compare two stored BOMs")
+	compare.add_argument("bom1", help = "Id, ASSEMBLY@REVISION, assembly or workbook")
+	compare.add_argument("bom2", help = "Id, ASSEMBLY@REVISION, assembly or workbook")
+	compare.add_argument("-o", "--output", action = "append", default = None,
+						help = "Results file, .xlsx, .csv, .json or .jsonl, may be given more than once (default: " + compare_bom_xlsx.RESULTS_FILE + ")")
+	compare.add_argument("--qty-changes-only", action = "store_true", help = "Leave the matched QPNs whose QTY is unchanged out of the results")
+	compare.add_argument("--des-threshold", type = float, default = DES_THRESHOLD, help = "Flag matched QPNs whose DES similarity is below this (0..1)")
+	args = parser.parse_args(argv)
+
+	with BomIndex(args.db) as index:
+		try:
+			if args.command == "add":
+				compare_bom_xlsx.load_header_synonyms(args.synonyms)
+				for filename in args.files:
+					bom = compare_bom_xlsx.Bom.load(filename, args.label)
+					bom_id, added = index.add(bom, filename, args.assembly, args.revision)
+					print(("Stored " if added else "Already stored ") + filename + " as id " + str(bom_id))
+
+			elif args.command == "list":
+				print_table(["ID", "ASSEMBLY", "REVISION", "LABEL", "SOURCE", "MODIFIED", "LINES", "QPNS"],
+							[[b["id"], b["assembly"], b["revision"], b["label"], b["source"], b["modified"], b["lines"], b["parts"]]
+							for b in index.boms(args.assembly)])
+
+			elif args.command == "query":
+				rows = []
+				for qpn in args.qpns:
+					previous = None
+					for hit in index.where_used(qpn, args.assembly, args.like):
+						# Flag the quantity changes between revisions of an assembly
+						key = (hit["qpn"], hit["assembly"])
+						changed = (previous is not None) and (previous[0] == key) and (previous[1] != hit["qty"])
+						rows.append([hit["qpn"], hit["assembly"], hit["revision"], hit["id"], hit["source"], hit["modified"],
+									hit["qty"] + (" (was " + previous[1] + ")" if changed else ""), hit["des"]])
+						previous = (key, hit["qty"])
+				if not rows:
+					print("No stored BOM uses " + ", ".join(args.qpns))
+					return 1
+				print_table(["QPN", "ASSEMBLY", "REVISION", "ID", "SOURCE", "MODIFIED", "QTY", "DES"], rows)
+
+			elif args.command == "compare":
+				comparison = index.compare(index.resolve(args.bom1), index.resolve(args.bom2),
+											des_scorer = DescriptionScorer(threshold = args.des_threshold))
+				outputs = args.output or [compare_bom_xlsx.RESULTS_FILE]
+				comparison.render(outputs, args.qty_changes_only)
+				comparison.print()
+				print("Results written to " + ", ".join(outputs))
+		except IndexLookupError as e:
+			print("**" + str(e))
+			return 2
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
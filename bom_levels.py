@@ -0,0 +1,288 @@
+"""
+FILE: bom_levels.py
+
+PURPOSE:
+Multi-level (indented) BOMs.
+
+Engineering BOMs often list a whole product tree: every line carries a
+LEVEL (1, 2, 3 ... or the ERP spellings ".1", "..2", "1.2.3") and the
+lines under an assembly, one level deeper, are what goes into it.  A
+line can also name a sub-BOM workbook (SUB BOM column) holding the
+contents of that assembly.  Such a BOM is flattened into one rolled-up
+list before it is compared: every line keeps its place, with its QTY
+multiplied up the tree into the extended quantity for one product, and
+BomTable then adds the lines of a QPN used in several assemblies up.
+
+Expansions are memoized.  The contents of an assembly are recorded the
+first time it is listed with lines under it, and every line of the same
+QPN listed on its own (common in ERP exports, which expand a shared
+subassembly once) is expanded from that record, computed only once.
+Lines listed on their own are expanded once the whole sheet is read, so
+the listing with lines under it may come before or after them.  A blank
+LEVEL is the level of the line above.
+Sub-BOM workbooks are flattened once per run and shared between every
+line (and BOM, and thread) that references them; a saved workbook is
+read again.
+
+The flattener is a parse_bom() row sink, so rows are rolled up as they
+are read (see TreeFlattener).  An assembly line without a numeric QTY
+counts as one.
+
+AUTHOR:
+Clinton G.
+
+"""
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from bom_table import format_quantity, parse_quantity, quantity_unit
+
+SUB_BOM_MEMO	= 256						# Sub-BOM workbooks kept flattened
+
+DOTTED_LEVEL_RE		= re.compile(r"^\.+(\d+)$")				# ".1", "..2" (SAP style)
+OUTLINE_LEVEL_RE	= re.compile(r"^\d+(?:\.\d+)+$")		# "1.2.3", one level per number
+MARKER_LEVEL_RE		= re.compile(r"^([.*+>-])\1*$")			# "..", "***", one level per mark
+
+
+class BomTreeError(ValueError):
+	pass
+
+
+def is_multilevel(sheets):
+	# True when any sheet parse_bom() read has a LEVEL or SUB BOM column
+	for sheet in sheets:
+		columns = sheet["columns"]
+		if columns.get("LEVEL") or columns.get("SUBBOM"):
+			return True
+	return False
+
+def parse_level(text):
+	# Depth of a LEVEL cell, None when blank or unreadable
+	text = text.strip()
+	if not text:
+		return None
+	m = DOTTED_LEVEL_RE.match(text)
+	if m is not None:
+		return int(m.group(1))
+	try:
+		value = float(text)
+		if value.is_integer():
+			return int(value)						# Numeric cells can come back as "2.0"
+	except ValueError:
+		pass
+	if OUTLINE_LEVEL_RE.match(text):
+		return text.count(".") + 1
+	m = MARKER_LEVEL_RE.match(text)
+	if m is not None:
+		return len(text)
+	return None
+
+def scale(value, multiplier):
+	# Extended quantity; a non-numeric QTY is kept as it is
+	return value if math.isnan(value) else value * multiplier
+
+
+class Assembly:
+	# A line that may have lines under it, while the flattener is inside it
+
+	__slots__ = ("level", "qpn", "sub_bom", "multiplier", "children")
+
+	def __init__(self, level, qpn, sub_bom, multiplier):
+		self.level = level
+		self.qpn = qpn
+		self.sub_bom = sub_bom
+		self.multiplier = multiplier		# Extended quantity of this line, what its lines are multiplied by
+		self.children = []					# (QPN, DES, REF, QTY value, QTY text, SUB BOM) of the lines under it
+
+
+class TreeFlattener:
+	# parse_bom() row sink.  Takes (QPN, DES, REF, QTY[, LEVEL, SUB BOM])
+	# rows in sheet order and hands rolled-up (QPN, DES, REF, QTY) rows to
+	# sink; rows of single-level sheets go straight through.
+	# directory -- where sub-BOM workbooks named by relative paths are
+	# load -- function reading a sub-BOM workbook: filename -> parse_bom() table
+	# units -- hand (QPN, DES, REF, QTY value, QTY text) items to sink instead,
+	# the quantities as numbers (used for sub-BOM workbooks)
+
+	def __init__(self, sink, directory = ".", load = None, library = None, units = False):
+		self.sink = sink
+		self.directory = directory
+		self.load = load
+		self.library = library or default_library
+		self.units = units
+		self.stack = []				# Assemblies the current line is inside, outermost first
+		self.contents = {}			# Assembly QPN -> the lines first listed under it
+		self.uses = {}				# (QPN, SUB BOM) listed on its own -> [summed multiplier, lines], expanded by finish()
+		self.level = None			# Level of the previous line
+		self.expansions = {}		# Assembly QPN -> its flattened lines for one assembly
+		self.expanding = set()		# Assemblies being expanded, to catch loops
+		self.multilevel = False
+
+	def __call__(self, row):
+		if len(row) == 4:
+			self.close(None)
+			self.level = None
+			if self.units:
+				self.sink((row[0], row[1], row[2], parse_quantity(row[3]), row[3]))
+			else:
+				self.sink(row)
+			return
+		self.multilevel = True
+		qpn, des, ref, qty, level, sub_bom = row
+		level = parse_level(level)
+		if level is None:
+			level = self.level				# Blank (or unreadable): same level as the line above
+		self.level = level
+		self.close(level)
+		value = parse_quantity(qty)
+		if self.stack:
+			parent = self.stack[-1]
+			parent.children.append((qpn, des, ref, value, qty, sub_bom))
+			multiplier = parent.multiplier
+		else:
+			multiplier = 1.0
+		self.line(qpn, des, ref, value, qty, multiplier)
+
+		assembly = Assembly(level, qpn, sub_bom, multiplier * (1.0 if math.isnan(value) else value))
+		if level is None:
+			self.finish_assembly(assembly)			# No level yet: nothing can be listed under it
+		else:
+			self.stack.append(assembly)
+
+	def line(self, qpn, des, ref, value, text, multiplier):
+		if self.units:
+			self.sink((qpn, des, ref, scale(value, multiplier), text))
+		elif (multiplier == 1.0) or math.isnan(value):
+			self.sink((qpn, des, ref, text))
+		else:
+			self.sink((qpn, des, ref, format_quantity(value * multiplier, quantity_unit(text))))
+
+	def close(self, level):
+		# Leave every assembly at or below level (all of them for None)
+		while self.stack and ((level is None) or (self.stack[-1].level >= level)):
+			self.finish_assembly(self.stack.pop())
+
+	def finish_assembly(self, assembly):
+		if assembly.children:
+			self.contents.setdefault(assembly.qpn, assembly.children)
+			return
+		# Listed on its own: expanded by finish(), once every listing with
+		# lines under it is known.  Uses of one assembly are added up.
+		use = self.uses.get((assembly.qpn, assembly.sub_bom))
+		if use is None:
+			self.uses[(assembly.qpn, assembly.sub_bom)] = [assembly.multiplier, 1]
+		else:
+			use[0] += assembly.multiplier
+			use[1] += 1
+
+	def expand_uses(self):
+		# Expand every assembly listed on its own from its listing or its
+		# sub-BOM.  Expansion quantities are per assembly, so the QTY text
+		# doesn't apply; a non-numeric QTY is repeated for every use.
+		uses = self.uses
+		self.uses = {}
+		for (assembly, sub_bom), (multiplier, count) in uses.items():
+			for qpn, des, ref, value, text in self.expansion(assembly, sub_bom) or ():
+				if math.isnan(value):
+					item = (qpn, des, ref, value, text) if self.units else (qpn, des, ref, text)
+					for i in range(count):
+						self.sink(item)
+				elif self.units:
+					self.sink((qpn, des, ref, value * multiplier, text))
+				else:
+					self.sink((qpn, des, ref, format_quantity(value * multiplier, quantity_unit(text))))
+
+	def expansion(self, qpn, sub_bom = ""):
+		# Flattened lines of one qpn assembly (QTY values per assembly), or
+		# None for a part nothing is known to go into
+		expansion = self.expansions.get(qpn)
+		if expansion is not None:
+			return expansion
+		if qpn in self.contents:
+			if qpn in self.expanding:
+				raise BomTreeError("Assembly " + qpn + " contains itself")
+			self.expanding.add(qpn)
+			try:
+				expansion = []
+				for child, des, ref, value, text, child_sub_bom in self.contents[qpn]:
+					expansion.append((child, des, ref, value, text))
+					multiplier = 1.0 if math.isnan(value) else value
+					for item in self.expansion(child, child_sub_bom) or ():
+						expansion.append((item[0], item[1], item[2], scale(item[3], multiplier), item[4]))
+			finally:
+				self.expanding.discard(qpn)
+		elif sub_bom:
+			expansion = self.library.expansion(os.path.join(self.directory, sub_bom), self.load)
+		else:
+			return None
+		self.expansions[qpn] = expansion
+		return expansion
+
+	def finish(self):
+		self.close(None)
+		self.expand_uses()
+
+
+class SubBomLibrary:
+	# Flattened sub-BOM workbooks, by path, modification time and size, so
+	# a workbook referenced from many lines (or BOMs) is read once.  Safe
+	# to share between threads: the memo is locked, and each thread keeps
+	# its own stack of the workbooks it is flattening.
+
+	def __init__(self, size = SUB_BOM_MEMO):
+		self.size = size
+		self.memo = OrderedDict()
+		self.lock = threading.Lock()
+		self.local = threading.local()
+
+	def loading(self):
+		# Workbooks this thread is flattening, to catch loops
+		stack = getattr(self.local, "loading", None)
+		if stack is None:
+			stack = self.local.loading = []
+		return stack
+
+	def expansion(self, filename, load):
+		# (QPN, DES, REF, QTY value, QTY text) lines of one assembly
+		filename = os.path.abspath(filename)
+		try:
+			st = os.stat(filename)
+		except OSError:
+			raise BomTreeError("Sub-BOM workbook not found: " + filename) from None
+		key = (filename, st.st_mtime_ns, st.st_size)
+		with self.lock:
+			expansion = self.memo.get(key)
+			if expansion is not None:
+				self.memo.move_to_end(key)
+				return expansion
+		if load is None:
+			raise BomTreeError("No way to read sub-BOM workbook " + filename)
+		loading = self.loading()
+		if filename in loading:
+			raise BomTreeError("Sub-BOM workbooks reference each other: "
+								+ " -> ".join(os.path.basename(f) for f in loading + [filename]))
+
+		# Read outside the lock: two threads may both read a workbook
+		# neither has flattened yet, and the last one's expansion is kept
+		loading.append(filename)
+		try:
+			logging.info("Reading sub-BOM workbook %s", filename)
+			expansion = []
+			flattener = TreeFlattener(expansion.append, os.path.dirname(filename), load, self, units = True)
+			for row in load(filename)["rows"]:
+				flattener(row)
+			flattener.finish()
+		finally:
+			loading.pop()
+		with self.lock:
+			self.memo[key] = expansion
+			if len(self.memo) > self.size:
+				self.memo.popitem(last = False)
+		return expansion
+
+
+default_library = SubBomLibrary()				# Shared by every BOM read in this process
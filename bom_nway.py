@@ -0,0 +1,258 @@
+"""
+FILE: bom_nway.py
+
+PURPOSE:
+N-way comparison of many revisions of one assembly (i.e. A01 .. A12).
+
+Every BOM is parsed once (in parallel, through the parsed BOM cache) and
+one inverted QPN index is built across all of them: QPN -> the BOMs it
+appears in.  Both outputs are produced from that index in a single pass,
+so the cost grows with the total number of rows rather than with the
+number of BOM pairs:
+
+	Matrix	-- one row per QPN, with its QTY in every BOM (blank = absent)
+	Changes	-- what changed between each pair of neighboring revisions
+			   (QPN added / removed, QTY / DES / REF changed)
+
+Usage:
+	python bom_nway.py A01.xlsx A02.xlsx A03.xlsx -o Nway_Results.xlsx
+	python bom_nway.py revisions_dir --workers 4
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+import bom_batch
+import compare_bom_xlsx
+from bom_refdes import diff_designators, format_refset
+
+RESULTS_FILE	= "Nway_Results.xlsx"
+CHANGE_ADDED	= "added"
+CHANGE_REMOVED	= "removed"
+CHANGE_MODIFIED	= "modified"
+
+CHANGE_FIELDS = ["From", "To", "QPN", "Change", "Fields",
+				"From DES", "To DES", "From REF", "To REF", "From QTY", "To QTY",
+				"REF only in From", "REF only in To"]
+
+
+# -------------------------------------- #
+# Local Methods
+# -------------------------------------- #
+def natural_key(text):
+	# "A2" sorts before "A10"
+	return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", text)]
+
+def find_workbooks(paths):
+	# Files are taken as given; directories contribute their .xlsx (and
+	# .csv / .tsv) files in natural order, skipping earlier results and
+	# Excel lock files
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			names = [n for n in os.listdir(path) if compare_bom_xlsx.is_bom_file(n) and ("Nway" not in n)]
+			files.extend(os.path.join(path, n) for n in sorted(names, key = natural_key))
+		else:
+			files.append(path)
+	return files
+
+
+# ----------------------------------------------------------------------- #
+# Parallel parsing
+# ----------------------------------------------------------------------- #
+def load_boms(files, labels = None, workers = None, synonym_file = None, cache_dir = None, use_cache = True):
+	# Parse every workbook, one per worker process (see bom_batch.load_boms).
+	# Lining up revisions needs every BOM in memory, so none go out of core.
+	labels = labels or [os.path.splitext(os.path.basename(f))[0] for f in files]
+	return bom_batch.load_boms(files, labels, workers, synonym_file, cache_dir, use_cache, external_rows = 0)
+
+
+# ----------------------------------------------------------------------- #
+# N-way comparison
+# ----------------------------------------------------------------------- #
+class MultiBomComparison:
+	# boms -- compare_bom_xlsx.Bom objects, oldest revision first
+
+	def __init__(self, boms):
+		self.boms = list(boms)
+		self.labels = [bom.label for bom in self.boms]
+
+		# Inverted index: QPN -> positions of the BOMs listing it, in the
+		# order QPNs are first seen.  One pass over every BOM.
+		self.index = {}
+		for i in range(len(self.boms)):
+			for qpn in self.boms[i].entries:
+				positions = self.index.get(qpn)
+				if positions is None:
+					self.index[qpn] = [i]
+				else:
+					positions.append(i)
+
+	def matrix(self):
+		# (QPN, DES, [QTY or None per BOM]) for every QPN.  DES is taken
+		# from the newest BOM listing the QPN.
+		n = len(self.boms)
+		for qpn, positions in self.index.items():
+			row = [None] * n
+			for i in positions:
+				row[i] = self.boms[i].entries[qpn][2]
+			yield qpn, self.boms[positions[-1]].entries[qpn][0], row
+
+	def changes(self):
+		# Change records between every pair of neighboring BOMs, grouped
+		# by pair.  Only the BOMs a QPN appears in (and their neighbors)
+		# are looked at, so this is linear in the total number of rows.
+		n = len(self.boms)
+		per_pair = [[] for i in range(max(n - 1, 0))]
+		for qpn, positions in self.index.items():
+			present = set(positions)
+			for i in positions:
+				entry = self.boms[i].entries[qpn]
+				if (i > 0) and ((i - 1) not in present):
+					per_pair[i - 1].append(self.change_record(i - 1, i, qpn, CHANGE_ADDED, None, entry))
+				if i + 1 < n:
+					if (i + 1) not in present:
+						per_pair[i].append(self.change_record(i, i + 1, qpn, CHANGE_REMOVED, entry, None))
+					else:
+						record = self.modification(i, qpn, entry, self.boms[i + 1].entries[qpn])
+						if record is not None:
+							per_pair[i].append(record)
+		for records in per_pair:
+			for record in records:
+				yield record
+
+	def modification(self, i, qpn, entry1, entry2):
+		if entry1 == entry2:
+			return None
+		fields = []
+		only1 = only2 = ""
+		if entry1[0] != entry2[0]:
+			fields.append("DES")
+		if entry1[1] != entry2[1]:
+			refs1, refs2 = diff_designators(entry1[1], entry2[1])
+			if refs1 or refs2:
+				fields.append("REF")
+				only1 = format_refset(refs1)
+				only2 = format_refset(refs2)
+		# "4" and "4.0" are the same quantity; text that isn't a number (NaN) is compared as text
+		if (entry1[2] != entry2[2]) and not (self.boms[i].entries.quantity(qpn) == self.boms[i + 1].entries.quantity(qpn)):
+			fields.append("QTY")
+		if not fields:
+			return None
+		return self.change_record(i, i + 1, qpn, CHANGE_MODIFIED, entry1, entry2, fields, only1, only2)
+
+	def change_record(self, i, j, qpn, change, entry1, entry2, fields = (), only1 = "", only2 = ""):
+		entry1 = entry1 or ("", "", "")
+		entry2 = entry2 or ("", "", "")
+		return {"From": self.labels[i], "To": self.labels[j], "QPN": qpn, "Change": change, "Fields": ",".join(fields),
+				"From DES": entry1[0], "To DES": entry2[0], "From REF": entry1[1], "To REF": entry2[1],
+				"From QTY": entry1[2], "To QTY": entry2[2], "REF only in From": only1, "REF only in To": only2}
+
+	def summary(self):
+		counts = {}
+		for i in range(len(self.labels) - 1):
+			counts[self.labels[i] + " -> " + self.labels[i + 1]] = {CHANGE_ADDED: 0, CHANGE_REMOVED: 0, CHANGE_MODIFIED: 0}
+		for record in self.changes():
+			counts[record["From"] + " -> " + record["To"]][record["Change"]] += 1
+		return {"boms": self.labels, "rows": [len(bom) for bom in self.boms], "qpns": len(self.index), "changes": counts}
+
+	def render(self, filename = RESULTS_FILE):
+		# .xlsx -> Matrix and Changes sheets in one workbook
+		# .csv  -> <name>.csv (matrix) and <name>_changes.csv
+		if filename.lower().endswith(".csv"):
+			self.render_csv(filename)
+		else:
+			self.render_xlsx(filename)
+
+	def matrix_header(self):
+		return ["QPN", "DES"] + self.labels + ["Present In"]
+
+	def matrix_rows(self):
+		n = len(self.boms)
+		for qpn, des, row in self.matrix():
+			yield [qpn, des] + row + [str(sum(1 for qty in row if qty is not None)) + "/" + str(n)]
+
+	def render_xlsx(self, filename):
+		from openpyxl import Workbook
+		from openpyxl.utils import get_column_letter
+
+		book = Workbook(write_only = True)
+		sheet = book.create_sheet("Matrix")
+		sheet.column_dimensions["A"].width = 25
+		sheet.column_dimensions["B"].width = 50
+		for i in range(len(self.labels)):
+			sheet.column_dimensions[get_column_letter(3 + i)].width = 10
+		sheet.append(self.matrix_header())
+		for row in self.matrix_rows():
+			sheet.append(row)
+
+		sheet = book.create_sheet("Changes")
+		for i, width in enumerate([10, 10, 25, 10, 15, 50, 50, 30, 30, 10, 10, 30, 30]):
+			sheet.column_dimensions[get_column_letter(i + 1)].width = width
+		sheet.append(CHANGE_FIELDS)
+		for record in self.changes():
+			sheet.append([record[field] for field in CHANGE_FIELDS])
+		book.save(filename = filename)
+
+	def render_csv(self, filename):
+		with open(filename, "w", newline = "", encoding = "utf-8") as f:
+			writer = csv.writer(f)
+			writer.writerow(self.matrix_header())
+			writer.writerows(self.matrix_rows())
+		with open(os.path.splitext(filename)[0] + "_changes.csv", "w", newline = "", encoding = "utf-8") as f:
+			writer = csv.DictWriter(f, fieldnames = CHANGE_FIELDS)
+			writer.writeheader()
+			writer.writerows(self.changes())
+
+
+def compare_many(boms):
+	return MultiBomComparison(boms)
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Line up many revisions of a BOM (i.e. A01 .. A12).")
+	parser.add_argument("paths", nargs = "+", help = "BOM workbooks, oldest first, or directories of them")
+	parser.add_argument("-l", "--labels", default = None, help = "Comma separated labels (default: file names)")
+	parser.add_argument("-o", "--output", default = RESULTS_FILE, help = "Results file, .xlsx or .csv (default: " + RESULTS_FILE + ")")
+	parser.add_argument("-j", "--workers", type = int, default = 0, help = "Worker processes for parsing (default: one per core)")
+	parser.add_argument("--synonyms", default = compare_bom_xlsx.SYNONYM_FILE, help = "Extra header synonym file")
+	parser.add_argument("--cache-dir", default = None, help = "Parsed BOM cache directory")
+	parser.add_argument("--no-cache", action = "store_true", help = "Always parse workbooks, bypassing the parsed BOM cache")
+	args = parser.parse_args(argv)
+
+	files = find_workbooks(args.paths)
+	labels = [l.strip() for l in args.labels.split(",")] if args.labels else None
+	if len(files) < 2:
+		print("**Need at least two BOM workbooks, found " + str(len(files)))
+		return 2
+	if labels and len(labels) != len(files):
+		print("**" + str(len(labels)) + " labels given for " + str(len(files)) + " workbooks")
+		return 2
+
+	synonym_file = os.path.abspath(args.synonyms) if os.path.isfile(args.synonyms) else None
+	start = time.perf_counter()
+	boms = load_boms(files, labels, args.workers, synonym_file, args.cache_dir, not args.no_cache)
+	comparison = compare_many(boms)
+	comparison.render(args.output)
+
+	summary = comparison.summary()
+	print(str(len(boms)) + " BOMs, " + str(summary["qpns"]) + " distinct QPNs")
+	for pair, counts in summary["changes"].items():
+		print("  " + pair + ": " + str(counts[CHANGE_ADDED]) + " added, " + str(counts[CHANGE_REMOVED]) + " removed, "
+			+ str(counts[CHANGE_MODIFIED]) + " modified")
+	print("Results written to " + args.output + " in " + str(round(time.perf_counter() - start, 1)) + " s")
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
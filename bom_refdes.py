@@ -0,0 +1,223 @@
+"""
+FILE: bom_refdes.py
+
+PURPOSE:
+Reference designator sets.
+
+A REF cell such as "R1-R4, R7 C3" is expanded into one integer bitmap
+per designator prefix ({"R": (1, 0b1001111), "C": (3, 0b1)}), so two
+REF cells are compared with a handful of integer operations no matter
+how many placements they list.  A bitmap starts at the lowest number of
+its prefix, so R100001-R100004 costs no more than R1-R4.  "R1-R4,R7"
+and "R1,R2,R3,R4,R7" are the same set, and the designators only one BOM
+lists are reported per QPN.
+
+Designators that don't look like PREFIX + NUMBER (i.e. "TP_GND", "U1A")
+are kept as plain strings next to the bitmaps.
+
+AUTHOR:
+Clinton G.
+
+"""
+import math
+import re
+from functools import lru_cache
+
+from bom_table import parse_quantity
+
+# ----------------------------------------------------------------------- #
+# Tokens of a REF cell
+# ----------------------------------------------------------------------- #
+SEPARATOR_RE	= re.compile(r"[,;\s]+")
+DESIGNATOR_RE	= re.compile(r"^([A-Za-z_]+)(\d+)$")							# R12
+RANGE_RE		= re.compile(r"^([A-Za-z_]+)(\d+)-([A-Za-z_]*)(\d+)$")			# R1-R4 or R1-4
+RANGE_GAP_RE	= re.compile(r"\s*-\s*")										# "R1 - R4" -> "R1-R4"
+RUN_RE			= re.compile(r"1+")
+MIN_RANGE		= 3							# Runs this long are written as a range (R1-R3), shorter ones listed
+PARSE_CACHE_SIZE	= 65536					# Distinct REF strings kept parsed
+
+
+class RefSet:
+	# Set of reference designators.  bits maps prefix -> (offset, bitmap)
+	# (bit n set = designator <prefix><offset + n>; bit 0 is always set, so
+	# equal sets have equal entries), other holds anything else.
+
+	__slots__ = ("bits", "other")
+
+	def __init__(self, bits = None, other = frozenset()):
+		self.bits = bits or {}
+		self.other = other
+
+	def __len__(self):
+		n = len(self.other)
+		for offset, bitmap in self.bits.values():
+			n += bin(bitmap).count("1")
+		return n
+
+	def __bool__(self):
+		return bool(self.bits) or bool(self.other)
+
+	def __eq__(self, other):
+		return isinstance(other, RefSet) and self.bits == other.bits and self.other == other.other
+
+	def __hash__(self):
+		return hash((frozenset(self.bits.items()), self.other))
+
+	def __sub__(self, other):
+		bits = {}
+		for prefix, entry in self.bits.items():
+			if prefix in other.bits:
+				offset, bitmap, other_bitmap = align(entry, other.bits[prefix])
+				entry = normalize(offset, bitmap & ~other_bitmap)
+			if entry is not None:
+				bits[prefix] = entry
+		return RefSet(bits, self.other - other.other)
+
+	def __or__(self, other):
+		bits = dict(self.bits)
+		for prefix, entry in other.bits.items():
+			if prefix in bits:
+				offset, bitmap, other_bitmap = align(bits[prefix], entry)
+				entry = normalize(offset, bitmap | other_bitmap)
+			bits[prefix] = entry
+		return RefSet(bits, self.other | other.other)
+
+	def __contains__(self, designator):
+		m = DESIGNATOR_RE.match(designator)
+		if m is None:
+			return designator in self.other
+		offset, bitmap = self.bits.get(m.group(1).upper(), (0, 0))
+		n = int(m.group(2)) - offset
+		return (n >= 0) and bool((bitmap >> n) & 1)
+
+	def __str__(self):
+		return format_refset(self)
+
+	def __repr__(self):
+		return "RefSet(" + repr(str(self)) + ")"
+
+
+# -------------------------------------- #
+# Parsing
+# -------------------------------------- #
+def range_bits(first, last):
+	# Bitmap with bits first..last set
+	if first > last:
+		first, last = last, first
+	return ((1 << (last - first + 1)) - 1) << first
+
+def number_bits(numbers, offset = 0):
+	# Bitmap with the given bits (less offset) set, built in one pass over a
+	# byte buffer rather than by or-ing into an ever growing integer
+	buf = bytearray((max(numbers) - offset) // 8 + 1)
+	for n in numbers:
+		n -= offset
+		buf[n >> 3] |= 1 << (n & 7)
+	return int.from_bytes(buf, "little")
+
+def normalize(offset, bitmap):
+	# (offset, bitmap) with the offset moved up to the lowest set bit, or
+	# None for an empty bitmap
+	if not bitmap:
+		return None
+	low = (bitmap & -bitmap).bit_length() - 1
+	return (offset + low, bitmap >> low)
+
+def align(entry1, entry2):
+	# Two (offset, bitmap) entries shifted onto their common lowest offset:
+	# (offset, bitmap 1, bitmap 2)
+	offset = min(entry1[0], entry2[0])
+	return offset, entry1[1] << (entry1[0] - offset), entry2[1] << (entry2[0] - offset)
+
+@lru_cache(maxsize = PARSE_CACHE_SIZE)
+def parse_designators(text):
+	# REF cell -> RefSet.  REF strings repeat a lot (and are interned by
+	# BomTable), so parsed sets are cached.  Treat the result as read-only.
+	singles = {}			# Prefix -> designator numbers listed one by one
+	ranges = {}				# Prefix -> (first, last) of ranges
+	other = set()
+	if not text:
+		return RefSet()
+	for token in SEPARATOR_RE.split(RANGE_GAP_RE.sub("-", text.strip())):
+		if not token:
+			continue
+		m = DESIGNATOR_RE.match(token)
+		if m is not None:
+			singles.setdefault(m.group(1).upper(), []).append(int(m.group(2)))
+			continue
+		m = RANGE_RE.match(token)
+		if (m is not None) and (m.group(3) == "" or m.group(3).upper() == m.group(1).upper()):
+			ranges.setdefault(m.group(1).upper(), []).append(tuple(sorted((int(m.group(2)), int(m.group(4))))))
+			continue
+		other.add(token.upper())
+
+	# Every prefix's bitmap starts at the lowest number it lists
+	bits = {}
+	for prefix in set(singles) | set(ranges):
+		numbers = singles.get(prefix, [])
+		spans = ranges.get(prefix, [])
+		offset = min(numbers + [first for first, last in spans])
+		bitmap = number_bits(numbers, offset) if numbers else 0
+		for first, last in spans:
+			bitmap |= range_bits(first - offset, last - offset)
+		bits[prefix] = (offset, bitmap)
+	return RefSet(bits, frozenset(other))
+
+
+# -------------------------------------- #
+# Formatting
+# -------------------------------------- #
+def format_refset(refs):
+	# Compact text: "C3,R1-R4,R7".  Runs are found with one regex pass over
+	# the bitmap's binary digits instead of testing bit by bit.
+	parts = []
+	for prefix in sorted(refs.bits):
+		offset, bitmap = refs.bits[prefix]
+		digits = bin(bitmap)[:1:-1]						# Least significant bit first
+		for run in RUN_RE.finditer(digits):
+			first, last = run.start() + offset, run.end() - 1 + offset
+			if last - first + 1 >= MIN_RANGE:
+				parts.append(prefix + str(first) + "-" + prefix + str(last))
+			else:
+				parts.extend(prefix + str(n) for n in range(first, last + 1))
+	parts.extend(sorted(refs.other))
+	return ",".join(parts)
+
+
+# ----------------------------------------------------------------------- #
+# Comparing two REF cells
+# ----------------------------------------------------------------------- #
+def diff_designators(ref1, ref2):
+	# (designators only in ref1, designators only in ref2)
+	refs1 = parse_designators(ref1)
+	refs2 = parse_designators(ref2)
+	if refs1 == refs2:
+		return RefSet(), RefSet()
+	return refs1 - refs2, refs2 - refs1
+
+def quantity_check(ref, qty):
+	# Problem description when the number of designators doesn't agree
+	# with QTY, otherwise "".  Lines without REF or a numeric QTY pass.
+	if not ref:
+		return ""
+	value = parse_quantity(qty)
+	if math.isnan(value):
+		return ""
+	count = len(parse_designators(ref))
+	if count == value:
+		return ""
+	return str(count) + " REF vs QTY " + qty
+
+def ref_delta(entry1, entry2):
+	# Designator columns of one comparison row, entries being (DES, REF, QTY)
+	# or None: (only in BOM 1, only in BOM 2, REF/QTY check 1, REF/QTY check 2)
+	only1 = only2 = check1 = check2 = ""
+	if (entry1 is not None) and (entry2 is not None) and (entry1[1] != entry2[1]):
+		refs1, refs2 = diff_designators(entry1[1], entry2[1])
+		only1 = format_refset(refs1)
+		only2 = format_refset(refs2)
+	if entry1 is not None:
+		check1 = quantity_check(entry1[1], entry1[2])
+	if entry2 is not None:
+		check2 = quantity_check(entry2[1], entry2[2])
+	return only1, only2, check1, check2
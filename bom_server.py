@@ -0,0 +1,523 @@
+"""
+FILE: bom_server.py
+
+PURPOSE:
+Small self-hosted HTTP service around the BOM comparison, for internal
+web tooling.  Only the standard library is used.
+
+	POST /boms				upload one workbook or CSV/TSV export (raw body, or multipart field "file")
+							-> {"id": <content hash>, "rows": ..., "lines": ..., "sheets": [...]}
+	GET  /boms/<id>			the same information for an earlier upload
+	POST /compare			compare two workbooks -> JSON (default), xlsx or csv
+	GET  /health			pool, cache and queue counters
+
+/compare takes either a multipart form with the fields bom1 and bom2
+(each an uploaded file, or the id of an earlier upload) and optionally
+label1, label2, format and fuzzy, or a JSON body with the same keys
+(ids only).  ?format=xlsx in the URL works too.
+
+Workbooks are parsed in a bounded pool of worker processes (set up like
+the batch mode workers, so they share the parsed BOM cache on disk), and
+the parsed BOMs are kept in an in-memory LRU keyed by the SHA-256 of the
+upload.  Uploading the same workbook again, or comparing it against
+several others, never parses it twice; concurrent requests for a
+workbook still being parsed wait for that one parse.  At most
+--max-pending requests are handled at once, the rest get 503 with a
+Retry-After header instead of piling up.  Uploads a request is using
+are never evicted from the upload directory under it.  An upload that
+is neither an xlsx workbook (zip) nor plausible text gets 415.
+
+Usage:
+	python bom_server.py --port 8765 --workers 4
+	curl -F bom1=@ENG.xlsx -F bom2=@IFS.xlsx -F label1=ENG -F label2=IFS http://127.0.0.1:8765/compare
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import copy
+import email.parser
+import email.policy
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import bom_batch
+import compare_bom_xlsx
+import delimited_reader
+from bom_cache import BomCache
+from bom_desc import DES_THRESHOLD, DescriptionScorer
+from bom_writers import MemoryComparisonWriter, stream_comparison
+
+HOST			= "127.0.0.1"			# Local only unless asked otherwise
+PORT			= 8765
+LRU_SIZE		= 32					# Parsed BOMs kept in memory
+MAX_UPLOAD_MB	= 64
+MAX_UPLOADS		= 200					# Uploaded workbooks kept on disk
+PARSE_TIMEOUT	= 300					# Seconds
+DIGEST_RE		= re.compile(r"^[0-9a-f]{64}$")
+FORMATS			= {"json": "application/json",
+				"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+				"csv": "text/csv; charset=utf-8"}
+
+
+class ServiceError(Exception):
+
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status = status
+
+
+# -------------------------------------- #
+# Worker process
+# -------------------------------------- #
+def parse_upload(filename):
+	return compare_bom_xlsx.Bom.load(filename, cache = bom_batch.worker_cache)
+
+
+class ParsedBomLru:
+	# Content hash -> parsed Bom, least recently used dropped first
+
+	def __init__(self, size = LRU_SIZE):
+		self.size = size
+		self.items = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, digest):
+		with self.lock:
+			bom = self.items.get(digest)
+			if bom is None:
+				self.misses += 1
+				return None
+			self.items.move_to_end(digest)
+			self.hits += 1
+			return bom
+
+	def put(self, digest, bom):
+		with self.lock:
+			self.items[digest] = bom
+			self.items.move_to_end(digest)
+			while len(self.items) > self.size:
+				self.items.popitem(last = False)
+
+	def __len__(self):
+		return len(self.items)
+
+
+class ComparisonService:
+
+	def __init__(self, workers = None, lru_size = LRU_SIZE, upload_dir = None, max_pending = None, synonym_file = None,
+				cache_dir = None, use_cache = True, des_threshold = DES_THRESHOLD, fuzzy_threshold = None):
+		self.workers = workers or os.cpu_count() or 1
+		self.upload_dir = upload_dir or os.path.join(tempfile.gettempdir(), "compare_bom_uploads")
+		os.makedirs(self.upload_dir, exist_ok = True)
+		self.pool = multiprocessing.Pool(processes = self.workers, initializer = bom_batch.init_worker,
+										initargs = (0, synonym_file, cache_dir, use_cache))
+		self.lru = ParsedBomLru(lru_size)
+		self.inflight = {}				# Content hash -> AsyncResult of a parse under way
+		self.in_use = Counter()			# Content hash -> requests using the upload, see hold()
+		self.lock = threading.Lock()
+		self.slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+		self.max_pending = max_pending or self.workers * 4
+		self.busy = 0
+		self.rejected = 0
+		self.stats_lock = threading.Lock()
+		self.fuzzy_threshold = fuzzy_threshold
+
+		# The DES vocabulary is shared by every comparison, so comparisons
+		# (cheap next to parsing) take turns; rendering does not
+		self.des_scorer = DescriptionScorer(BomCache(cache_dir, enabled = None if use_cache else False), des_threshold)
+		self.compare_lock = threading.Lock()
+
+	def close(self):
+		self.pool.close()
+		self.pool.join()
+		self.des_scorer.save()
+
+	# ----------------------------------------------------------------------- #
+	# Backpressure
+	# ----------------------------------------------------------------------- #
+	def admit(self):
+		# Take a request slot, False (and counted as rejected) when all are taken
+		if not self.slots.acquire(blocking = False):
+			with self.stats_lock:
+				self.rejected += 1
+			return False
+		with self.stats_lock:
+			self.busy += 1
+		return True
+
+	def done(self):
+		with self.stats_lock:
+			self.busy -= 1
+		self.slots.release()
+
+	# ----------------------------------------------------------------------- #
+	# Uploads and parsed BOMs
+	# ----------------------------------------------------------------------- #
+	def hold(self, digests):
+		# Keep uploads from being evicted until release()
+		with self.lock:
+			self.in_use.update(digests)
+
+	def release(self, digests):
+		with self.lock:
+			self.in_use.subtract(digests)
+			for digest in digests:
+				if self.in_use[digest] <= 0:
+					del self.in_use[digest]
+
+	def upload_path(self, digest, ext = None):
+		# Workbooks are kept as .xlsx, anything else as delimited text (.csv)
+		if ext is None:
+			ext = ".csv" if os.path.isfile(os.path.join(self.upload_dir, digest + ".csv")) else ".xlsx"
+		return os.path.join(self.upload_dir, digest + ext)
+
+	def store(self, data):
+		# Save an uploaded workbook under its content hash, returns the hash.
+		# The upload is held (see hold()); the caller releases it when done.
+		if not data:
+			raise ServiceError(400, "Empty upload")
+		# Workbooks are zip files; anything else has to look like a text export
+		if data.startswith(b"PK"):
+			ext = ".xlsx"
+		elif delimited_reader.is_text(data[:delimited_reader.SNIFF_BYTES]):
+			ext = ".csv"
+		else:
+			raise ServiceError(415, "Not an xlsx workbook or a CSV/TSV export")
+		digest = hashlib.sha256(data).hexdigest()
+		self.hold([digest])
+		try:
+			path = self.upload_path(digest, ext)
+			if os.path.isfile(path):
+				os.utime(path)
+				return digest
+			fd, tmp = tempfile.mkstemp(dir = self.upload_dir, suffix = ".tmp")
+			with os.fdopen(fd, "wb") as f:
+				f.write(data)
+			os.replace(tmp, path)
+		except BaseException:
+			self.release([digest])
+			raise
+		self.evict_uploads()
+		return digest
+
+	def evict_uploads(self):
+		# Oldest uploads first, but none a request is using
+		names = [n for n in os.listdir(self.upload_dir) if n.endswith((".xlsx", ".csv"))]
+		if len(names) <= MAX_UPLOADS:
+			return
+		paths = []
+		for name in names:
+			try:
+				paths.append((os.path.getmtime(os.path.join(self.upload_dir, name)), name))
+			except OSError:
+				pass
+		paths.sort()
+		with self.lock:
+			for mtime, name in paths[:len(paths) - MAX_UPLOADS]:
+				digest = os.path.splitext(name)[0]
+				if (digest in self.in_use) or (digest in self.inflight):
+					continue
+				try:
+					os.remove(os.path.join(self.upload_dir, name))
+				except OSError:
+					pass
+
+	def start_parse(self, digest):
+		# The parsed BOM of an upload when it is in the LRU, otherwise the
+		# AsyncResult of its parse (joining a parse already under way)
+		if not DIGEST_RE.match(digest):
+			raise ServiceError(400, "Malformed BOM id " + repr(digest[:80]))
+		bom = self.lru.get(digest)
+		if bom is not None:
+			return bom
+		path = self.upload_path(digest)
+		with self.lock:
+			pending = self.inflight.get(digest)
+			if pending is None:
+				if not os.path.isfile(path):
+					raise ServiceError(404, "Unknown BOM id " + digest)
+				pending = self.pool.apply_async(parse_upload, (path,))
+				self.inflight[digest] = pending
+		return pending
+
+	def finish_parse(self, digest, pending):
+		if isinstance(pending, compare_bom_xlsx.Bom):
+			return pending
+		try:
+			bom = pending.get(PARSE_TIMEOUT)
+		except multiprocessing.TimeoutError:
+			raise ServiceError(504, "Parsing " + digest + " timed out")
+		except Exception as e:
+			raise ServiceError(422, "Could not read the workbook: " + type(e).__name__ + ": " + str(e))
+		finally:
+			self.forget_parse(digest, pending)
+		self.lru.put(digest, bom)
+		return bom
+
+	def forget_parse(self, digest, pending):
+		with self.lock:
+			if (pending is not None) and (self.inflight.get(digest) is pending):
+				del self.inflight[digest]
+
+	def bom(self, digest):
+		self.hold([digest])
+		try:
+			return self.finish_parse(digest, self.start_parse(digest))
+		finally:
+			self.release([digest])
+
+	def info(self, digest):
+		bom = self.bom(digest)
+		return {"id": digest, "rows": len(bom), "lines": bom.entries.line_count(), "sheets": bom.sheets}
+
+	# ----------------------------------------------------------------------- #
+	# Comparison
+	# ----------------------------------------------------------------------- #
+	def compare(self, digest1, digest2, label1 = "BOM1", label2 = "BOM2", fuzzy = False):
+		# Labels name the two sides of the result, so equal ones (i.e. two
+		# uploads of bom.xlsx) are told apart by a suffix
+		label1, label2 = unique_labels(label1, label2)
+		# Both BOMs are parsed side by side on the pool
+		self.hold([digest1, digest2])
+		pending2 = None
+		try:
+			pending1 = self.start_parse(digest1)
+			pending2 = self.start_parse(digest2)
+			bom1 = self.finish_parse(digest1, pending1)
+			bom2 = self.finish_parse(digest2, pending2)
+		finally:
+			self.release([digest1, digest2])
+			# Left unfinished when the first parse failed: a later request
+			# starts its own parse rather than wait on this one forever
+			self.forget_parse(digest2, pending2)
+
+		# The cached BOMs are shared, so the labels go on copies
+		bom1 = copy.copy(bom1)
+		bom1.label = label1
+		bom2 = copy.copy(bom2)
+		bom2.label = label2
+		matcher = compare_bom_xlsx.fuzzy_matcher(self.fuzzy_threshold) if fuzzy else None
+		with self.compare_lock:
+			return compare_bom_xlsx.compare(bom1, bom2, fuzzy = matcher, des_scorer = self.des_scorer)
+
+	def render(self, comparison, fmt):
+		# Response body of a comparison in the given format
+		if fmt == "json":
+			writer = MemoryComparisonWriter(comparison.bom1.label, comparison.bom2.label)
+			stream_comparison([writer], comparison.bom1.entries, comparison.bom2.entries, comparison.output_sections(),
+								comparison.des_flags, comparison.qty_deltas)
+			return json.dumps({"summary": comparison.summary(), "rows": writer.records}).encode("utf-8")
+		fd, tmp = tempfile.mkstemp(dir = self.upload_dir, suffix = "." + fmt)
+		os.close(fd)
+		try:
+			comparison.render(tmp)
+			with open(tmp, "rb") as f:
+				return f.read()
+		finally:
+			os.remove(tmp)
+
+	def stats(self):
+		with self.stats_lock:
+			busy = self.busy
+			rejected = self.rejected
+		return {"workers": self.workers, "busy": busy, "max_pending": self.max_pending, "rejected": rejected,
+				"parsing": len(self.inflight), "lru_size": len(self.lru), "lru_hits": self.lru.hits, "lru_misses": self.lru.misses}
+
+
+def unique_labels(label1, label2):
+	if label1 != label2:
+		return label1, label2
+	return label1 + " (1)", label2 + " (2)"
+
+
+# ----------------------------------------------------------------------- #
+# HTTP
+# ----------------------------------------------------------------------- #
+def parse_multipart(content_type, body):
+	# Form fields -> (file name or None, bytes)
+	message = email.parser.BytesParser(policy = email.policy.HTTP).parsebytes(
+		b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+	if not message.is_multipart():
+		raise ServiceError(400, "Malformed multipart body")
+	fields = {}
+	for part in message.iter_parts():
+		name = part.get_param("name", header = "content-disposition")
+		if name:
+			fields[name] = (part.get_filename(), part.get_payload(decode = True) or b"")
+	return fields
+
+
+class BomRequestHandler(BaseHTTPRequestHandler):
+	server_version = "CompareBOM/1"
+
+	@property
+	def service(self):
+		return self.server.service
+
+	def log_message(self, format, *args):
+		logging.info("%s - %s", self.address_string(), format % args)
+
+	def send_body(self, status, body, content_type = FORMATS["json"], headers = None):
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def send_json(self, status, value, headers = None):
+		self.send_body(status, json.dumps(value).encode("utf-8"), FORMATS["json"], headers)
+
+	def read_body(self):
+		length = int(self.headers.get("Content-Length") or 0)
+		if length > MAX_UPLOAD_MB * 1024 * 1024:
+			raise ServiceError(413, "Upload larger than " + str(MAX_UPLOAD_MB) + " MB")
+		return self.rfile.read(length)
+
+	def handle_request(self, method):
+		# Backpressure: refuse rather than queue once every slot is taken
+		if not self.service.admit():
+			self.send_json(503, {"error": "Busy, try again shortly"}, {"Retry-After": "1"})
+			return
+		self.held = []				# Uploads stored by this request, released at the end
+		try:
+			method(urlparse(self.path))
+		except ServiceError as e:
+			self.send_json(e.status, {"error": str(e)})
+		except Exception as e:
+			logging.exception("Request %s failed", self.path)
+			self.send_json(500, {"error": type(e).__name__ + ": " + str(e)})
+		finally:
+			self.service.release(self.held)
+			self.service.done()
+
+	def do_GET(self):
+		self.handle_request(self.get)
+
+	def do_POST(self):
+		self.handle_request(self.post)
+
+	def get(self, url):
+		parts = url.path.strip("/").split("/")
+		if parts == ["health"]:
+			self.send_json(200, self.service.stats())
+		elif (len(parts) == 2) and (parts[0] == "boms"):
+			self.send_json(200, self.service.info(parts[1]))
+		else:
+			raise ServiceError(404, "No such resource " + url.path)
+
+	def post(self, url):
+		path = url.path.strip("/")
+		query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+		content_type = self.headers.get("Content-Type", "")
+		body = self.read_body()
+		if path == "boms":
+			if content_type.startswith("multipart/"):
+				body = parse_multipart(content_type, body).get("file", (None, b""))[1]
+			digest = self.service.store(body)
+			self.held.append(digest)
+			self.send_json(200, self.service.info(digest))
+		elif path == "compare":
+			self.compare(query, content_type, body)
+		else:
+			raise ServiceError(404, "No such resource " + url.path)
+
+	def compare(self, query, content_type, body):
+		# Fields from the form or JSON body, overridden by the query string
+		options = {}
+		digests = {}
+		if content_type.startswith("multipart/"):
+			for name, (filename, data) in parse_multipart(content_type, body).items():
+				if name in ("bom1", "bom2") and (filename is not None):
+					digests[name] = self.service.store(data)
+					self.held.append(digests[name])
+					options.setdefault("label" + name[-1], os.path.splitext(os.path.basename(filename))[0])
+				else:
+					options[name] = data.decode("utf-8").strip()
+		elif body:
+			try:
+				options = {k: str(v) for k, v in json.loads(body.decode("utf-8")).items()}
+			except (ValueError, AttributeError):
+				raise ServiceError(400, "Body is not a JSON object")
+		options.update(query)
+		for name in ("bom1", "bom2"):
+			if name not in digests:
+				if not options.get(name):
+					raise ServiceError(400, "Missing " + name)
+				digests[name] = options[name]
+
+		fmt = options.get("format", "json").lower()
+		if fmt not in FORMATS:
+			raise ServiceError(400, "Unsupported format " + fmt + ", use one of " + ", ".join(FORMATS))
+		label1 = options.get("label1") or "BOM1"
+		label2 = options.get("label2") or "BOM2"
+		fuzzy = options.get("fuzzy", "").lower() in ("1", "true", "yes", "on")
+		comparison = self.service.compare(digests["bom1"], digests["bom2"], label1, label2, fuzzy)
+		headers = {"X-BOM1-Id": digests["bom1"], "X-BOM2-Id": digests["bom2"]}
+		if fmt != "json":
+			headers["Content-Disposition"] = ("attachment; filename=\"Comparison_" + bom_batch.safe_name(label1) + "_vs_"
+											+ bom_batch.safe_name(label2) + "." + fmt + "\"")
+		self.send_body(200, self.service.render(comparison, fmt), FORMATS[fmt], headers)
+
+
+def make_server(host = HOST, port = PORT, **kwargs):
+	# HTTP server with its ComparisonService (kwargs) attached.  port 0
+	# picks a free port (see server.server_address).
+	server = ThreadingHTTPServer((host, port), BomRequestHandler)
+	server.daemon_threads = True
+	server.service = ComparisonService(**kwargs)
+	return server
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Serve BOM comparisons over HTTP.")
+	parser.add_argument("--host", default = HOST, help = "Address to listen on (default: " + HOST + ")")
+	parser.add_argument("--port", type = int, default = PORT, help = "Port (default: " + str(PORT) + ")")
+	parser.add_argument("-j", "--workers", type = int, default = 0, help = "Parsing worker processes (default: one per core)")
+	parser.add_argument("--max-pending", type = int, default = 0, help = "Requests handled at once before answering 503 (default: 4 per worker)")
+	parser.add_argument("--lru-size", type = int, default = LRU_SIZE, help = "Parsed BOMs kept in memory (default: " + str(LRU_SIZE) + ")")
+	parser.add_argument("--upload-dir", default = None, help = "Where uploaded workbooks are kept")
+	parser.add_argument("--synonyms", default = compare_bom_xlsx.SYNONYM_FILE, help = "Extra header synonym file")
+	parser.add_argument("--cache-dir", default = None, help = "Parsed BOM cache directory")
+	parser.add_argument("--no-cache", action = "store_true", help = "Always parse workbooks, bypassing the parsed BOM cache")
+	parser.add_argument("--fuzzy-threshold", type = float, default = None, help = "Lowest score of a proposed fuzzy pair (0..1)")
+	parser.add_argument("--des-threshold", type = float, default = DES_THRESHOLD, help = "Flag matched QPNs whose DES similarity is below this (0..1)")
+	args = parser.parse_args(argv)
+
+	compare_bom_xlsx.setup_logging()
+	compare_bom_xlsx.load_header_synonyms(args.synonyms)
+	synonym_file = os.path.abspath(args.synonyms) if os.path.isfile(args.synonyms) else None
+	server = make_server(args.host, args.port, workers = args.workers, lru_size = args.lru_size, upload_dir = args.upload_dir,
+						max_pending = args.max_pending, synonym_file = synonym_file, cache_dir = args.cache_dir,
+						use_cache = not args.no_cache, des_threshold = args.des_threshold, fuzzy_threshold = args.fuzzy_threshold)
+	print("Serving BOM comparisons on http://" + args.host + ":" + str(server.server_address[1]) + " (Ctrl+C to stop)")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		server.service.close()
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+FILE: bom_synth.py
+
+PURPOSE:
+Generate realistic synthetic BOM workbooks for benchmarking.
+
+A base BOM of any size is generated, then a revised copy of it with a
+controlled percentage of added, removed and modified QPNs.  Both are
+written as .xlsx files with optional changelog sheets, rows above the
+header, header spelling variants and isolated blank rows in the data,
+or as CSV / TSV exports.
+
+The .xlsx is written directly (zip + XML, shared string table) so that
+even 500k row workbooks are generated in seconds without openpyxl.
+
+Usage:
+	python bom_synth.py out_dir --rows 100000 --added 2 --removed 2 --modified 5
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import csv
+import os
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+# ----------------------------------------------------------------------- #
+# Header spelling variants -- (QPN, DES, REF, QTY), all accepted by bom_header
+# ----------------------------------------------------------------------- #
+HEADER_VARIANTS = [
+	("QPN", "Description", "Reference", "Qty"),
+	("QPN", "DES", "REF", "QTY"),
+	("Component Part", "Part Description", "Ref.Des", "Quantity"),
+	("qpn", "description", "ref", "Qty Per Assy"),
+]
+
+# (designator prefix, description templates, values)
+PART_FAMILIES = [
+	("R", "RES {} 0402 1%", ["10", "100", "1K", "4.7K", "10K", "47K", "100K", "1M"]),
+	("C", "CAP {} 16V X7R 0402", ["100pF", "1nF", "10nF", "0.1uF", "1uF", "10uF"]),
+	("L", "IND {} 0603", ["1uH", "2.2uH", "10uH"]),
+	("D", "DIODE {} SOD-323", ["1N4148", "BAT54", "SMBJ5.0A"]),
+	("U", "IC {} QFN", ["MCU", "LDO 3.3V", "OPAMP", "ADC 12BIT"]),
+	("J", "CONN {} HEADER", ["2POS", "4POS", "10POS"]),
+]
+
+
+# -------------------------------------- #
+# Row generation
+# -------------------------------------- #
+def designators(prefix, start, count, rng):
+	# Either a range (R1-R4) or a comma list (R1,R2,R3), as real BOMs mix both
+	if count == 1:
+		return prefix + str(start)
+	if rng.random() < 0.5:
+		return prefix + str(start) + "-" + prefix + str(start + count - 1)
+	return ",".join(prefix + str(start + i) for i in range(count))
+
+def make_rows(num_rows, rng, first_qpn = 100000):
+	# (QPN, DES, REF, QTY) rows with unique QPNs
+	rows = []
+	next_ref = {}
+	for i in range(num_rows):
+		prefix, template, values = PART_FAMILIES[rng.randrange(len(PART_FAMILIES))]
+		count = rng.choice((1, 1, 1, 2, 2, 4, 8))
+		start = next_ref.get(prefix, 1)
+		next_ref[prefix] = start + count
+		qpn = "Q" + str(first_qpn + i) + "-" + "%02d" % rng.randrange(100)
+		rows.append((qpn, template.format(rng.choice(values)), designators(prefix, start, count, rng), count))
+	return rows
+
+def revise_rows(rows, rng, added_pct = 0.0, removed_pct = 0.0, modified_pct = 0.0):
+	# Copy of rows with QPNs removed, modified (QTY / DES / REF changed) and
+	# added.  Returns (revised rows, expected counts).
+	n = len(rows)
+	removed = set(rng.sample(range(n), int(n * removed_pct / 100.0)))
+	keep = [i for i in range(n) if i not in removed]
+	modified = set(rng.sample(keep, min(len(keep), int(n * modified_pct / 100.0))))
+
+	revised = []
+	for i in keep:
+		qpn, des, ref, qty = rows[i]
+		if i in modified:
+			change = rng.randrange(3)
+			if change == 0:
+				qty = qty + 1
+			elif change == 1:
+				des = des + " REV B"
+			else:
+				ref = ref + ",X" + str(i)
+		revised.append((qpn, des, ref, qty))
+
+	added = make_rows(int(n * added_pct / 100.0), rng, first_qpn = 900000000)
+	for row in added:
+		revised.insert(rng.randrange(len(revised) + 1), row)
+
+	expected = {"rows1": n, "rows2": len(revised), "added": len(added), "removed": len(removed),
+				"modified": len(modified), "matched": n - len(removed)}
+	return revised, expected
+
+
+# ----------------------------------------------------------------------- #
+# Minimal .xlsx writer
+# ----------------------------------------------------------------------- #
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+	'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+	'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+	'<Default Extension="xml" ContentType="application/xml"/>'
+	'<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+	'<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+	'<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+	'{sheets}</Types>')
+SHEET_TYPE = '<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+ROOT_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+	'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+	'<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+	'</Relationships>')
+STYLES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+	'<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+	'<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+	'<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+	'<borders count="1"><border/></borders>'
+	'<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+	'<cellXfs count="1"><xf xfId="0"/></cellXfs>'
+	'</styleSheet>')
+
+def column_letter(col):
+	letters = ""
+	while col:
+		col, rem = divmod(col - 1, 26)
+		letters = chr(65 + rem) + letters
+	return letters
+
+
+class XlsxBuilder:
+	# Writes sheets one row at a time; text goes through a shared string table
+
+	def __init__(self, filename):
+		self.zf = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+		self.sheets = []
+		self.strings = {}
+
+	def _string_index(self, text):
+		index = self.strings.get(text)
+		if index is None:
+			index = len(self.strings)
+			self.strings[text] = index
+		return index
+
+	def add_sheet(self, name, rows, width):
+		# rows -- list of lists (None / "" for empty cells, [] for a blank row)
+		n = len(self.sheets) + 1
+		self.sheets.append(name)
+		with self.zf.open("xl/worksheets/sheet" + str(n) + ".xml", "w") as f:
+			f.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+					'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+					'<dimension ref="A1:' + column_letter(max(width, 1)) + str(max(len(rows), 1)) + '"/>'
+					'<sheetData>').encode("utf-8"))
+			buffered = []
+			for r in range(1, len(rows) + 1):
+				row = rows[r - 1]
+				cells = []
+				for c in range(len(row)):
+					value = row[c]
+					if value is None or value == "":
+						continue
+					ref = column_letter(c + 1) + str(r)
+					if isinstance(value, (int, float)):
+						cells.append('<c r="' + ref + '"><v>' + repr(value) + '</v></c>')
+					else:
+						cells.append('<c r="' + ref + '" t="s"><v>' + str(self._string_index(str(value))) + '</v></c>')
+				if cells:
+					buffered.append('<row r="' + str(r) + '">' + "".join(cells) + '</row>')
+				if len(buffered) >= 1000:
+					f.write("".join(buffered).encode("utf-8"))
+					buffered = []
+			buffered.append('</sheetData></worksheet>')
+			f.write("".join(buffered).encode("utf-8"))
+
+	def close(self):
+		zf = self.zf
+		with zf.open("xl/sharedStrings.xml", "w") as f:
+			f.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+					'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="'
+					+ str(len(self.strings)) + '">').encode("utf-8"))
+			buffered = []
+			for text in self.strings:			# dicts keep insertion (= index) order
+				buffered.append('<si><t xml:space="preserve">' + escape(text) + '</t></si>')
+				if len(buffered) >= 1000:
+					f.write("".join(buffered).encode("utf-8"))
+					buffered = []
+			buffered.append('</sst>')
+			f.write("".join(buffered).encode("utf-8"))
+
+		sheets = "".join('<sheet name="' + escape(self.sheets[i]) + '" sheetId="' + str(i + 1) + '" r:id="rId' + str(i + 1) + '"/>'
+						for i in range(len(self.sheets)))
+		zf.writestr("xl/workbook.xml", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+					'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+					'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+					'<sheets>' + sheets + '</sheets></workbook>')
+		rels = "".join('<Relationship Id="rId' + str(i + 1) + '" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+						'Target="worksheets/sheet' + str(i + 1) + '.xml"/>' for i in range(len(self.sheets)))
+		n = len(self.sheets)
+		rels += ('<Relationship Id="rId' + str(n + 1) + '" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+				'<Relationship Id="rId' + str(n + 2) + '" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>')
+		zf.writestr("xl/_rels/workbook.xml.rels", '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+					'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + rels + '</Relationships>')
+		zf.writestr("xl/styles.xml", STYLES)
+		zf.writestr("_rels/.rels", ROOT_RELS)
+		zf.writestr("[Content_Types].xml", CONTENT_TYPES.format(sheets = "".join(SHEET_TYPE.format(n = i + 1) for i in range(n))))
+		zf.close()
+
+
+def bom_sheet(rows, header = None, header_offset = 0, blank_gap_every = 0):
+	# Cells of the BOM sheet: title rows, header, data and blank gaps
+	header = header or HEADER_VARIANTS[0]
+	sheet = []
+	for i in range(header_offset):
+		sheet.append(["Assembly BOM - synthetic" if i == 0 else ""])
+	sheet.append(["Item", header[0], header[1], "MFG", "MFG PN", header[2], header[3]])
+	for i in range(len(rows)):
+		qpn, des, ref, qty = rows[i]
+		sheet.append([i + 1, qpn, des, "ACME", "AC-" + qpn[1:], ref, qty])
+		if blank_gap_every and ((i + 1) % blank_gap_every == 0):
+			sheet.append([])
+	return sheet
+
+def write_bom_workbook(filename, rows, header = None, header_offset = 0, changelog = True, blank_gap_every = 0):
+	# header_offset -- title rows above the header (the header search only
+	#                  looks at the first 10 rows, so keep this below 9)
+	# blank_gap_every -- put a single blank row after every N data rows
+	sheet = bom_sheet(rows, header, header_offset, blank_gap_every)
+	book = XlsxBuilder(filename)
+	if changelog:
+		book.add_sheet("Revision History", [["Rev", "Date", "Description"], ["A", "2022-01-01", "Initial release"]], 3)
+	book.add_sheet("BOM", sheet, 7)
+	book.close()
+
+def write_bom_delimited(filename, rows, header = None, header_offset = 0, blank_gap_every = 0, encoding = "utf-8"):
+	# The same sheet as an ERP style text export; .tsv files are tab separated
+	delimiter = "\t" if filename.lower().endswith(".tsv") else ","
+	with open(filename, "w", newline = "", encoding = encoding) as f:
+		csv.writer(f, delimiter = delimiter).writerows(bom_sheet(rows, header, header_offset, blank_gap_every))
+
+
+def generate_pair(out_dir, num_rows, seed = 0, added_pct = 1.0, removed_pct = 1.0, modified_pct = 2.0,
+				header_offset = 2, changelog = True, blank_gap_every = 0, vary_headers = True, prefix = "synthetic", fmt = "xlsx"):
+	# Write <prefix>_<rows>_A.<fmt> and <prefix>_<rows>_B.<fmt> (xlsx, csv
+	# or tsv).  Returns (path A, path B, expected counts).
+	rng = random.Random(seed)
+	rows = make_rows(num_rows, rng)
+	revised, expected = revise_rows(rows, rng, added_pct, removed_pct, modified_pct)
+	os.makedirs(out_dir, exist_ok = True)
+	path1 = os.path.join(out_dir, prefix + "_" + str(num_rows) + "_A." + fmt)
+	path2 = os.path.join(out_dir, prefix + "_" + str(num_rows) + "_B." + fmt)
+	header1 = HEADER_VARIANTS[0]
+	header2 = HEADER_VARIANTS[rng.randrange(len(HEADER_VARIANTS))] if vary_headers else header1
+	if fmt == "xlsx":
+		write_bom_workbook(path1, rows, header1, header_offset, changelog, blank_gap_every)
+		write_bom_workbook(path2, revised, header2, header_offset, changelog, blank_gap_every)
+	else:
+		write_bom_delimited(path1, rows, header1, header_offset, blank_gap_every)
+		write_bom_delimited(path2, revised, header2, header_offset, blank_gap_every)
+	return path1, path2, expected
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Generate a pair of synthetic BOM workbooks.")
+	parser.add_argument("out_dir")
+	parser.add_argument("--rows", type = int, default = 10000)
+	parser.add_argument("--seed", type = int, default = 0)
+	parser.add_argument("--added", type = float, default = 1.0, help = "Percent of QPNs added in the revised BOM")
+	parser.add_argument("--removed", type = float, default = 1.0, help = "Percent of QPNs removed in the revised BOM")
+	parser.add_argument("--modified", type = float, default = 2.0, help = "Percent of QPNs modified in the revised BOM")
+	parser.add_argument("--header-offset", type = int, default = 2, help = "Title rows above the header")
+	parser.add_argument("--blank-gap-every", type = int, default = 0, help = "Blank row after every N data rows")
+	parser.add_argument("--no-changelog", action = "store_true")
+	parser.add_argument("--same-headers", action = "store_true", help = "Use the same header spelling in both workbooks")
+	parser.add_argument("--format", choices = ["xlsx", "csv", "tsv"], default = "xlsx")
+	args = parser.parse_args(argv)
+
+	path1, path2, expected = generate_pair(args.out_dir, args.rows, args.seed, args.added, args.removed, args.modified,
+											args.header_offset, not args.no_changelog, args.blank_gap_every, not args.same_headers,
+											fmt = args.format)
+	print(path1)
+	print(path2)
+	print(expected)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,296 @@
+"""
+FILE: bom_table.py
+
+PURPOSE:
+Compact, column-oriented storage for one BOM.
+
+Each column (QPN, DES, REF, QTY) is its own list, with QPN/DES/REF
+strings interned so repeated values are stored once, and quantities kept
+as doubles in an array.  A QPN -> row index gives constant time lookups,
+and QPNs listed on more than one line keep every line: the duplicates
+are aggregated (quantities summed, references joined) instead of the
+last line silently replacing the others.
+
+BomTable behaves like a read-only dictionary of QPN -> (DES, REF, QTY),
+which is what the comparison and the writers expect.
+
+AUTHOR:
+Clinton G.
+
+"""
+import math
+import operator
+import re
+import sys
+from array import array
+from collections.abc import Mapping
+from itertools import compress, count, repeat
+
+NAN = float("nan")
+DELTA_DIGITS	= 9					# QTY deltas are rounded to this many decimals (no 0.30000000000000004)
+
+# Number with an optional unit of measure: "2", "2.0", "1,000", "2 EA", "500mm"
+QUANTITY_RE = re.compile(r"^([-+]?(?:\d{1,3}(?:,\d{3})+|\d*)(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*([A-Za-z]+)?\.?$")
+
+UNIT_FACTORS = {					# Unit -> (base unit, factor); any other unit (EA, PCS, REEL, ...) counts pieces
+	"MM":	("M", 0.001),
+	"CM":	("M", 0.01),
+	"M":	("M", 1.0),
+	"MTR":	("M", 1.0),
+	"IN":	("M", 0.0254),
+	"FT":	("M", 0.3048),
+	"YD":	("M", 0.9144),
+	"MG":	("KG", 0.000001),
+	"G":	("KG", 0.001),
+	"GR":	("KG", 0.001),
+	"KG":	("KG", 1.0),
+	"OZ":	("KG", 0.028349523125),
+	"LB":	("KG", 0.45359237),
+	"LBS":	("KG", 0.45359237),
+	"ML":	("L", 0.001),
+	"L":	("L", 1.0),
+	"LTR":	("L", 1.0),
+}
+
+
+def parse_unit(text):
+	# (number text, unit) of a QTY string, None when it isn't a quantity
+	m = QUANTITY_RE.match(text.strip())
+	if m is None or not any(c.isdigit() for c in m.group(1)):
+		return None
+	return m.group(1).replace(",", ""), (m.group(2) or "").upper()
+
+def parse_quantity(text):
+	# Numeric value of a cleaned QTY string in its base unit (see
+	# UNIT_FACTORS), NaN when it isn't a number.  Unknown units count as
+	# pieces.  Only QUANTITY_RE numbers are taken: not float()'s "nan",
+	# "inf" or "1_000", nor values too large for a double.
+	if not isinstance(text, str):
+		return NAN
+	parsed = parse_unit(text)
+	if parsed is None:
+		return NAN
+	number, unit = parsed
+	try:
+		value = float(number)
+	except ValueError:
+		return NAN
+	if not math.isfinite(value):
+		return NAN
+	if unit in UNIT_FACTORS:
+		return value * UNIT_FACTORS[unit][1]
+	return value
+
+def parse_quantities(texts):
+	# parse_quantity() of a whole QTY column at once, as an array of
+	# doubles.  A BOM has few distinct QTY texts, so each is parsed once.
+	values = {text: parse_quantity(text) for text in set(texts)}
+	return array("d", map(values.__getitem__, texts))
+
+def quantity_unit(text):
+	# Base unit a QTY string is measured in ("M", "KG", "L"), "" for pieces
+	parsed = parse_unit(text) if isinstance(text, str) else None
+	if parsed is None or parsed[1] not in UNIT_FACTORS:
+		return ""
+	return UNIT_FACTORS[parsed[1]][0]
+
+def same_unit(texts):
+	# Whether the QTY strings of several lines are all in one base unit, so
+	# their quantities can be summed
+	units = set(map(quantity_unit, texts))
+	return len(units) <= 1
+
+def attach_unit(qty, uom):
+	# QTY text with the unit of a separate UOM column, unless it has its own
+	if uom and qty:
+		parsed = parse_unit(qty)
+		if (parsed is not None) and not parsed[1]:
+			return qty + " " + uom
+	return qty
+
+def format_quantity(value, unit = ""):
+	# 4.0 -> "4", 2.5 -> "2.5", NaN -> "", (1.5, "M") -> "1.5 M"
+	if math.isnan(value):
+		return ""
+	if value == int(value):
+		text = str(int(value))
+	else:
+		text = format(value, "g")
+	return text + " " + unit if unit else text
+
+def quantity_changed(delta, qty1, qty2):
+	# Whether a matched QPN's quantity changed: by the delta when both QTYs
+	# are numbers, by the QTY texts otherwise
+	if math.isnan(delta):
+		return qty1 != qty2
+	return delta != 0.0
+
+def quantity_totals(table, keys):
+	# Total quantity of every QPN in keys, as an array
+	if isinstance(table, BomTable):
+		return table.totals(keys)
+	return parse_quantities([table[key][2] for key in keys])
+
+def quantity_difference(values1, values2):
+	# values2 - values1 element by element, as an array
+	return array("d", map(round, map(operator.sub, values2, values1), repeat(DELTA_DIGITS)))
+
+def quantity_deltas(table1, table2, keys):
+	# QTY in table2 minus QTY in table1 for every (matched) QPN in keys, as
+	# one array; NaN where either QTY isn't a number
+	return quantity_difference(quantity_totals(table1, keys), quantity_totals(table2, keys))
+
+
+class BomTable(Mapping):
+
+	__slots__ = ("qpn", "des", "ref", "qty", "qty_text", "index", "dups")
+
+	def __init__(self):
+		self.qpn = []			# Interned QPN of every line, in sheet order
+		self.des = []
+		self.ref = []
+		self.qty = array("d")	# Quantity of every line, NaN when not numeric
+		self.qty_text = {}		# Line -> QTY text, only where the number doesn't print back the same
+		self.index = {}			# QPN -> first line
+		self.dups = {}			# QPN -> every line, only for QPNs listed more than once
+
+	@classmethod
+	def from_rows(cls, rows):
+		table = cls()
+		table.extend(rows)
+		return table
+
+	def append(self, qpn, des, ref, qty):
+		intern = sys.intern
+		line = len(self.qpn)
+		qpn = intern(qpn)
+		self.qpn.append(qpn)
+		self.des.append(intern(des))
+		self.ref.append(intern(ref))
+		value = parse_quantity(qty)
+		self.qty.append(value)
+		if format_quantity(value) != qty:
+			self.qty_text[line] = qty
+
+		first = self.index.get(qpn)
+		if first is None:
+			self.index[qpn] = line
+		elif qpn in self.dups:
+			self.dups[qpn].append(line)
+		else:
+			self.dups[qpn] = [first, line]
+
+	def extend(self, rows):
+		# append() every (QPN, DES, REF, QTY) row, the QTY column parsed in
+		# one batch
+		rows = rows if isinstance(rows, list) else list(rows)
+		intern = sys.intern
+		start = len(self.qpn)
+		texts = [row[3] for row in rows]
+		self.qty.extend(parse_quantities(texts))
+		self.des.extend([intern(row[1]) for row in rows])
+		self.ref.extend([intern(row[2]) for row in rows])
+		exact = {text: format_quantity(parse_quantity(text)) == text for text in set(texts)}
+		for line in compress(count(start), map(operator.not_, map(exact.__getitem__, texts))):
+			self.qty_text[line] = texts[line - start]
+
+		qpns = self.qpn
+		index = self.index
+		dups = self.dups
+		for line, row in enumerate(rows, start):
+			qpn = intern(row[0])
+			qpns.append(qpn)
+			first = index.get(qpn)
+			if first is None:
+				index[qpn] = line
+			elif qpn in dups:
+				dups[qpn].append(line)
+			else:
+				dups[qpn] = [first, line]
+
+	# ----------------------------------------------------------------------- #
+	# Line access
+	# ----------------------------------------------------------------------- #
+	def lines(self, qpn):
+		# Every line the QPN appears on
+		if qpn in self.dups:
+			return self.dups[qpn]
+		return [self.index[qpn]]
+
+	def quantity_text(self, line):
+		text = self.qty_text.get(line)
+		return format_quantity(self.qty[line]) if text is None else text
+
+	def row(self, line):
+		return (self.qpn[line], self.des[line], self.ref[line], self.quantity_text(line))
+
+	def rows(self):
+		for line in range(len(self.qpn)):
+			yield self.row(line)
+
+	def line_count(self):
+		return len(self.qpn)
+
+	def quantity(self, qpn):
+		# Total numeric quantity of a QPN over all of its lines, NaN when
+		# they are in different base units (i.e. "500mm" and "2 EA")
+		lines = self.lines(qpn)
+		if (len(lines) > 1) and not same_unit(map(self.quantity_text, lines)):
+			return NAN
+		total = 0.0
+		for line in lines:
+			total += self.qty[line]
+		return total
+
+	def totals(self, keys):
+		# quantity() of every QPN in keys, as an array: one line per QPN is a
+		# straight gather from the QTY column, only duplicates are summed
+		qty = self.qty
+		totals = array("d", map(qty.__getitem__, map(self.index.__getitem__, keys)))
+		if self.dups:
+			for i in compress(count(), map(self.dups.__contains__, keys)):
+				totals[i] = self.quantity(keys[i])
+		return totals
+
+	def duplicates(self):
+		# QPN -> number of lines, for QPNs listed more than once
+		return {qpn: len(lines) for qpn, lines in self.dups.items()}
+
+	# ----------------------------------------------------------------------- #
+	# Mapping of QPN -> (DES, REF, QTY)
+	# ----------------------------------------------------------------------- #
+	def __getitem__(self, qpn):
+		line = self.index[qpn]
+		if qpn not in self.dups:
+			return (self.des[line], self.ref[line], self.quantity_text(line))
+
+		# Aggregate a QPN listed on several lines.  A REF repeated on several
+		# lines (a subassembly used twice) is listed once.
+		lines = self.dups[qpn]
+		refs = dict.fromkeys(self.ref[l] for l in lines if self.ref[l])
+		total = self.quantity(qpn)
+		if math.isnan(total):
+			qty = ", ".join(self.quantity_text(l) for l in lines)
+		else:
+			qty = format_quantity(total, quantity_unit(self.quantity_text(line)))
+		return (self.des[line], ",".join(refs), qty)
+
+	def __contains__(self, qpn):
+		return qpn in self.index
+
+	def __iter__(self):
+		return iter(self.index)
+
+	def __len__(self):
+		return len(self.index)
+
+	def keys(self):
+		# A dict view, so set operations between two BOMs stay in C
+		return self.index.keys()
+
+	def __getstate__(self):
+		return {name: getattr(self, name) for name in self.__slots__}
+
+	def __setstate__(self, state):
+		for name in self.__slots__:
+			setattr(self, name, state[name])
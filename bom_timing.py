@@ -0,0 +1,175 @@
+"""
+FILE: bom_timing.py
+
+PURPOSE:
+Per-phase wall clock timing.  parse_bom() and the comparison report
+their phases (open, header, rows, table, compare, write) to a PhaseTimer
+when one is passed in; otherwise the no-op NULL_TIMER is used and nothing
+is measured.
+
+run_report() / format_report() turn a timer into the end-of-run report
+(wall time per phase, rows per second, sheets read and skipped), and
+RunProfiler optionally wraps a run in cProfile and/or tracemalloc.  Both
+cost nothing unless asked for.
+
+AUTHOR:
+Clinton G.
+
+"""
+import json
+import time
+import types
+from contextlib import contextmanager, nullcontext
+
+
+class PhaseTimer:
+
+	def __init__(self):
+		self.phases = {}		# Phase name -> seconds, in the order phases first ran
+		self.counters = {}		# Counter name -> count (rows, sheets skipped, ...)
+
+	@contextmanager
+	def phase(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start)
+
+	def count(self, name, n = 1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def total(self):
+		return sum(self.phases.values())
+
+	def merge(self, other):
+		for name, seconds in other.phases.items():
+			self.phases[name] = self.phases.get(name, 0.0) + seconds
+		for name, n in other.counters.items():
+			self.counters[name] = self.counters.get(name, 0) + n
+
+
+class NullTimer:
+	# Same interface as PhaseTimer, records nothing.  The shared NULL_TIMER
+	# must stay empty, so its phases and counters are read-only.
+
+	phases = types.MappingProxyType({})
+	counters = types.MappingProxyType({})
+
+	def phase(self, name):
+		return nullcontext()
+
+	def count(self, name, n = 1):
+		pass
+
+	def total(self):
+		return 0.0
+
+	def merge(self, other):
+		pass
+
+
+NULL_TIMER = NullTimer()
+
+
+# ----------------------------------------------------------------------- #
+# Optional profiling of a whole run
+# ----------------------------------------------------------------------- #
+class RunProfiler:
+	# Only the time spent inside "with profiler:" blocks is profiled.  The
+	# block may be entered any number of times (around each step of a run
+	# but not around user prompts); close() then writes out the results.
+	# profile_file -- cProfile stats are dumped here (view with python -m pstats)
+	# trace_memory -- record the Python heap peak and top allocation sites
+
+	def __init__(self, profile_file = None, trace_memory = False, top = 10):
+		self.profile_file = profile_file
+		self.trace_memory = trace_memory
+		self.top = top
+		self.profile = None
+		self.memory = None
+		self.elapsed = 0.0			# Seconds spent inside the with blocks
+
+	def __enter__(self):
+		if self.trace_memory:
+			import tracemalloc
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+		if self.profile_file:
+			if self.profile is None:
+				import cProfile
+				self.profile = cProfile.Profile()
+			self.profile.enable()
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.elapsed += time.perf_counter() - self.start
+		if self.profile is not None:
+			self.profile.disable()
+
+	def close(self):
+		if self.profile is not None:
+			self.profile.dump_stats(self.profile_file)
+		if self.trace_memory:
+			import tracemalloc
+			if tracemalloc.is_tracing():
+				current, peak = tracemalloc.get_traced_memory()
+				snapshot = tracemalloc.take_snapshot()
+				tracemalloc.stop()
+				self.memory = {
+					"current_mb":	round(current / (1024.0 * 1024.0), 1),
+					"peak_mb":		round(peak / (1024.0 * 1024.0), 1),
+					"top":			[str(stat) for stat in snapshot.statistics("lineno")[:self.top]],
+				}
+
+
+# ----------------------------------------------------------------------- #
+# End-of-run report
+# ----------------------------------------------------------------------- #
+def run_report(timer, elapsed = None, profiler = None):
+	# Structured (JSON friendly) report of a timed run.  elapsed is the
+	# wall time of the run (the profiler's elapsed time when one is given); whatever no phase accounts for is "other".
+	total = timer.total()
+	if elapsed is None:
+		elapsed = profiler.elapsed if profiler is not None else total
+	phases = {}
+	for name, seconds in timer.phases.items():
+		phases[name] = {"seconds": round(seconds, 4), "percent": round(100.0 * seconds / elapsed, 1) if elapsed else 0.0}
+	if elapsed > total:
+		phases["other"] = {"seconds": round(elapsed - total, 4), "percent": round(100.0 * (elapsed - total) / elapsed, 1)}
+
+	rows = timer.counters.get("rows", 0)
+	row_seconds = timer.phases.get("rows", 0.0)
+	report = {
+		"elapsed_seconds":	round(elapsed, 4),
+		"phases":			phases,
+		"rows":				rows,
+		"rows_per_second":	round(rows / row_seconds) if row_seconds else None,
+		"sheets_read":		timer.counters.get("sheets_read", 0),
+		"sheets_skipped":	timer.counters.get("sheets_skipped", 0),
+		"counters":			dict(timer.counters),
+	}
+	if profiler is not None:
+		if profiler.profile_file:
+			report["profile_file"] = profiler.profile_file
+		if profiler.memory is not None:
+			report["memory"] = profiler.memory
+	return report
+
+def format_report(report):
+	lines = ["Run report: " + "%.3f" % report["elapsed_seconds"] + " s"]
+	for name, phase in report["phases"].items():
+		lines.append("  %-10s %9.3f s  %5.1f%%" % (name, phase["seconds"], phase["percent"]))
+	lines.append("  rows read: " + str(report["rows"])
+				+ ("" if report["rows_per_second"] is None else " (" + str(report["rows_per_second"]) + " rows/s)"))
+	lines.append("  sheets read: " + str(report["sheets_read"]) + ", skipped: " + str(report["sheets_skipped"]))
+	if "memory" in report:
+		lines.append("  python heap peak: " + str(report["memory"]["peak_mb"]) + " MB")
+	if "profile_file" in report:
+		lines.append("  cProfile stats: " + report["profile_file"])
+	return "\n".join(lines)
+
+def write_report(report, filename):
+	with open(filename, "w") as f:
+		json.dump(report, f, indent = 2)
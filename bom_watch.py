@@ -0,0 +1,244 @@
+"""
+FILE: bom_watch.py
+
+PURPOSE:
+Watch mode for BOM scrub sessions.  Compares two BOM workbooks, then
+keeps polling them and rewrites the results whenever one is saved again.
+
+Only the workbook that changed is parsed again: a change is noticed by
+its modification time and size, confirmed by its content hash (so a
+save without edits costs nothing), and the other BOM stays parsed in
+memory.  The comparison itself is updated incrementally (see
+BomComparison.update), so results are back within about a second of a
+save on BOMs of tens of thousands of lines.
+
+A workbook caught half written (Excel saves in several steps) simply
+fails to parse; the previous copy is kept and the file is tried again
+on the next poll.  The results are written to a temporary file and
+renamed, so a results file that is open elsewhere is never left
+half written.  When the results can't be written (open in Excel, disk
+full, ...) the comparison is kept and writing is tried again on every
+poll until it succeeds.
+
+Usage:
+	python bom_watch.py ENG.xlsx IFS.xlsx -l ENG,IFS
+	python bom_watch.py . --interval 0.5 -o Comparison_Results.csv
+
+Stop with Ctrl+C.
+
+AUTHOR:
+Clinton G.
+
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import compare_bom_xlsx
+from bom_cache import BomCache, file_digest
+from bom_desc import DES_THRESHOLD, DescriptionScorer
+from bom_nway import find_workbooks
+from bom_timing import PhaseTimer
+
+POLL_INTERVAL	= 0.5				# Seconds between two looks at the workbooks
+
+
+class WatchedFile:
+	# One workbook and the signature of the copy last parsed
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.stat = None				# (mtime_ns, size)
+		self.digest = None
+
+	def signature(self):
+		st = os.stat(self.filename)
+		return (st.st_mtime_ns, st.st_size)
+
+	def changed(self):
+		# True when the contents differ from the copy last parsed.  The file
+		# is only hashed when its modification time or size moved.
+		try:
+			stat = self.signature()
+			if stat == self.stat:
+				return False
+			digest = file_digest(self.filename)
+		except OSError:
+			return False					# Being replaced right now, look again next poll
+		if digest == self.digest:
+			self.stat = stat
+			return False
+		return True
+
+	def mark_parsed(self):
+		self.stat = self.signature()
+		self.digest = file_digest(self.filename)
+
+
+class BomWatcher:
+
+	def __init__(self, file1, file2, label1, label2, output = compare_bom_xlsx.RESULTS_FILE, cache = None,
+				fuzzy = None, des_scorer = None, verbose = True):
+		self.files = [WatchedFile(file1), WatchedFile(file2)]
+		self.labels = [label1, label2]
+		self.output = output
+		self.cache = cache
+		self.fuzzy = fuzzy
+		self.des_scorer = des_scorer or DescriptionScorer(cache)
+		self.verbose = verbose
+		self.boms = [None, None]
+		self.comparison = None
+		self.unwritten = False			# The results on disk are behind the comparison
+		self.updates = 0
+
+	def say(self, text):
+		logging.info("%s", text)
+		if self.verbose:
+			print(time.strftime("%H:%M:%S") + "  " + text)
+
+	def load(self, i, timer):
+		# Parse workbook i, or return None (keeping the previous copy) when
+		# it can't be read yet
+		watched = self.files[i]
+		try:
+			bom = compare_bom_xlsx.Bom.load(watched.filename, self.labels[i], cache = self.cache, timer = timer)
+			watched.mark_parsed()
+		except Exception as e:
+			logging.warning("Could not read %s, will retry: %s", watched.filename, e)
+			self.say("Could not read " + os.path.basename(watched.filename) + " yet (" + type(e).__name__ + "), will retry")
+			return None
+		return bom
+
+	def write(self):
+		# Write to a temporary file next to the output and rename over it
+		root, ext = os.path.splitext(self.output)
+		tmp = root + ".partial" + ext
+		try:
+			self.comparison.render(tmp)
+			os.replace(tmp, self.output)
+		except PermissionError as e:
+			# On Windows the results can't be replaced while open in Excel
+			logging.warning("Could not replace %s: %s", self.output, e)
+			self.say("**Could not write " + self.output + " (open in Excel?), will try again")
+			self.unwritten = True
+			return False
+		except Exception as e:
+			logging.exception("Could not write %s", self.output)
+			self.say("**Could not write " + self.output + " (" + type(e).__name__ + ": " + str(e) + "), will try again")
+			self.unwritten = True
+			return False
+		finally:
+			if os.path.exists(tmp):
+				try:
+					os.remove(tmp)
+				except OSError:
+					pass
+		self.unwritten = False
+		return True
+
+	def start(self):
+		# Parse both workbooks and write the first results.  Returns False
+		# when either workbook can't be read.
+		timer = PhaseTimer()
+		start = time.perf_counter()
+		for i in range(2):
+			self.boms[i] = self.load(i, timer)
+			if self.boms[i] is None:
+				return False
+		self.comparison = compare_bom_xlsx.compare(self.boms[0], self.boms[1], timer, self.fuzzy, self.des_scorer)
+		self.write()
+		self.des_scorer.save()
+		self.report("Compared", start)
+		return True
+
+	def poll(self):
+		# One look at both workbooks.  Returns True when the results were rewritten.
+		changed = [i for i in range(2) if self.files[i].changed()]
+		if not changed:
+			if self.unwritten and self.write():
+				self.say("Wrote " + self.output)
+				return True
+			return False
+		timer = PhaseTimer()
+		start = time.perf_counter()
+		boms = [None, None]
+		for i in changed:
+			boms[i] = self.load(i, timer)
+		if (boms[0] is None) and (boms[1] is None):
+			return False
+		self.comparison.timer = timer
+		self.comparison.update(boms[0], boms[1])
+		self.boms = [self.comparison.bom1, self.comparison.bom2]
+		self.write()
+		self.des_scorer.save()
+		self.updates += 1
+		self.report(", ".join(self.labels[i] for i in range(2) if boms[i] is not None) + " changed, re-compared", start)
+		return True
+
+	def report(self, what, start):
+		summary = self.comparison.summary()
+		text = (what + " in " + str(round(time.perf_counter() - start, 2)) + " s: " + str(summary["matched"]) + " matched, "
+				+ str(summary["only1"]) + " only in " + summary["label1"] + ", " + str(summary["only2"]) + " only in " + summary["label2"])
+		if summary["fuzzy"]:
+			text += ", " + str(summary["fuzzy"]) + " fuzzy"
+		if summary["des_flagged"]:
+			text += ", " + str(summary["des_flagged"]) + " DES flagged"
+		self.say(text + " -> " + self.output)
+
+	def run(self, interval = POLL_INTERVAL, max_updates = None):
+		# Poll until interrupted (or until max_updates results were written)
+		while (max_updates is None) or (self.updates < max_updates):
+			time.sleep(interval)
+			self.poll()
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Compare two BOM workbooks and re-compare whenever one is saved.")
+	parser.add_argument("paths", nargs = "*", default = ["."], help = "The two BOM workbooks, or a directory holding them (default: .)")
+	parser.add_argument("-l", "--labels", default = None, help = "Comma separated labels (default: file names)")
+	parser.add_argument("-o", "--output", default = compare_bom_xlsx.RESULTS_FILE,
+						help = "Results file, .xlsx, .csv, .json or .jsonl (default: " + compare_bom_xlsx.RESULTS_FILE + ")")
+	parser.add_argument("--interval", type = float, default = POLL_INTERVAL, help = "Seconds between polls (default: " + str(POLL_INTERVAL) + ")")
+	parser.add_argument("-q", "--quiet", action = "store_true", help = "Only print problems")
+	parser.add_argument("--synonyms", default = compare_bom_xlsx.SYNONYM_FILE, help = "Extra header synonym file")
+	parser.add_argument("--cache-dir", default = None, help = "Parsed BOM cache directory")
+	parser.add_argument("--no-cache", action = "store_true", help = "Always parse workbooks, bypassing the parsed BOM cache")
+	parser.add_argument("--fuzzy", action = "store_true", help = "Propose pairs of near-miss QPNs")
+	parser.add_argument("--fuzzy-threshold", type = float, default = None, help = "Lowest score of a proposed pair (0..1)")
+	parser.add_argument("--des-threshold", type = float, default = DES_THRESHOLD, help = "Flag matched QPNs whose DES similarity is below this (0..1)")
+	args = parser.parse_args(argv)
+
+	output = os.path.abspath(args.output)
+	files = [f for f in find_workbooks(args.paths) if os.path.abspath(f) != output]
+	if len(files) != 2:
+		print("**Need exactly two BOM workbooks to watch, found " + str(len(files)))
+		return 2
+	labels = [l.strip() for l in args.labels.split(",")] if args.labels else [os.path.splitext(os.path.basename(f))[0] for f in files]
+	if len(labels) != 2:
+		print("**Need two labels, got " + str(len(labels)))
+		return 2
+
+	compare_bom_xlsx.setup_logging()
+	compare_bom_xlsx.load_header_synonyms(args.synonyms)
+	cache = BomCache(args.cache_dir, enabled = None if not args.no_cache else False)
+	fuzzy = compare_bom_xlsx.fuzzy_matcher(args.fuzzy_threshold) if args.fuzzy else None
+	watcher = BomWatcher(files[0], files[1], labels[0], labels[1], args.output, cache, fuzzy,
+						DescriptionScorer(cache, args.des_threshold), not args.quiet)
+
+	while not watcher.start():
+		time.sleep(args.interval)
+	print("Watching " + " and ".join(os.path.basename(f) for f in files) + ", Ctrl+C to stop")
+	try:
+		watcher.run(args.interval)
+	except KeyboardInterrupt:
+		print("Stopped after " + str(watcher.updates) + " update(s)")
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,361 @@
+"""
+FILE: bom_writers.py
+
+PURPOSE:
+Streaming writers for the comparison results.
+
+Every writer takes the comparison one row at a time, so nothing beyond
+the current row is held in memory:
+
+	XlsxComparisonWriter	-- Comparison_Results.xlsx layout, written with
+							   openpyxl in write-only mode
+	CsvComparisonWriter		-- one row per QPN, with a section column
+	JsonLinesComparisonWriter	-- one JSON object per QPN and line, with the
+							   entries of the BOMs under bom1 / bom2
+	JsonComparisonWriter	-- the same objects as one JSON array
+
+The writer is picked from the output file extension (see open_writer).
+
+Next to the DES / REF / QTY of both BOMs every row carries the reference
+designators only one of the BOMs lists, and a note wherever the number
+of designators disagrees with QTY (see bom_refdes.py).  When fuzzy QPN
+matching is on, the proposed pairs of near-miss QPNs follow in a section
+of their own, with their scores (see bom_fuzzy.py).  Matched QPNs whose
+descriptions disagree carry their DES similarity score (see bom_desc.py).
+Matched QPNs also carry their QTY delta (type 2 minus type 1, units
+normalized, see bom_table.py); the xlsx sheet has an autofilter on it,
+and stream_comparison() can leave out matched QPNs whose QTY is unchanged.
+
+AUTHOR:
+Clinton G.
+
+"""
+import csv
+import json
+import math
+from abc import ABC, abstractmethod
+from itertools import repeat
+
+from bom_refdes import ref_delta
+from bom_table import NAN, format_quantity, quantity_changed, quantity_deltas
+
+SECTION_MATCH	= "match"			# QPN in both BOMs
+SECTION_ONLY1	= "only1"			# QPN only in the type 1 BOM
+SECTION_ONLY2	= "only2"			# QPN only in the type 2 BOM
+SECTIONS		= [SECTION_MATCH, SECTION_ONLY1, SECTION_ONLY2]
+SECTION_FUZZY	= "fuzzy"			# Proposed pairs of near-miss QPNs, one from each BOM
+
+# ----------------------------------------------------------------------- #
+# Comparison workbook layout -- (column letter, width, comment)
+# ----------------------------------------------------------------------- #
+COLUMN_WIDTHS = [
+	("A", 25),			# QPN
+	("B", 25),
+	("C", 5),			# Dash
+	("D", 50),			# Description
+	("E", 50),
+	("F", 5),			# Dash
+	("G", 30),			# REF
+	("H", 30),
+	("I", 5),			# Dash
+	("J", 15),			# QTY
+	("K", 15),
+	("L", 5),			# Dash
+	("M", 30),			# REF only in one BOM
+	("N", 30),
+	("O", 5),			# Dash
+	("P", 20),			# REF count vs QTY
+	("Q", 20),
+	("R", 10),			# Fuzzy match score
+	("S", 10),			# DES similarity, only where the descriptions disagree
+	("T", 12),			# QTY delta of matched QPNs
+]
+comparison_bom_col_offsets = {"T2_QPN":1,"T1_QPN":2,"T2_DES":4,"T1_DES":5,"T2_REF":7,"T1_REF":8,"T2_QTY":10,"T1_QTY":11,
+							"T2_ONLY_REF":13,"T1_ONLY_REF":14,"T2_REF_CHECK":16,"T1_REF_CHECK":17,"SCORE":18,"DES_SCORE":19,"QTY_DELTA":20}
+NUM_COLUMNS		= 20
+SECTION_GAP		= 2					# Blank rows between sections
+MAX_SHEET_ROWS	= 1048576			# Rows of an Excel worksheet
+
+
+def section_title(section, type1_bom_description, type2_bom_description):
+	if section == SECTION_MATCH:
+		return "These QPNs match between " + type2_bom_description + " and " + type1_bom_description
+	if section == SECTION_ONLY1:
+		return "These QPNs are in " + type1_bom_description + " but NOT in " + type2_bom_description
+	if section == SECTION_FUZZY:
+		return "These QPNs are in only one BOM, but look like the same part (proposed matches, check before use)"
+	return "These QPNs are in " + type2_bom_description + " but NOT in " + type1_bom_description
+
+
+class ComparisonWriter(ABC):
+	# Base class.  Call begin_section() before the rows of each section,
+	# write_row() for every QPN and close() once at the end.  entry1 and
+	# entry2 are (DES, REF, QTY) tuples, or None when the QPN is missing
+	# from that BOM.  delta is bom_refdes.ref_delta() of the two entries.
+	# In the fuzzy section key is the type 1 QPN, key2 the type 2 QPN and
+	# score how alike they are.  des_score is set where the two DES disagree,
+	# qty_delta (type 2 QTY minus type 1 QTY) on matched QPNs with numeric QTYs.
+
+	def __init__(self, filename, type1_bom_description, type2_bom_description):
+		self.filename = filename
+		self.type1_bom_description = str(type1_bom_description)
+		self.type2_bom_description = str(type2_bom_description)
+		self.section = None
+
+	def begin_section(self, section):
+		self.section = section
+
+	@abstractmethod
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		pass
+
+	def close(self):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+class XlsxComparisonWriter(ComparisonWriter):
+
+	def __init__(self, filename, type1_bom_description, type2_bom_description):
+		ComparisonWriter.__init__(self, filename, type1_bom_description, type2_bom_description)
+		from openpyxl import Workbook
+
+		# Write-only mode appends whole rows straight to the output stream
+		self.book = Workbook(write_only = True)
+		self.sheet = None
+		self.sheet_rows = 0
+		self.new_sheet()
+		self.sections_written = 0
+
+	def new_sheet(self):
+		# Results longer than an Excel sheet carry on in "Comparison Data 2", ...
+		self.finish_sheet()
+		self.sheet = self.book.create_sheet("Comparison Data" + ("" if self.sheet is None else " " + str(len(self.book.worksheets) + 1)))
+		for letter, width in COLUMN_WIDTHS:
+			self.sheet.column_dimensions[letter].width = width
+		t1 = self.type1_bom_description
+		t2 = self.type2_bom_description
+		self.sheet.append([	t2 + " QPN", t1 + " QPN","-",
+							t2 + " DES", t1 + " DES","-",
+							t2 + " REF", t1 + " REF","-",
+							t2 + " QTY", t1 + " QTY","-",
+							t2 + " only REF", t1 + " only REF","-",
+							t2 + " REF/QTY", t1 + " REF/QTY","Score","DES Match","QTY Delta"])
+		self.sheet_rows = 1
+
+	def finish_sheet(self):
+		# Autofilter over the whole sheet, i.e. to show only the rows whose
+		# QTY Delta isn't blank or 0
+		if self.sheet is not None:
+			self.sheet.auto_filter.ref = "A1:" + COLUMN_WIDTHS[-1][0] + str(self.sheet_rows)
+
+	def append(self, row):
+		if self.sheet_rows >= MAX_SHEET_ROWS:
+			self.new_sheet()
+		self.sheet.append(row)
+		self.sheet_rows += 1
+
+	def begin_section(self, section):
+		ComparisonWriter.begin_section(self, section)
+		if self.sections_written:
+			for i in range(SECTION_GAP):
+				self.append([])
+		self.sections_written += 1
+		self.append([section_title(section, self.type1_bom_description, self.type2_bom_description)])
+
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		row = [None] * NUM_COLUMNS
+		if entry2 is not None:
+			row[comparison_bom_col_offsets["T2_QPN"] - 1] = key if key2 is None else key2
+			row[comparison_bom_col_offsets["T2_DES"] - 1] = entry2[0]
+			row[comparison_bom_col_offsets["T2_REF"] - 1] = entry2[1]
+			row[comparison_bom_col_offsets["T2_QTY"] - 1] = entry2[2]
+		if entry1 is not None:
+			row[comparison_bom_col_offsets["T1_QPN"] - 1] = key
+			row[comparison_bom_col_offsets["T1_DES"] - 1] = entry1[0]
+			row[comparison_bom_col_offsets["T1_REF"] - 1] = entry1[1]
+			row[comparison_bom_col_offsets["T1_QTY"] - 1] = entry1[2]
+		only1, only2, check1, check2 = delta
+		row[comparison_bom_col_offsets["T2_ONLY_REF"] - 1] = only2 or None
+		row[comparison_bom_col_offsets["T1_ONLY_REF"] - 1] = only1 or None
+		row[comparison_bom_col_offsets["T2_REF_CHECK"] - 1] = check2 or None
+		row[comparison_bom_col_offsets["T1_REF_CHECK"] - 1] = check1 or None
+		row[comparison_bom_col_offsets["SCORE"] - 1] = score
+		row[comparison_bom_col_offsets["DES_SCORE"] - 1] = des_score
+		row[comparison_bom_col_offsets["QTY_DELTA"] - 1] = qty_delta
+		self.append(row)
+
+	def close(self):
+		if self.book is not None:
+			self.finish_sheet()
+			self.book.save(filename = self.filename)
+			self.book = None
+
+
+class CsvComparisonWriter(ComparisonWriter):
+
+	def __init__(self, filename, type1_bom_description, type2_bom_description):
+		ComparisonWriter.__init__(self, filename, type1_bom_description, type2_bom_description)
+		self.file = open(filename, "w", newline = "", encoding = "utf-8")
+		self.writer = csv.writer(self.file)
+		t1 = self.type1_bom_description
+		t2 = self.type2_bom_description
+		self.writer.writerow(["section", "QPN",
+							t2 + " DES", t1 + " DES",
+							t2 + " REF", t1 + " REF",
+							t2 + " QTY", t1 + " QTY",
+							t2 + " only REF", t1 + " only REF",
+							t2 + " REF/QTY", t1 + " REF/QTY",
+							t2 + " matched QPN", "score", "DES match", "QTY delta"])
+
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		entry1 = entry1 or ("", "", "")
+		entry2 = entry2 or ("", "", "")
+		only1, only2, check1, check2 = delta
+		self.writer.writerow([self.section, key,
+							entry2[0], entry1[0],
+							entry2[1], entry1[1],
+							entry2[2], entry1[2],
+							only2, only1,
+							check2, check1,
+							"" if key2 is None else key2, "" if score is None else score,
+							"" if des_score is None else des_score,
+							"" if qty_delta is None else format_quantity(qty_delta)])
+
+	def close(self):
+		if not self.file.closed:
+			self.file.close()
+
+
+class JsonLinesComparisonWriter(ComparisonWriter):
+
+	def __init__(self, filename, type1_bom_description, type2_bom_description):
+		ComparisonWriter.__init__(self, filename, type1_bom_description, type2_bom_description)
+		self.file = open(filename, "w", encoding = "utf-8")
+
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		self.file.write(json.dumps(self.record(key, entry1, entry2, delta, key2, score, des_score, qty_delta)) + "\n")
+
+	def record(self, key, entry1, entry2, delta, key2, score, des_score, qty_delta = None):
+		record = {"section": self.section, "qpn": key}
+		if key2 is not None:
+			record["matched_qpn"] = key2
+			record["score"] = score
+		if des_score is not None:
+			record["des_score"] = des_score
+		if qty_delta is not None:
+			record["qty_delta"] = qty_delta
+		# Fixed bom1 / bom2 keys: labels may be equal, or clash with the
+		# fields above, so each entry carries its label instead
+		only1, only2, check1, check2 = delta
+		for name, label, entry, only, check in (("bom1", self.type1_bom_description, entry1, only1, check1),
+												("bom2", self.type2_bom_description, entry2, only2, check2)):
+			if entry is not None:
+				record[name] = {"label": label, "des": entry[0], "ref": entry[1], "qty": entry[2], "only_ref": only, "ref_qty_check": check}
+			else:
+				record[name] = None
+		return record
+
+	def close(self):
+		if not self.file.closed:
+			self.file.close()
+
+
+class JsonComparisonWriter(JsonLinesComparisonWriter):
+	# The JSON Lines records as one JSON array, still written a record at
+	# a time
+
+	def __init__(self, filename, type1_bom_description, type2_bom_description):
+		JsonLinesComparisonWriter.__init__(self, filename, type1_bom_description, type2_bom_description)
+		self.file.write("[")
+		self.records_written = 0
+
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		self.file.write((",\n" if self.records_written else "\n") + json.dumps(self.record(key, entry1, entry2, delta, key2, score, des_score, qty_delta)))
+		self.records_written += 1
+
+	def close(self):
+		if not self.file.closed:
+			self.file.write("\n]\n")
+			self.file.close()
+
+
+class MemoryComparisonWriter(JsonLinesComparisonWriter):
+	# Keeps the JSON Lines records in a list (i.e. for an HTTP response)
+	# instead of writing them to a file
+
+	def __init__(self, type1_bom_description, type2_bom_description):
+		ComparisonWriter.__init__(self, None, type1_bom_description, type2_bom_description)
+		self.records = []
+
+	def write_row(self, key, entry1, entry2, delta = ("", "", "", ""), key2 = None, score = None, des_score = None, qty_delta = None):
+		self.records.append(self.record(key, entry1, entry2, delta, key2, score, des_score, qty_delta))
+
+	def close(self):
+		pass
+
+
+WRITERS = {
+	".xlsx":	XlsxComparisonWriter,
+	".csv":		CsvComparisonWriter,
+	".jsonl":	JsonLinesComparisonWriter,
+	".json":	JsonComparisonWriter,
+}
+
+def open_writer(filename, type1_bom_description, type2_bom_description):
+	# Pick the writer from the file extension
+	for ext in WRITERS:
+		if filename.lower().endswith(ext):
+			return WRITERS[ext](filename, type1_bom_description, type2_bom_description)
+	raise ValueError("Unsupported output format: " + filename)
+
+
+def delta_value(qty_delta):
+	# A QTY delta for the writers, None when it isn't a number
+	return None if math.isnan(qty_delta) else qty_delta
+
+
+def stream_comparison(writers, dict_type1_bom, dict_type2_bom, comparison, des_flags = None, qty_deltas = None, qty_changes_only = False):
+	# Feed every section of the comparison, row by row, into each writer.
+	# comparison is (matches, only type 1, only type 2), optionally followed
+	# by a list of fuzzy (type 1 QPN, type 2 QPN, score) pairs.  des_flags
+	# maps the matched QPNs whose descriptions disagree to their DES score.
+	# qty_deltas -- bom_table.quantity_deltas() of the matches, computed here
+	# when not given
+	# qty_changes_only -- leave out the matched QPNs whose QTY is unchanged
+	des_flags = des_flags or {}
+	matches, only_type1, only_type2 = comparison[:3]
+	if qty_deltas is None:
+		qty_deltas = quantity_deltas(dict_type1_bom, dict_type2_bom, matches)
+	for section, keys in ((SECTION_MATCH, matches), (SECTION_ONLY1, only_type1), (SECTION_ONLY2, only_type2)):
+		for writer in writers:
+			writer.begin_section(section)
+		deltas = qty_deltas if section == SECTION_MATCH else repeat(NAN)
+		for key, qty_delta in zip(keys, deltas):
+			entry1 = dict_type1_bom.get(key)
+			entry2 = dict_type2_bom.get(key)
+			if section == SECTION_MATCH:
+				if qty_changes_only and not quantity_changed(qty_delta, entry1[2], entry2[2]):
+					continue
+				des_score = des_flags.get(key)
+			else:
+				des_score = None
+			delta = ref_delta(entry1, entry2)
+			for writer in writers:
+				writer.write_row(key, entry1, entry2, delta, des_score = des_score, qty_delta = delta_value(qty_delta))
+
+	fuzzy = comparison[3] if len(comparison) > 3 else None
+	if fuzzy:
+		for writer in writers:
+			writer.begin_section(SECTION_FUZZY)
+		for key1, key2, score in fuzzy:
+			entry1 = dict_type1_bom.get(key1)
+			entry2 = dict_type2_bom.get(key2)
+			delta = ref_delta(entry1, entry2)
+			for writer in writers:
+				writer.write_row(key1, entry1, entry2, delta, key2, score)
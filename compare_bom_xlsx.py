@@ -1,40 +1,51 @@
 """
 FILE: compare_bom_xlsx.py
 
-PURPOSE: 
-To compare two BOMs (i.e. between IFS and Engineering).  
+PURPOSE:
+To compare two BOMs (i.e. between IFS and Engineering).
 
-The comparison algorithm will first look at ever QPN 
-in the engineering BOM and compare against IFS.  Secondly 
+The comparison algorithm will first look at ever QPN
+in the engineering BOM and compare against IFS.  Secondly
 it will look at every QPN in the IFS BOM and compare against
 the ENG BOM.  This helps assure there aren't parts listed on
-one BOM that aren't on the other.  
+one BOM that aren't on the other.
 
-AUTHOR: 
-Clinton G. 
+Run without arguments for the interactive (two BOMs in the current
+directory) comparison.  See bom_batch.py for comparing many pairs
+from a manifest.
+
+The module can also be imported (see Bom, compare and BomComparison
+under "Library API").  Importing it has no side effects.
+
+AUTHOR:
+Clinton G.
 
 TODO: Nothing
 
 """
 import sys
-import random
-import time
-import csv
-import re
 import os
-from openpyxl import Workbook
-from openpyxl import load_workbook
+import argparse
 import logging
+from itertools import repeat
+from xlsx_native import NativeWorkbook, NativeXlsxUnsupported
+from delimited_reader import DelimitedWorkbook, is_delimited
+from bom_header import get_classifier, load_synonym_file
+from bom_cache import BomCache
+from bom_table import NAN, BomTable, attach_unit, format_quantity, quantity_changed, quantity_deltas, quantity_unit
+from bom_levels import TreeFlattener, is_multilevel
+from bom_refdes import diff_designators, ref_delta
+from bom_fuzzy import RULES_FILE, FuzzyMatcher, load_rules_file
+from bom_desc import DES_THRESHOLD, DescriptionScorer
+from bom_timing import NULL_TIMER, PhaseTimer, RunProfiler, format_report, run_report, write_report
+from bom_writers import SECTIONS, SECTION_MATCH, SECTION_FUZZY, open_writer, stream_comparison
 
 # ----------------------------------------------------------------------- #
 # Regular Expression Strings
 # ----------------------------------------------------------------------- #
-qpn_re 		= "(QPN)|(COMPONENT.?PART)"
+# QPN / DES / REF / QTY header spellings live in bom_header.HEADER_SYNONYMS
 mfgpn_re 	= "(MFG.?PN)"										# To match MFGPN or MFG PN (will ignore case)
-mfg_re 		= "(MFG)|(MANUFACTURER)"			
-des_re 		= "(DES)|(DESCRIPTION)|(Part.?Description)"
-ref_re		= "(REF)|(REF.DES)|(REFERENCE)"				# IFS BOMs often put this information in the NOTES column
-qty_re		= "(QTY)|(QUANTITY)|(Qty.{1,20})"
+mfg_re 		= "(MFG)|(MANUFACTURER)"
 uom_re		= "(UOM)|(UNIT OF MEASURE)"
 cr1_re		= "(CR1)"
 cr1pn_re	= "(CR1PN)"
@@ -44,48 +55,20 @@ notes_re	= "(NOTES)"
 
 ## DEFINE VRIABLES ##
 #####################
-MFGPN_col 	= 0								# Column number containing the MFGPN
-QPN_col 	= 0								# Column number containing QPN
-MFG_col 	= 0								# Column location for manufacturer part number
-DES_col 	= 0 							# Column location for description part number
-QTY_col 	= 0 							# Column location for quantity field
-UOM_col 	= 0 							# Column location for UOM field
-CR1_col		= 0								# Column location for supplier name
-CR1PN_col	= 0								# Column location for supplier's PN
-NOTE_col 	= 0 							# Column location for "notes" field
-BOM_HEADER 	= ["QPN","QTY","DES","REF"]		# The IFS BOM dictates this
-
-# -------------------------------------- #
-# Dictionaries
-# -------------------------------------- #
-dict_type1_bom	= {}
-dict_type2_bom	= {}
-
-
-# -------------------------------------- #
-# Boolean Flags
-# -------------------------------------- #
-bom_is_types2				= False		# True if IFS BOM / False if ENG BOM
-flag_header_detecetd 	= False		# Set to true as soon as we detect header data in one of the rows
-sheet_valid		= False		# Flag that tells application if a sheet contains valid data or not
-
-
-type1_bom_description	= ""		# A short string to identify BOM of type 1 (i.e. "A01" or "ENG")
-type2_bom_description	= ""		# A short string to identify BOM of type 1 (i.e. "A02" or "IFS")
-data_start 				= 0			# This is the row where the data starts
-search_header 	= []		# Set equal to BOM_HEADER and pop elements until we find all the colums we're looking for
-header 			= []		# This array will define the column locations for the header
-qpn 			= []        # Pull in all QPNs into a list. This will make them easier to work with later
-asso 			= []       	# Pull in all associations into a list. This will make them easier to work with later
-qty 			= []        # Pull in all QTYs into a list. This will make them easier to work with later
-uom 			= []        # Pull in all UOM values into a list. This will make them easier to work with later
-des 			= []		# Pull in all Descriptions into a list. This will make them easier to work with later
-ref 			= []		# Pull all reference values into a list. This will make them easier to work with later
-mfg 			= []		# Pull in all Manufactures into a list. This will make them easier to work with later
-mfgpn 			= []		# Pull in all Manufacturing Part Numbers into a list. This will make them easier to work with later
-cr1 			= []		# Pull in all suppler names into a list. This will make them easier to work with later
-cr1pn 			= []		# Pull in all supplier pn's into a list. This will make them easier to work with later
-notes 			= []		# Pull all note values into a list. This will make them easier to work with later
+XLSX_READER	= "native"						# "native" streams the xlsx XML directly, "openpyxl" always uses openpyxl
+SYNONYM_FILE	= "header_synonyms.csv"			# Optional extra header spellings (FIELD,pattern per line)
+LOG_FILE	= "compare_bom.log"
+RESULTS_FILE	= "Comparison_Results.xlsx"
+BLANK_ROW_LIMIT	= 3							# Stop reading a sheet after this many blank rows in a row
+PARSER_VERSION	= 4							# Bump whenever parse_bom() output changes, invalidates cached BOMs
+EXTERNAL_ROWS	= 1000000					# BOMs with more lines than this are compared out of core (bom_external.py)
+CONCURRENT_BYTES	= 1048576				# Parse the BOMs side by side in worker processes once both are this big
+LOG_LEVEL	= "INFO"
+
+# Console verbosity (the verbose argument of parse_bom / Bom.load)
+VERBOSE_QUIET	= 0							# Nothing but errors
+VERBOSE_NORMAL	= 1							# Files, sheets and header columns found
+VERBOSE_ROWS	= 2							# ...plus every row read (slow on large BOMs)
 
 
 # -------------------------------------- #
@@ -94,308 +77,304 @@ notes 			= []		# Pull all note values into a list. This will make them easier to
 def debugbreak():
 	while(1):
 		pass
-		
-def clean_value(textin):
-	temptext = textin
-	logging.info("Text entered into method clean value: " + str(temptext))
-	temptext = temptext.lstrip('text:u\'')     	# Remove the initial part of the string that we don't need 'text:u'   
-	temptext = temptext.lstrip("b\'")     	# Remove the initial part of the string that we don't need 'text:u'   
+
+def quiet(*args):
+	# Stand-in for print when console output is not wanted
+	pass
+
+def clean_cell(value):
+	# Rows come from a values-only iterator, so cells already hold native
+	# python values.  Only convert and tidy the ones we keep.
+	if value is None:
+		return ""
+	temptext = str(value)
 	temptext = temptext.replace("'","")			# Remove single quote marks from value
 	temptext = temptext.strip()					# Remove only leading and trailing white spaces
-	if(temptext.find("number:") != -1):
-		temptext = temptext.replace("number:","")			#This will remove any and all white spaces
-	if(temptext.find("mpty:") != -1):
-		temptext = temptext.replace("mpty:","")			#This will remove any and all white spaces
-	return temptext
-	
-def clean_des(textin):
-	temptext = textin
-	temptext = temptext.lstrip('text:u\'')     #Remove the initial part of the string that we don't need 'text:u'  
-	temptext = temptext.replace("'","")			#This will remove any and all white spaces
-	if(temptext.find("mpty:") != -1):
-		temptext = temptext.replace("mpty:","")			#This will remove any and all white spaces
 	return temptext
+
+def extract_row(row, columns):
+	# Pull only the requested (1-based) columns out of a row tuple.  Columns
+	# past the end of the row, or column 0 (a missing REF column), come back blank.
+	row_len = len(row)
+	return [clean_cell(row[c - 1]) if 0 < c <= row_len else "" for c in columns]
+
+def row_is_blank(values):
+	# A row is considered blank when none of the BOM columns hold real data
+	for v in values:
+		if(len(v) > 1):
+			return False
+	return True
+
+def open_workbook(filename, reader = None):
+	# Prefer the native reader, which only decodes the BOM columns.  Fall
+	# back to openpyxl (read-only) for anything the native reader can't handle.
+	# openpyxl is only imported once a workbook actually needs it.
+	# CSV / TSV exports are streamed by the delimited text reader.
+	if(is_delimited(filename)):
+		return DelimitedWorkbook(filename)
+	if((reader or XLSX_READER) == "native"):
+		try:
+			return NativeWorkbook(filename)
+		except NativeXlsxUnsupported as e:
+			logging.info("Native xlsx reader unavailable, falling back to openpyxl: %s", e)
+	from openpyxl import load_workbook
+	return load_workbook(filename = filename, read_only = True, data_only = True)
+
+def is_bom_file(filename):
+	# Workbooks and delimited text exports, but not earlier results, the
+	# tool's own settings files or Excel lock files
+	name = os.path.basename(filename)
+	if(name.startswith("~$")) or ("Comparison" in name) or (name in (SYNONYM_FILE, RULES_FILE)):
+		return False
+	return name.upper().endswith(".XLSX") or is_delimited(name)
+
 def pause():
 	user_input=input("Press any key to exit...")
 	sys.exit(0)
 
-# ------------------------------------- #
-# Setup Logging
-# -------------------------------------- #
-logging.basicConfig(
-	filename = 'compare_bom.log',
-	level = logging.DEBUG,
-	format =' %(asctime)s -  %(levelname)s - %(message)s',
-	filemode = 'w'
-)
+def setup_logging(filename = LOG_FILE, level = LOG_LEVEL):
+	# ------------------------------------- #
+	# Setup Logging
+	# -------------------------------------- #
+	logging.basicConfig(
+		filename = filename,
+		level = level,
+		format =' %(asctime)s -  %(levelname)s - %(message)s',
+		filemode = 'w'
+	)
 
+def load_header_synonyms(filename = SYNONYM_FILE):
+	# Header classifier -- picks up any site specific header spellings
+	if(os.path.isfile(filename)):
+		logging.info("Loading header synonyms from %s", filename)
+		load_synonym_file(filename)
 
-#****************************************************************************** 
-#******************************  ---MAIN---  **********************************
-#******************************************************************************   
-if __name__ == '__main__':
-
-	# ----------------------------------------------------------------------- #
-	# Iterate through files and delete
-	# existing comparison BOMs and log files if they exist
-	# ----------------------------------------------------------------------- #
 
-	path = os.getcwd()
-	for (path, dirs, files) in os.walk(path):
-		path
-		dirs
-		files
-	
-	for i in range(len(files)):
-		if(files[i].find("Comparison") != -1):
-			logging.info("Deleting existing comparison BOM.")
-			os.remove(files[i])
+# ----------------------------------------------------------------------- #
+# Read a BOM workbook
+# ----------------------------------------------------------------------- #
+def parse_bom(filename, verbose = True, classifier = None, reader = None, timer = None, row_sink = None):
+	# Returns the normalized BOM: the sheets (and header columns) data was
+	# taken from, plus every cleaned (QPN, DES, REF, QTY) row in sheet order.
+	# Rows of multi-level sheets also carry (LEVEL, SUB BOM), see flatten_table().
+	# A UOM column is folded into QTY ("2" and "EA" -> "2 EA").
+	# Pass a bom_timing.PhaseTimer to have the open/header/rows phases timed.
+	# verbose -- VERBOSE_QUIET / VERBOSE_NORMAL / VERBOSE_ROWS (True = normal)
+	# row_sink -- called with every row instead of collecting them, i.e. to
+	# spill rows to disk (see bom_external.py); "rows" then comes back empty
+	say = print if verbose else quiet
+	say_rows = verbose >= VERBOSE_ROWS
+	classifier = classifier or get_classifier()
+	timer = timer or NULL_TIMER
+	sheets = []		# One entry per sheet that carried a BOM header
+	bom_rows = []	# Pull in all (QPN, DES, REF, QTY) rows into a list. This will make them easier to work with later
+	add_row = row_sink or bom_rows.append
+	row_count = 0
+
+	say ("\n===============================================")
+	say ("===============================================")
+	say ("Opening file: ", filename)
+
+	logging.info ("===============================================")
+	logging.info ("===============================================")
+	logging.info ("Opening file: %s", filename)
+
+	# Open read-only and values-only.  Rows are streamed out of the
+	# archive as they are iterated so memory stays flat regardless of
+	# how large (or how heavily formatted) the workbook is.
+	with timer.phase("open"):
+		wb = open_workbook(filename, reader)
+		ws = wb.sheetnames             			# Grab the names of the worksheets -- I believe this line is critical.
+
+	# Each BOM / workbook shall only contain one sheet with
+	# BOM data.  However, often times BOMs include a revision sheet / etc.,
+	# thus this script shall be intelligent enough to properly omit
+	# revision/changelog/etc. sheets.
+	num_sheets = len(ws)						# This is the number of sheets
+
+	say ("The number of worksheets is: ", str(num_sheets))
+	say ("Worksheet names: ", ws)
+	say ("===============================================")
+
+	logging.info ("The number of worksheets is: %d", num_sheets)
+	if(logging.getLogger().isEnabledFor(logging.DEBUG)):
+		for sh in range (len(ws)):
+			logging.debug ("Worksheet %d) %s", sh, ws[sh])
 
 	# ----------------------------------------------------------------------- #
-	# Some file may have been removed, so refresh 
-	# directory information.  
+	# Iterate through all sheets
 	# ----------------------------------------------------------------------- #
-	path = os.getcwd()
-	for (path, dirs, files) in os.walk(path):
-		path
-		dirs
-		files
-
-	print ("Files found in directory: ", str(len(files)))
-	logging.info("Files found in directory: " + str(len(files)))
-	print ("File names: ", files)
-	for i in range(len(files)):
-		logging.info("File " + str(i) + ") " + files[i])
+	for sh in range (num_sheets):
+		current_sheet = wb[ws[sh]]
 
+		say ("\n\n===============================================")
+		say ("Now operating on worksheet: ", ws[sh])
+		logging.info ("Now operating on worksheet: %s", ws[sh])
 
-	# ----------------------------------------------------------------------- #
-	# Iterate through files
-	# ----------------------------------------------------------------------- #
-	for i in range(len(files)):
-		
 		# ----------------------------------------------------------------------- #
-		# Only open files having the proper extension 
-		# ----------------------------------------------------------------------- #
-		if(files[i].upper().endswith(".XLSX")):
-			
-			print ("\n===============================================")
-			print ("===============================================")
-			print ("Opening file: ", files[i])
-
-			logging.info ("===============================================")
-			logging.info ("===============================================")
-			logging.info ("Opening file: " + files[i])
-			
-			wb = load_workbook(filename = files[i])     # Open the workbook that we are going to parse though 
-			ws = wb.sheetnames             				# Grab the names of the worksheets -- I believe this line is critical.
-			
-			# Each BOM / workbook shall only contain one sheet with 
-			# BOM data.  However, often times BOMs include a revision sheet / etc.,
-			# thus this script shall be intelligent enough to properly omit 
-			# revision/changelog/etc. sheets.  
-			num_sheets = len(ws)						# This is the number of sheets
-
-			# ----------------------------------------------------------------------- #
-			# Determine BOM Origin (ENG or IFS)
-			# ----------------------------------------------------------------------- #
-			if(len(type1_bom_description) <= 1):
-				type1_bom_description = input("Enter a short description for this BOM (i.e. \"ENG\"): ").strip()
-				bom_is_types2 = False
-			elif(len(type2_bom_description) <= 1):
-				type2_bom_description = input("Enter a short description for this BOM (i.e. \"IFS\"):" ).strip()
-				bom_is_types2 = True
-			else:
-				bom_is_types2 = False
-				print("**Too many Excel files detected, now exiting.")
-				logging.info("**Too many Excel files detected, now exiting.  ")
-				exit()
-			
-
-			print ("The number of worksheets is: ", str(num_sheets))
-			print ("Worksheet names: ", ws)
-			print ("===============================================")
-			
-			logging.info ("The number of worksheets is: " + str(num_sheets))
-			for i in range (len(ws)):
-				logging.info ("Worksheet ",str(i), ") ", ws)
-
-			# ----------------------------------------------------------------------- #
-			# Iterate through all sheets
-			# ----------------------------------------------------------------------- #
-			for sh in range (num_sheets):
-				sheet_valid = False
-				
-				current_sheet = wb[ws[sh]]
-				
-				print ("\n\n===============================================")
-				print("Now operating on worksheet: ", ws[sh])
-				logging.info ("===============================================")
-				logging.info ("Now operating on worksheet: " + ws[sh])
-				
-				num_rows = current_sheet.max_row     		
-				num_cols = current_sheet.max_column 		
-
-				# ----------------------------------------------------------------------- #
-				# Iterate through every row on current sheet
-				# ----------------------------------------------------------------------- #
-				for r in range (1,num_rows + 1):					# Find the header locations. Excel starts counting at one
-					search_header = BOM_HEADER.copy()						# Load up headers we need to search for
-					print ("Search header before starting: ", search_header)
-					
-					flag_header_detecetd = False
-					# ----------------------------------------------------------------------- #
-					# Iterate over columns of selected row
-					# ----------------------------------------------------------------------- #
-					for c in range (1,num_cols + 1):				# Excel starts counting at 1
-						
-						temptext = str(str(current_sheet.cell(row = r, column=c).value).encode(encoding = 'UTF-8',errors = 'strict'))                
-						temptext = temptext.lstrip("text:u\'")     	# Clean up the extra garbage on text 
-						temptext = temptext.lstrip("b\'")     		
-						temptext = temptext.rstrip("\'")     		
-						temptext = temptext.replace(" ","")			# Remove any and all white spaces 
-						logging.info("Text extracted from cell: " + temptext)
-						
-						if(re.fullmatch(qpn_re,temptext,re.IGNORECASE)):
-							QPN_col = c
-							search_header.remove("QPN")
-							logging.info("Found header: " + temptext)
-							logging.info("Still Looking For: " + str(search_header))
-						
-						elif(re.fullmatch(des_re,temptext,re.IGNORECASE)):		#Look for Description
-							DES_col = c
-							search_header.remove("DES")
-							logging.info("Found header: " + temptext)
-							logging.info("Still Looking For: " + str(search_header))
-						
-						elif(re.fullmatch(ref_re,temptext,re.IGNORECASE)):		#Look for Description
-							REF_col = c
-							search_header.remove("REF")
-							logging.info("Found header: " + temptext)
-							logging.info("Still Looking For: " + str(search_header))
-						
-						elif(re.fullmatch(qty_re,temptext,re.IGNORECASE)):		#Look for Quantity field.  
-							QTY_col = c
-							search_header.remove("QTY")
-							logging.info("Found header: " + temptext)
-							logging.info("Still Looking For: " + str(search_header))
-
-						# Point where we found every header field except the reference
-						if((len(search_header) == 1) and ("REF" in search_header) and (c == (num_cols))):
-							REF_col = 30
-							search_header.remove("REF")
-							logging.info("There is no reference field in this BOM. All other header fields found.")
-
-					######
-					# END FOR Iterating Over Columns
-					######
-
-					if( (len(search_header) == 0) ):		# Found all header fields
-						sheet_valid = True
-						data_start = r + 1			# Plenty of confidence at this point that we've found data start
-						print ("Data appears to start on row: ", data_start)
-						logging.info("Data appears to start on row: " + str(data_start))
-						
-						print( 	"Sample data in start row: ", clean_value(str(str(current_sheet.cell(row = data_start, column=QPN_col).value).encode(encoding = 'UTF-8',errors = 'strict'))),' ', 
-								clean_value(str(str(current_sheet.cell(row = data_start, column=DES_col).value).encode(encoding = 'UTF-8',errors = 'strict'))), ' ', 
-								clean_value(str(str(current_sheet.cell(row = data_start, column=REF_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-							)
-						break
-
-					elif((r == 10) and (len(search_header) > 0) and sh < num_sheets):
-						sheet_valid = False
-						print ("* File: ", str(files[i]), "Invalid Sheet: ", str(ws[sh]), " -- did not find headers: ", search_header)
-						break
-					
-				if(sheet_valid):
-					print ("QPN column found to be: ", 			str(QPN_col))		
-					print ("QTY column found to be: ", 			str(QTY_col))
-					print ("Description column found to be: ", 	str(DES_col))		
-					print ("Reference column found to be: ", 	str(REF_col))		
-					
-					header = [QPN_col,DES_col,REF_col,QTY_col]
-					header_values = ["QPN","DES","REF","QTY","NOTES"]
-					
-					# Now iterate through all rows of the current sheet and populate the data lists
-					blank_row_count = 0		# Reset number of blank rows detected.  When three in a row are detected, break out of the loop. 
-					for r in range (data_start,num_rows + 1):
-						
-						
-						# If multiple columns are blank, break out of this loop for these are empty cells
-						if( ( len(clean_des(str(str(current_sheet.cell(row = r, column=QPN_col).value).encode(encoding = 'UTF-8',errors = 'strict')))) <= 1) and
-							( len(clean_des(str(str(current_sheet.cell(row = r, column=DES_col).value).encode(encoding = 'UTF-8',errors = 'strict')))) <= 1) and
-						 	( len(clean_des(str(str(current_sheet.cell(row = r, column=REF_col).value).encode(encoding = 'UTF-8',errors = 'strict')))) <= 1) and
-							( len(clean_des(str(str(current_sheet.cell(row = r, column=QTY_col).value).encode(encoding = 'UTF-8',errors = 'strict')))) <= 1) ):
-							
-							blank_row_count += 1				# Increase value of blank row count
-							print ("Blank row detected at row (", r, ")")
-						
-						else:
-							
-							blank_row_count = 0					
-							print( 	'Sample data, current row: ', 
-									clean_value(str(str(current_sheet.cell(row = r, column=QPN_col).value).encode(encoding = 'UTF-8',errors = 'strict'))), ' ', 
-									clean_value(str(str(current_sheet.cell(row = r, column=DES_col).value).encode(encoding = 'UTF-8',errors = 'strict'))), ' ', 
-									clean_value(str(str(current_sheet.cell(row = r, column=REF_col).value).encode(encoding = 'UTF-8',errors = 'strict'))), ' ', 
-									clean_value(str(str(current_sheet.cell(row = r, column=QTY_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-								)
-							
-							current_value = clean_value(str(str(current_sheet.cell(row = r, column=QPN_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-							if current_value == "None":
-								current_value = ""
-							qpn.append(current_value)			
-							
-							current_value = clean_value(str(str(current_sheet.cell(row = r, column=DES_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-							if current_value == "None":
-								current_value = ""
-							des.append(current_value)
-							
-							current_value = clean_value(str(str(current_sheet.cell(row = r, column=REF_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-							if current_value == "None":
-								current_value = ""
-							ref.append(current_value)
-							
-							current_value = clean_value(str(str(current_sheet.cell(row = r, column=QTY_col).value).encode(encoding = 'UTF-8',errors = 'strict')))
-							if current_value == "None":
-								current_value = ""
-							qty.append(current_value)
-							
-						if(blank_row_count >= 3):
-							break								# Too many blank rows detected, so break out of the loop.  
-	
-		# ----------------------------------------------------------------------- #
-		# If sheet is valid, and before moving to next file
-		# build the dictionary for the respective BOM
+		# One iterator serves both the header search and the data
+		# extraction, so every row of the sheet is read exactly once
 		# ----------------------------------------------------------------------- #
-
-		if(sheet_valid):
-			# Construct dictionary 
-			if(bom_is_types2):
-				for i in range (0,len(qpn)):				
-					dict_type2_bom[qpn[i]] = (des[i],ref[i],qty[i])
-			else:
-				for i in range (0,len(qpn)):				
-					dict_type1_bom[qpn[i]] = (des[i],ref[i],qty[i])
+		rows = current_sheet.iter_rows(values_only = True)
 
 		# ----------------------------------------------------------------------- #
-		# Lists shall be cleared before moving onto the 
-		# next file, as a different dictionary will need to populated
+		# Read rows until the header is found (first 10 rows only)
 		# ----------------------------------------------------------------------- #
-		qpn.clear()
-		des.clear()
-		ref.clear()
-		qty.clear()
-		
+		with timer.phase("header"):
+			columns, r = classifier.find_header(rows)
+
+		if(r is None):
+			say ("* File: ", str(filename), "Invalid Sheet: ", str(ws[sh]), " -- did not find headers: ", columns)
+			logging.info("Skipping sheet %s, did not find headers: %s", ws[sh], columns)
+			timer.count("sheets_skipped")
+			continue
+
+		QPN_col = columns["QPN"]
+		DES_col = columns["DES"]
+		REF_col = columns["REF"]
+		QTY_col = columns["QTY"]
+		LEVEL_col = columns.get("LEVEL", 0)
+		SUBBOM_col = columns.get("SUBBOM", 0)
+		UOM_col = columns.get("UOM", 0)
+		if(REF_col == 0):
+			logging.info("There is no reference field in this BOM. All other header fields found.")
+		data_start = r + 1			# Plenty of confidence at this point that we've found data start
+		say ("Data appears to start on row: ", data_start)
+		logging.info("Data appears to start on row: %d", data_start)
+
+		say ("QPN column found to be: ", 			str(QPN_col))
+		say ("QTY column found to be: ", 			str(QTY_col))
+		say ("Description column found to be: ", 	str(DES_col))
+		say ("Reference column found to be: ", 		str(REF_col))
+
+		header = [QPN_col,DES_col,REF_col,QTY_col]
+		if(LEVEL_col or SUBBOM_col):
+			say ("Level column found to be: ", 		str(LEVEL_col))
+			say ("Sub-BOM column found to be: ", 	str(SUBBOM_col))
+			logging.info("Multi-level BOM: level column %d, sub-BOM column %d", LEVEL_col, SUBBOM_col)
+			header += [LEVEL_col,SUBBOM_col]
+		if(UOM_col):
+			say ("Unit of measure column found to be: ", 	str(UOM_col))
+			header.append(UOM_col)					# Read last, folded into QTY
+		sheets.append({"name": ws[sh], "columns": columns, "data_start": data_start})
+
+		# The native reader can skip decoding every other column from here on
+		if(hasattr(rows, "select_columns")):
+			rows.select_columns(header)
+
+		with timer.phase("rows"):
+			# Now continue through the remaining rows of the current sheet and populate the data lists
+			blank_row_count = 0		# Reset number of blank rows detected.  When three in a row are detected, break out of the loop.
+			for row in rows:
+				r += 1
+
+				# Each row is read once and only the BOM columns are cleaned
+				values = extract_row(row, header)
+				if(UOM_col):
+					uom = values.pop()
+
+				# If multiple columns are blank, break out of this loop for these are empty cells
+				if(row_is_blank(values)):
+
+					blank_row_count += 1				# Increase value of blank row count
+					if(say_rows):
+						say ("Blank row detected at row (", r, ")")
+
+				else:
+
+					blank_row_count = 0
+					if(say_rows):
+						say ('Sample data, current row: ', values[0], ' ', values[1], ' ', values[2], ' ', values[3])
+
+					if(UOM_col):
+						values[3] = attach_unit(values[3], uom)
+					add_row(tuple(values))
+					row_count += 1
+
+				if(blank_row_count >= BLANK_ROW_LIMIT):
+					break								# Too many blank rows detected, so break out of the loop.
+		timer.count("sheets_read")
+
+	wb.close()											# Read-only workbooks hold the file open until closed
+	timer.count("rows", row_count)
+	logging.info("Read %d rows from %d sheet(s) of %s", row_count, len(sheets), filename)
+
+	return {"file": os.path.basename(filename), "sheets": sheets, "rows": bom_rows}
+
+
+def parser_fingerprint(classifier = None):
+	# Anything that changes what parse_bom() returns for the same workbook
+	classifier = classifier or get_classifier()
+	synonyms = sorted((field, tuple(patterns)) for field, patterns in classifier.synonyms.items())
+	return repr((PARSER_VERSION, synonyms, classifier.fields, classifier.optional, classifier.search_rows, BLANK_ROW_LIMIT))
+
+
+def flatten_table(table, filename, cache = None, classifier = None, reader = None, timer = None):
+	# A multi-level table rolled up into single-level rows (see bom_levels.py),
+	# reading sub-BOM workbooks as needed.  Single-level tables come back as
+	# they are.  Sub-BOM workbooks go through the same cache and reader.
+	if(not is_multilevel(table["sheets"])):
+		return table
+	rows = []
+	flattener = TreeFlattener(rows.append, os.path.dirname(os.path.abspath(filename)),
+							lambda f: read_bom_table(f, False, cache, classifier, reader))
+	with (timer or NULL_TIMER).phase("flatten"):
+		for row in table["rows"]:
+			flattener(row)
+		flattener.finish()
+	logging.info("Flattened %d multi-level lines of %s into %d", len(table["rows"]), filename, len(rows))
+	return dict(table, rows = rows)
+
+
+def bom_dict(table):
+	# Build the (read-only) dictionary of QPN -> (DES, REF, QTY) for this
+	# BOM.  QPNs on several lines are aggregated rather than overwritten.
+	return BomTable.from_rows(table["rows"])
+
+
+def des_column(entries):
+	# QPN -> DES, straight from the columns of a BomTable
+	if(isinstance(entries, BomTable)):
+		des = entries.des
+		return {qpn: des[line] for qpn, line in entries.index.items()}
+	return {key: entry[0] for key, entry in entries.items()}
+
+
+def read_bom_table(filename, verbose = True, cache = None, classifier = None, reader = None, timer = None):
+	# parse_bom(), going through the BomCache when one is given.  An
+	# unchanged workbook then costs a hash and a deserialize instead of a parse.
+	if(cache is None):
+		return parse_bom(filename, verbose, classifier, reader, timer)
+	return cache.get_or_parse(filename, lambda f: parse_bom(f, verbose, classifier, reader, timer), parser_fingerprint(classifier))
+
+
+def read_bom(filename, verbose = True, cache = None, classifier = None):
+	# Returns a BomTable (dictionary of QPN -> (DES, REF, QTY)) built from
+	# every sheet of the workbook that carries a BOM header
+	return bom_dict(flatten_table(read_bom_table(filename, verbose, cache, classifier), filename, cache, classifier))
 
-					
-	# ----------------------------------------------------------------------- #
-	# Main Loop
-	# Dictionaries have been built, and it is now time to compare
-	# between the two BOMs
-	# ----------------------------------------------------------------------- #
 
-	
+# ----------------------------------------------------------------------- #
+# Compare two BOM dictionaries
+# ----------------------------------------------------------------------- #
+def compare_boms(dict_type1_bom, dict_type2_bom):
+	# Returns (matches, only in type 1, only in type 2) as lists of QPNs,
+	# each in the order the QPNs appear in their BOM
+	matches = [key for key in dict_type1_bom if key in dict_type2_bom]
+	only_type1 = [key for key in dict_type1_bom if key not in dict_type2_bom]
+	only_type2 = [key for key in dict_type2_bom if key not in dict_type1_bom]
+	return matches, only_type1, only_type2
+
+
+def print_comparison(dict_type1_bom, type1_bom_description, dict_type2_bom, type2_bom_description, comparison, des_flags = None, qty_deltas = None):
+	matches, only_type1, only_type2 = comparison[:3]
+	des_flags = des_flags or {}
+	if(qty_deltas is None):
+		qty_deltas = quantity_deltas(dict_type1_bom, dict_type2_bom, matches)
+	fuzzy = comparison[3] if len(comparison) > 3 else None
+
 	# ----------------------------------------------------------------------- #
-	# Iterate through every QPN in the Type 1 BOM and 
+	# Iterate through every QPN in the Type 1 BOM and
 	# and compare against Type 2
 	# ----------------------------------------------------------------------- #
 	print("\n\n================================================")
@@ -404,25 +383,36 @@ if __name__ == '__main__':
 	logging.info("================================================")
 	logging.info("================================================")
 	logging.info("All Matches")
-	
-	for key in dict_type1_bom:
-		if(key in dict_type2_bom):
-			print("QPN: ", key, " -- in ",type1_bom_description," and ",type2_bom_description, " BOM.")
-			
-			print("\tType 1/Type 2 DES:\t", dict_type1_bom[key][0]," | ",dict_type2_bom[key][0])
-			print("\tType 1/Type 2 QTY:\t", dict_type1_bom[key][2]," | ",dict_type2_bom[key][2])
-			print("\tType 1/Type 2 REF:\t", dict_type1_bom[key][1]," | ",dict_type2_bom[key][1])
-		
+
+	for key, qty_delta in zip(matches, qty_deltas):
+		entry1 = dict_type1_bom[key]
+		entry2 = dict_type2_bom[key]
+		print("QPN: ", key, " -- in ",type1_bom_description," and ",type2_bom_description, " BOM.")
+
+		print("\tType 1/Type 2 DES:\t", entry1[0]," | ",entry2[0])
+		if(key in des_flags):
+			print("\t** Descriptions differ (similarity ", des_flags[key], ")")
+		print("\tType 1/Type 2 QTY:\t", entry1[2]," | ",entry2[2])
+		if(qty_delta == qty_delta) and (qty_delta != 0):
+			print("\t** QTY changed by ", ("+" if qty_delta > 0 else "") + format_quantity(qty_delta, quantity_unit(entry2[2]) or quantity_unit(entry1[2])))
+		print("\tType 1/Type 2 REF:\t", entry1[1]," | ",entry2[1])
+
+		# Designators compared as sets, so "R1-R3" and "R1,R2,R3" agree
+		only1, only2, check1, check2 = ref_delta(entry1, entry2)
+		if(only1 or only2):
+			print("\tREF only in Type 1/Type 2:\t", only1," | ",only2)
+		if(check1 or check2):
+			print("\tREF count vs QTY Type 1/Type 2:\t", check1," | ",check2)
+
 	print("\n================================================")
 	print("================================================")
 	print("In ",type1_bom_description,", but not in ",type2_bom_description," BOM" )
 	logging.info("================================================")
 	logging.info("================================================")
-	logging.info("In " + str(type1_bom_description) + ", but not in " + str(type2_bom_description) + " BOM" )
-		
-	for key in dict_type1_bom:
-		if (key not in dict_type2_bom):
-			print("QPN ", key, " -- in ",type1_bom_description," but not in ",type2_bom_description, " BOM.")
+	logging.info("In %s, but not in %s BOM", type1_bom_description, type2_bom_description)
+
+	for key in only_type1:
+		print("QPN ", key, " -- in ",type1_bom_description," but not in ",type2_bom_description, " BOM.")
 
 
 	print("\n================================================")
@@ -430,140 +420,425 @@ if __name__ == '__main__':
 	print("In ",type2_bom_description," but not in ",type1_bom_description," BOM")
 	logging.info("================================================")
 	logging.info("================================================")
-	logging.info("In " + str(type2_bom_description) + " but not in " + str(type1_bom_description) + " BOM")
+	logging.info("In %s but not in %s BOM", type2_bom_description, type1_bom_description)
+
+	for key in only_type2:
+		print("QPN: ", key, " -- is in ", type2_bom_description, ", but NOT in ", type1_bom_description)
+
+	if(fuzzy):
+		print("\n================================================")
+		print("================================================")
+		print("Possible matches (QPNs that look alike)")
+		logging.info("Possible matches: %d", len(fuzzy))
+
+		for key1, key2, score in fuzzy:
+			print("QPN: ", key1, " in ", type1_bom_description, " looks like ", key2, " in ", type2_bom_description, " (score ", score, ")")
 
-	for key in dict_type2_bom:
-		if(key not in dict_type1_bom):
-			print("QPN: ", key, " -- is in ", type2_bom_description, ", but NOT in ", type1_bom_description)
-			
 	print("\n")
-	
-	
-	
-	# ----------------------------------------------------------------------- #
-	# Create the comparison BOM
-	# ----------------------------------------------------------------------- #
-	print("\n================================================")
-	print("================================================")
-	print("Creating comparison BOM")
+
+
+# ----------------------------------------------------------------------- #
+# Create the comparison BOM
+# ----------------------------------------------------------------------- #
+def write_comparison(dict_type1_bom, type1_bom_description, dict_type2_bom, type2_bom_description, comparison, filename = RESULTS_FILE, des_flags = None,
+					qty_deltas = None, qty_changes_only = False):
+	# filename may be a single output or a list of them.  The format of each
+	# (.xlsx, .csv, .json or .jsonl) comes from its extension, and every output is
+	# streamed row by row in one pass over the comparison.
+	# qty_changes_only -- only write the matched QPNs whose QTY changed
+	filenames = [filename] if isinstance(filename, str) else list(filename)
+
 	logging.info("================================================")
 	logging.info("================================================")
-	logging.info("Creating comparison BOM")
-	
-	NewBook = Workbook()
-	NewSheet = NewBook.active
-	NewSheet.title = "Comparison Data"
+	logging.info("Creating comparison BOM: %s", ", ".join(filenames))
+
+	writers = []
+	try:
+		for name in filenames:
+			writers.append(open_writer(name, type1_bom_description, type2_bom_description))
+		stream_comparison(writers, dict_type1_bom, dict_type2_bom, comparison, des_flags, qty_deltas, qty_changes_only)
+	finally:
+		for writer in writers:
+			writer.close()
+
+
+# ----------------------------------------------------------------------- #
+# Library API
+#
+#	bom1 = Bom.load("A01.xlsx", "A01")
+#	bom2 = Bom.load("A02.xlsx", "A02")
+#	result = compare(bom1, bom2)
+#	result.render("Comparison_Results.xlsx")
+#
+# Nothing here touches module state, so BOMs can be loaded and compared
+# from any number of threads at once.
+# ----------------------------------------------------------------------- #
+class Bom:
+	# A parsed BOM.  entries is a BomTable, which maps QPN -> (DES, REF, QTY)
+	# and keeps every line of the BOM (see bom_table.py).
+
+	def __init__(self, table, label = None):
+		self.source = table.get("file", "")
+		self.sheets = table.get("sheets", [])
+		self.label = label or os.path.splitext(self.source)[0] or "BOM"
+		self.entries = bom_dict(table)
+
+	@property
+	def rows(self):
+		# Every (QPN, DES, REF, QTY) line in sheet order
+		return list(self.entries.rows())
+
+	@classmethod
+	def load(cls, filename, label = None, cache = None, classifier = None, reader = None, verbose = False, timer = None):
+		# classifier -- a bom_header.HeaderClassifier, for callers that need
+		# their own header synonyms without touching the shared table
+		# timer -- a bom_timing.PhaseTimer to collect per-phase timings
+		table = read_bom_table(filename, verbose, cache, classifier, reader, timer)
+		table = flatten_table(table, filename, cache, classifier, reader, timer)
+		with (timer or NULL_TIMER).phase("table"):
+			return cls(table, label)
+
+	@classmethod
+	def from_rows(cls, rows, label = "BOM"):
+		# Build a BOM from (QPN, DES, REF, QTY) rows that are already in memory
+		return cls({"file": "", "sheets": [], "rows": [tuple(clean_cell(v) for v in row) for row in rows]}, label)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, qpn):
+		return qpn in self.entries
+
+	def __getitem__(self, qpn):
+		return self.entries[qpn]
+
+	def __iter__(self):
+		return iter(self.entries)
+
+
+class BomComparison:
+	# Result of comparing two BOMs.  matches / only1 / only2 are lists of
+	# QPNs in BOM order, qty_deltas the QTY change of every match (an array
+	# in the order of matches, NaN where a QTY isn't a number).
+
+	def __init__(self, bom1, bom2, timer = None, fuzzy = None, des_scorer = None):
+		# fuzzy -- a bom_fuzzy.FuzzyMatcher (or True for the default one) to
+		# propose pairs among the QPNs only one BOM lists
+		# des_scorer -- a bom_desc.DescriptionScorer, i.e. one sharing its
+		# vocabulary through the BomCache (default: a fresh one)
+		self.bom1 = bom1
+		self.bom2 = bom2
+		self.timer = timer or NULL_TIMER
+		self.matcher = (FuzzyMatcher() if fuzzy is True else fuzzy) or None
+		self.scorer = des_scorer or DescriptionScorer()
+		with self.timer.phase("compare"):
+			self.matches, self.only1, self.only2 = compare_boms(bom1.entries, bom2.entries)
+		with self.timer.phase("quantity"):
+			self.qty_deltas = quantity_deltas(bom1.entries, bom2.entries, self.matches)
+		self.fuzzy = []			# (bom1 QPN, bom2 QPN, score)
+		if(self.matcher is not None):
+			with self.timer.phase("fuzzy"):
+				self.fuzzy = self.matcher.match(self.only1, self.only2)
+
+		# Matched QPNs whose descriptions disagree -> DES similarity
+		with self.timer.phase("describe"):
+			self.des_flags = self.scorer.flag(self.des_pairs(self.matches))
+
+	def des_pairs(self, keys):
+		entries1 = self.bom1.entries
+		entries2 = self.bom2.entries
+		return ((key, entries1[key][0], entries2[key][0]) for key in keys)
+
+	def update(self, bom1 = None, bom2 = None):
+		# Re-diff after one (or both) of the BOMs changed, i.e. a workbook
+		# saved again during a BOM scrub.  The key sets are compared again
+		# (a few set lookups per QPN), but DES pairs are only scored again
+		# for QPNs whose DES changed or that are newly matched, and fuzzy
+		# pairs are only searched again when the unmatched QPNs changed.
+		old1 = self.bom1.entries
+		old2 = self.bom2.entries
+		old_matches = set(self.matches)
+		old_only = (self.only1, self.only2)
+		self.bom1 = bom1 or self.bom1
+		self.bom2 = bom2 or self.bom2
+		new1 = self.bom1.entries
+		new2 = self.bom2.entries
+		with self.timer.phase("compare"):
+			self.matches, self.only1, self.only2 = compare_boms(new1, new2)
+			changed = [(des_column(old), des_column(new)) for old, new in ((old1, new1), (old2, new2)) if new is not old]
+			rescore = [key for key in self.matches
+						if (key not in old_matches) or any(new_des[key] != old_des[key] for old_des, new_des in changed)]
+		with self.timer.phase("quantity"):
+			self.qty_deltas = quantity_deltas(new1, new2, self.matches)
+		if(self.matcher is not None) and ((self.only1, self.only2) != old_only):
+			with self.timer.phase("fuzzy"):
+				self.fuzzy = self.matcher.match(self.only1, self.only2)
+		with self.timer.phase("describe"):
+			matched = set(self.matches)
+			des_flags = {key: score for key, score in self.des_flags.items() if key in matched}
+			for key in rescore:
+				des_flags.pop(key, None)
+			des_flags.update(self.scorer.flag(self.des_pairs(rescore)))
+			self.des_flags = des_flags
+		return self
+
+	def sections(self):
+		return (self.matches, self.only1, self.only2)
+
+	def output_sections(self):
+		# sections(), plus the fuzzy pairs when there are any
+		if(self.fuzzy):
+			return self.sections() + (self.fuzzy,)
+		return self.sections()
+
+	def summary(self):
+		return {"label1": self.bom1.label, "label2": self.bom2.label,
+				"rows1": len(self.bom1), "rows2": len(self.bom2),
+				"matched": len(self.matches), "only1": len(self.only1), "only2": len(self.only2), "fuzzy": len(self.fuzzy),
+				"des_flagged": len(self.des_flags), "qty_changed": len(self.quantity_changes())}
+
+	def quantity_changes(self):
+		# (QPN, QTY delta) of the matched QPNs whose QTY changed; the delta is
+		# NaN where a QTY isn't a number (and the QTY texts differ)
+		entries1 = self.bom1.entries
+		entries2 = self.bom2.entries
+		return [(key, qty_delta) for key, qty_delta in zip(self.matches, self.qty_deltas)
+				if quantity_changed(qty_delta, entries1[key][2], entries2[key][2])]
+
+	def records(self):
+		# One dictionary per QPN, section by section
+		for section, keys in zip(SECTIONS, self.sections()):
+			deltas = self.qty_deltas if section == SECTION_MATCH else repeat(NAN)
+			for key, qty_delta in zip(keys, deltas):
+				record = {"section": section, "qpn": key,
+						"bom1": self.bom1.entries.get(key), "bom2": self.bom2.entries.get(key)}
+				if(key in self.des_flags) and (section == SECTION_MATCH):
+					record["des_score"] = self.des_flags[key]
+				if(qty_delta == qty_delta):
+					record["qty_delta"] = qty_delta
+				yield record
+		for key1, key2, score in self.fuzzy:
+			yield {"section": SECTION_FUZZY, "qpn": key1, "matched_qpn": key2, "score": score,
+					"bom1": self.bom1.entries.get(key1), "bom2": self.bom2.entries.get(key2)}
+
+	def designator_changes(self):
+		# (QPN, designators only in bom1, only in bom2) for every matched QPN
+		# whose REF sets differ; the sets are bom_refdes.RefSet
+		for key in self.matches:
+			ref1 = self.bom1.entries[key][1]
+			ref2 = self.bom2.entries[key][1]
+			if(ref1 != ref2):
+				only1, only2 = diff_designators(ref1, ref2)
+				if(only1 or only2):
+					yield key, only1, only2
+
+	def render(self, filename = RESULTS_FILE, qty_changes_only = False):
+		# Write the result; .xlsx, .csv, .json or .jsonl (or a list of file names).
+		# qty_changes_only leaves out the matched QPNs whose QTY is unchanged.
+		with self.timer.phase("write"):
+			write_comparison(self.bom1.entries, self.bom1.label, self.bom2.entries, self.bom2.label, self.output_sections(), filename, self.des_flags,
+							self.qty_deltas, qty_changes_only)
+
+	def print(self):
+		print_comparison(self.bom1.entries, self.bom1.label, self.bom2.entries, self.bom2.label, self.output_sections(), self.des_flags, self.qty_deltas)
+
+
+def load_bom(filename, label = None, **kwargs):
+	return Bom.load(filename, label, **kwargs)
+
+
+def compare(bom1, bom2, timer = None, fuzzy = None, des_scorer = None):
+	return BomComparison(bom1, bom2, timer, fuzzy, des_scorer)
+
+
+def fuzzy_matcher(threshold = None, rules_file = RULES_FILE):
+	# FuzzyMatcher with the site specific normalization rules, if any
+	rules = load_rules_file(rules_file) if os.path.isfile(rules_file) else None
+	if(threshold is None):
+		return FuzzyMatcher(rules)
+	return FuzzyMatcher(rules, threshold)
+
+
+#******************************************************************************
+#******************************  ---MAIN---  **********************************
+#******************************************************************************
+def parse_args(argv = None):
+	parser = argparse.ArgumentParser(description = "Compare the two BOM workbooks in the current directory.")
+	parser.add_argument("-q", "--quiet", action = "store_true", help = "No console output besides the prompts")
+	parser.add_argument("-v", "--verbose", action = "store_true", help = "Also print every row read (slow on large BOMs)")
+	parser.add_argument("--log-level", default = LOG_LEVEL, choices = ["DEBUG", "INFO", "WARNING", "ERROR"],
+						help = "Level of " + LOG_FILE + " (default: " + LOG_LEVEL + ")")
+	parser.add_argument("--fuzzy", action = "store_true", help = "Propose pairs of near-miss QPNs (revision suffixes, leading zeros, typos)")
+	parser.add_argument("--fuzzy-threshold", type = float, default = None, help = "Lowest score of a proposed pair (0..1)")
+	parser.add_argument("--des-threshold", type = float, default = DES_THRESHOLD, help = "Flag matched QPNs whose DES similarity is below this (0..1)")
+	parser.add_argument("--qty-changes-only", action = "store_true",
+						help = "Leave the matched QPNs whose QTY is unchanged out of " + RESULTS_FILE)
+	parser.add_argument("--external-rows", type = int, default = EXTERNAL_ROWS,
+						help = "Compare out of core (sorted runs on disk) above this many BOM lines, 0 = never")
+	parser.add_argument("--index", default = None, help = "Also store the parsed BOMs in this SQLite part index (see bom_index.py)")
+	parser.add_argument("--report", default = None, help = "Write the end-of-run report (JSON) to this file")
+	parser.add_argument("--profile", default = None, help = "Dump cProfile stats of the run to this file")
+	parser.add_argument("--tracemalloc", action = "store_true", help = "Record the Python heap peak and top allocation sites")
+	return parser.parse_args(argv)
+
+
+def main(argv = None):
+	import bom_external					# Builds on this module, so only imported here
+
+	args = parse_args(argv)
+	verbosity = VERBOSE_QUIET if args.quiet else (VERBOSE_ROWS if args.verbose else VERBOSE_NORMAL)
+	setup_logging(level = args.log_level)
+	timer = PhaseTimer()
+	profiler = RunProfiler(args.profile, args.tracemalloc)
+
+	# ----------------------------------------------------------------------- #
+	# Iterate through files and delete
+	# existing comparison BOMs and log files if they exist
+	# ----------------------------------------------------------------------- #
+
+	path = os.getcwd()
+	for (path, dirs, files) in os.walk(path):
+		path
+		dirs
+		files
+		break								# Only this directory, not i.e. a folder of sub-BOM workbooks
+
+	for i in range(len(files)):
+		if(files[i].find("Comparison") != -1):
+			logging.info("Deleting existing comparison BOM.")
+			os.remove(files[i])
 
 	# ----------------------------------------------------------------------- #
-	# Format column widths
+	# Some file may have been removed, so refresh
+	# directory information.
 	# ----------------------------------------------------------------------- #
-	NewSheet.column_dimensions['A'].width = 25			# QPN
-	NewSheet.column_dimensions['B'].width = 25
-	NewSheet.column_dimensions['C'].width = 5			# Dash
-	NewSheet.column_dimensions['D'].width = 50			# Description
-	NewSheet.column_dimensions['E'].width = 50			
-	NewSheet.column_dimensions['F'].width = 5			# Dash
-	NewSheet.column_dimensions['G'].width = 30			# REF
-	NewSheet.column_dimensions['H'].width = 30			
-	NewSheet.column_dimensions['I'].width = 5			# Dash
-	NewSheet.column_dimensions['J'].width = 15			# QTY
-	NewSheet.column_dimensions['K'].width = 15
-	
-	
-	comparison_bom_header = [ 	str(type2_bom_description) + " QPN", str(type1_bom_description) + " QPN","-",
-								str(type2_bom_description) + " DES", str(type1_bom_description) + " DES","-",
-								str(type2_bom_description) + " REF", str(type1_bom_description) + " REF","-",
-								str(type2_bom_description) + " QTY", str(type1_bom_description) + " QTY"]
-	comparison_bom_col_offsets = {"T2_QPN":1,"T1_QPN":2,"T2_DES":4,"T1_DES":5,"T2_REF":7,"T1_REF":8,"T2_QTY":10,"T1_QTY":11}
-	current_row_counter = 1
+	path = os.getcwd()
+	for (path, dirs, files) in os.walk(path):
+		path
+		dirs
+		files
+		break								# Only this directory, not i.e. a folder of sub-BOM workbooks
+
+	if(verbosity):
+		print ("Files found in directory: ", str(len(files)))
+		print ("File names: ", files)
+	logging.info("Files found in directory: %d", len(files))
+	for i in range(len(files)):
+		logging.info("File %d) %s", i, files[i])
+
+	load_header_synonyms()
+	cache = BomCache()					# Set COMPARE_BOM_NO_CACHE=1 to bypass
+
+	type1_bom_description	= ""		# A short string to identify BOM of type 1 (i.e. "A01" or "ENG")
+	type2_bom_description	= ""		# A short string to identify BOM of type 1 (i.e. "A02" or "IFS")
+	type1_bom	= Bom.from_rows([], "")
+	type2_bom	= Bom.from_rows([], "")
+
 	# ----------------------------------------------------------------------- #
-	# Write the header values -- first column
-	# starts at 0, not 1
+	# Only open files having the proper extension (.xlsx, .csv, .tsv)
 	# ----------------------------------------------------------------------- #
-	for i in range (1,len(comparison_bom_header)+1):
-		NewSheet.cell(row=current_row_counter,column=i).value = comparison_bom_header[i-1]
-	current_row_counter = current_row_counter + 1 
-	
+	bom_files = [f for f in files if is_bom_file(f)]
+	if(len(bom_files) > 2):
+		print("**Too many BOM files detected, now exiting.")
+		print("**Use bom_nway.py to line up more than two BOMs (i.e. python bom_nway.py .)")
+		logging.info("**Too many BOM files detected, now exiting.  ")
+		exit()
+
 	# ----------------------------------------------------------------------- #
-	# Iterate through every QPN in the ENG BOM
-	# and compare against IFS
+	# Two large BOMs are parsed side by side in worker processes, started
+	# before the descriptions are asked for.  Printing every row, profiling
+	# and small BOMs (not worth starting processes for) stay in this process.
 	# ----------------------------------------------------------------------- #
-	logging.info("================================================")
-	logging.info("Writing to BOM the components that match")
-	
-	NewSheet.cell(row=current_row_counter,column=1).value = ("These QPNs match between " + type2_bom_description + " and " + type1_bom_description)
-	current_row_counter = current_row_counter + 1 
-	
-	for key in dict_type1_bom:
-		if(key in dict_type2_bom):
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_QPN"]).value = key
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_QPN"]).value = key
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_DES"]).value = dict_type2_bom[key][0]
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_DES"]).value = dict_type1_bom[key][0]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_REF"]).value = dict_type2_bom[key][1]
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_REF"]).value = dict_type1_bom[key][1]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_QTY"]).value = dict_type2_bom[key][2]
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_QTY"]).value = dict_type1_bom[key][2]
-			
-			current_row_counter = current_row_counter + 1 
-			
-	current_row_counter = current_row_counter + 2 
-			
-			
+	loader = None
+	pending = []
+	if(len(bom_files) == 2) and (verbosity < VERBOSE_ROWS) and (not args.profile) and (not args.tracemalloc) \
+			and (min(os.path.getsize(f) for f in bom_files) >= CONCURRENT_BYTES):
+		import bom_batch
+		logging.info("Parsing %s concurrently", " and ".join(bom_files))
+		loader = bom_batch.ConcurrentLoader(2, os.path.abspath(SYNONYM_FILE) if os.path.isfile(SYNONYM_FILE) else None,
+											use_cache = cache.enabled, external_rows = args.external_rows, timer = timer)
+		pending = [loader.submit(os.path.abspath(f)) for f in bom_files]
+
 	# ----------------------------------------------------------------------- #
-	# Iterate through every QPN in the ENG BOM
-	# and compare against IFS
+	# Determine BOM Origin (ENG or IFS)
 	# ----------------------------------------------------------------------- #
-	logging.info("================================================")
-	logging.info("Writing to BOM the components in " + str(type1_bom_description) + " BOM but not in " + str(type2_bom_description))
-	
-	NewSheet.cell(row=current_row_counter,column=1).value = ("These QPNs are in " + type1_bom_description + " but NOT in " + type2_bom_description)
-	current_row_counter = current_row_counter + 1 
-	
-	for key in dict_type1_bom:
-		if (key not in dict_type2_bom):
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_QPN"]).value = key
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_DES"]).value = dict_type1_bom[key][0]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_REF"]).value = dict_type1_bom[key][1]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T1_QTY"]).value = dict_type1_bom[key][2]
-	
-			current_row_counter = current_row_counter + 1 
-	
-	current_row_counter = current_row_counter + 2 
+	descriptions = []
+	for i in range(len(bom_files)):
+		if(i == 0):
+			descriptions.append(input("Enter a short description for this BOM (i.e. \"ENG\"): ").strip())
+		else:
+			descriptions.append(input("Enter a short description for this BOM (i.e. \"IFS\"):" ).strip())
+
+	boms = []
+	for i in range(len(bom_files)):
+		if(loader):
+			with profiler:
+				bom = loader.result(pending[i])
+			bom.label = descriptions[i] or bom.label
+			if(verbosity):
+				if(isinstance(bom, bom_external.ExternalBom)):
+					print("Parsed " + bom_files[i] + " (" + bom.label + "): " + str(bom.lines) + " lines, out of core")
+				else:
+					print("Parsed " + bom_files[i] + " (" + bom.label + "): " + str(len(bom)) + " QPNs")
+		else:
+			with profiler:
+				bom = bom_external.load(bom_files[i], descriptions[i], cache = cache, verbose = verbosity, timer = timer,
+										threshold = args.external_rows)
+		boms.append(bom)
+	if(loader):
+		loader.close()
+	if(len(boms) > 0):
+		type1_bom_description = descriptions[0]
+		type1_bom = boms[0]
+	if(len(boms) > 1):
+		type2_bom_description = descriptions[1]
+		type2_bom = boms[1]
 
+	# ----------------------------------------------------------------------- #
+	# Keep the parsed BOMs for later queries (bom_index.py)
+	# ----------------------------------------------------------------------- #
+	if(args.index):
+		import bom_index
+		with profiler, timer.phase("index"):
+			with bom_index.BomIndex(args.index) as index:
+				for i in range(len(boms)):
+					bom_id, added = index.add(boms[i], bom_files[i])
+					logging.info("%s %s as id %d in %s", "Indexed" if added else "Already indexed", bom_files[i], bom_id, args.index)
 
 	# ----------------------------------------------------------------------- #
-	# Iterate through every QPN in the IFS BOM
-	# and compare against ENG
+	# Main Loop
+	# BOMs have been built, and it is now time to compare
+	# between the two BOMs
 	# ----------------------------------------------------------------------- #
-	logging.info("================================================")
-	logging.info("Writing to BOM the components in " + str(type2_bom_description) + " BOM but not in " + str(type1_bom_description))
-	
-	NewSheet.cell(row=current_row_counter,column=1).value = ("These QPNs are in " + type2_bom_description + " but NOT in " + type1_bom_description)
-	current_row_counter = current_row_counter + 1 
-	
-	for key in dict_type2_bom:
-		if(key not in dict_type1_bom):
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_QPN"]).value = key
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_DES"]).value = dict_type2_bom[key][0]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_REF"]).value = dict_type2_bom[key][1]
-			
-			NewSheet.cell(row=current_row_counter,column=comparison_bom_col_offsets["T2_QTY"]).value = dict_type2_bom[key][2]
-	
-			current_row_counter = current_row_counter + 1 
-	
+	with profiler:
+		des_scorer = DescriptionScorer(cache, args.des_threshold)
+		result = bom_external.compare(type1_bom, type2_bom, timer, fuzzy_matcher(args.fuzzy_threshold) if args.fuzzy else None, des_scorer)
+		if(verbosity):
+			with timer.phase("print"):
+				result.print()
+
+			print("\n================================================")
+			print("================================================")
+			print("Creating comparison BOM")
+		result.render(RESULTS_FILE, args.qty_changes_only)
+		des_scorer.save()
+		if(verbosity) and isinstance(result, bom_external.ExternalComparison):
+			result.print()					# Out of core the totals are only known now
+	profiler.close()
+
 	# ----------------------------------------------------------------------- #
-	# Close comparison workbook
+	# End-of-run report
 	# ----------------------------------------------------------------------- #
-	NewBook.save(filename = "Comparison_Results.xlsx")
+	report = run_report(timer, profiler = profiler)
+	logging.info("Run report: %s", report)
+	if(verbosity):
+		print ("\n")
+		print (format_report(report))
+	if(args.report):
+		write_report(report, args.report)
 	print ("\n")
-	null=input("Press any key to close...")
\ No newline at end of file
+	null=input("Press any key to close...")
+
+
+if __name__ == '__main__':
+	main()
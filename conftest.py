@@ -0,0 +1,29 @@
+"""Shared fixtures of the tests: small BOMs written into the test's tmp_path."""
+import pytest
+
+
+@pytest.fixture
+def write_bom(tmp_path):
+	# write_bom(name, rows, header) -> path of a CSV BOM export
+	def write(name, rows, header = "QPN,DES,REF,QTY"):
+		path = tmp_path / name
+		path.write_text(header + "\n" + "".join(",".join(str(v) for v in row) + "\n" for row in rows))
+		return str(path)
+	return write
+
+
+@pytest.fixture
+def save_workbook(tmp_path):
+	# save_workbook(name, {sheet name: rows}) -> path of an .xlsx workbook
+	def save(name, sheets):
+		from openpyxl import Workbook
+		book = Workbook()
+		book.remove(book.active)
+		for title, rows in sheets.items():
+			sheet = book.create_sheet(title)
+			for row in rows:
+				sheet.append(list(row))
+		path = str(tmp_path / name)
+		book.save(path)
+		return path
+	return save
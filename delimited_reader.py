@@ -0,0 +1,165 @@
+"""
+FILE: delimited_reader.py
+
+PURPOSE:
+Streaming reader for delimited text BOMs (CSV / TSV ERP exports), used
+by compare_bom_xlsx.py next to the xlsx reader.
+
+The file is presented as a workbook with one sheet, through the same
+small part of the openpyxl read-only API as xlsx_native (sheetnames,
+wb[name].iter_rows(values_only=True), close()), so the header detection
+and blank row termination of parse_bom() apply unchanged.  Rows are read
+lazily from the open file one at a time; the file is never loaded whole.
+
+The encoding is sniffed from the first block of the file: a byte order
+mark wins, then UTF-16 without one (NUL bytes), then UTF-8, and finally
+Windows-1252 (what Excel and most ERP systems write on Windows).  The
+delimiter comes from an Excel "sep=" first line, the .tsv extension or
+csv.Sniffer, in that order.
+
+AUTHOR:
+Clinton G.
+
+"""
+import codecs
+import csv
+import logging
+import os
+import re
+
+SNIFF_BYTES		= 64 * 1024
+DELIMITERS		= ",\t;|"
+EXTENSIONS		= (".CSV", ".TSV", ".TAB")
+CONTROL_RE		= re.compile("[\x00-\x08\x0e-\x1f\x7f-\x9f]")	# Never in text, apart from tabs and line breaks
+
+BOMS = [
+	(codecs.BOM_UTF32_LE,	"utf-32"),			# Before UTF-16 LE, which it starts with
+	(codecs.BOM_UTF32_BE,	"utf-32"),
+	(codecs.BOM_UTF8,		"utf-8-sig"),
+	(codecs.BOM_UTF16_LE,	"utf-16"),
+	(codecs.BOM_UTF16_BE,	"utf-16"),
+]
+
+
+def is_delimited(filename):
+	return filename.upper().endswith(EXTENSIONS)
+
+
+# -------------------------------------- #
+# Sniffing
+# -------------------------------------- #
+def sniff_encoding(sample):
+	# Encoding of a file from its first bytes
+	for mark, encoding in BOMS:
+		if sample.startswith(mark):
+			return encoding
+	if sample and sample.count(b"\x00") > len(sample) // 4:
+		# UTF-16 without a byte order mark: ASCII text has every other byte NUL
+		return "utf-16-le" if sample[1::2].count(b"\x00") > sample[0::2].count(b"\x00") else "utf-16-be"
+	try:
+		sample.decode("utf-8")
+		return "utf-8"
+	except UnicodeDecodeError as e:
+		if e.start >= len(sample) - 3:
+			return "utf-8"							# Only a character cut in two by the sample end
+	try:
+		sample.decode("cp1252")
+		return "cp1252"
+	except UnicodeDecodeError:
+		return "latin-1"
+
+def is_text(sample):
+	# Whether the first bytes of a file could be a delimited export: once
+	# decoded, no control characters other than tabs and line breaks
+	return not CONTROL_RE.search(sample.decode(sniff_encoding(sample), errors = "ignore"))
+
+def sniff_dialect(text, filename):
+	# (csv dialect, lines to skip) for the first block of decoded text
+	first = text.split("\n", 1)[0].strip()
+	if first.lower().startswith("sep=") and len(first) == 5:
+		return delimited_dialect(first[4]), 1
+	if filename.upper().endswith((".TSV", ".TAB")):
+		return csv.excel_tab, 0
+	# Only whole lines are given to the sniffer, and only its delimiter is
+	# used: its quoting guesses are unreliable, and exports quote like Excel
+	if "\n" in text:
+		text = text[:text.rindex("\n")]
+	try:
+		delimiter = csv.Sniffer().sniff(text, delimiters = DELIMITERS).delimiter
+	except csv.Error:
+		return csv.excel, 0
+	return delimited_dialect(delimiter), 0
+
+def delimited_dialect(delimiter):
+	return type("Delimited", (csv.excel,), {"delimiter": delimiter})
+
+
+# ----------------------------------------------------------------------- #
+# Workbook / sheet / rows
+# ----------------------------------------------------------------------- #
+class DelimitedRows:
+
+	def __init__(self, sheet):
+		self._file = open(sheet.filename, newline = "", encoding = sheet.encoding, errors = "replace")
+		self._reader = csv.reader(self._file, sheet.dialect)
+		for i in range(sheet.skip_lines):
+			next(self._reader, None)
+
+	def select_columns(self, columns):
+		# Every field of a line is split anyway; nothing to skip
+		pass
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		try:
+			return next(self._reader)
+		except StopIteration:
+			self.close()
+			raise
+
+	def close(self):
+		if not self._file.closed:
+			self._file.close()
+
+
+class DelimitedSheet:
+
+	def __init__(self, workbook, title):
+		self._workbook = workbook
+		self.title = title
+		self.filename = workbook.filename
+		self.encoding = workbook.encoding
+		self.dialect = workbook.dialect
+		self.skip_lines = workbook.skip_lines
+
+	def iter_rows(self, values_only = True):
+		rows = DelimitedRows(self)
+		self._workbook._open_rows.append(rows)
+		return rows
+
+
+class DelimitedWorkbook:
+
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, "rb") as f:
+			sample = f.read(SNIFF_BYTES)
+		self.encoding = sniff_encoding(sample)
+		text = sample.decode(self.encoding, errors = "ignore").replace("\r\n", "\n")
+		self.dialect, self.skip_lines = sniff_dialect(text, filename)
+		logging.info("Reading %s as %s, delimiter %r", filename, self.encoding, self.dialect.delimiter)
+		self.sheetnames = [os.path.splitext(os.path.basename(filename))[0]]
+		self._sheet = DelimitedSheet(self, self.sheetnames[0])
+		self._open_rows = []
+
+	def __getitem__(self, name):
+		if name != self._sheet.title:
+			raise KeyError(name)
+		return self._sheet
+
+	def close(self):
+		for rows in self._open_rows:
+			rows.close()
+		self._open_rows = []
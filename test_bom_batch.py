@@ -0,0 +1,64 @@
+"""Tests of batch mode and the BOM loaders (bom_batch.py)."""
+import json
+import logging
+
+import bom_batch
+import bom_header
+
+
+def test_read_manifest_and_outputs(tmp_path):
+	manifest = tmp_path / "manifest.csv"
+	manifest.write_text("bom1,label1,bom2,label2\nA01.csv,ENG,A02.csv,IFS\nA01.csv,ENG,A02.csv,IFS\nB01.csv,,B02.csv,\n")
+	pairs = bom_batch.assign_outputs(bom_batch.read_manifest(str(manifest)), str(tmp_path / "out"), ["xlsx", "csv"])
+	assert pairs[0]["bom1"] == str(tmp_path / "A01.csv")
+	assert pairs[2]["label1"] == "B01"
+	outputs = [pair["output"] for pair in pairs]
+	assert len(set(outputs)) == 3
+	assert pairs[0]["outputs"][1].endswith("Comparison_ENG_vs_IFS.csv")
+
+
+def test_in_process_load_has_no_side_effects(tmp_path, write_bom):
+	# A site specific "Part Number" header, through a synonym file
+	synonyms = tmp_path / "synonyms.csv"
+	synonyms.write_text("QPN,PART.?NUMBER\n")
+	file1 = write_bom("A01.csv", [("100-1", "RES", "R1", "1")], "Part Number,DES,REF,QTY")
+	file2 = write_bom("A02.csv", [("100-1", "RES", "R1", "2"), ("100-2", "CAP", "C1", "1")], "Part Number,DES,REF,QTY")
+	handlers = list(logging.getLogger().handlers)
+	shared = {field: list(patterns) for field, patterns in bom_header.HEADER_SYNONYMS.items()}
+
+	boms = bom_batch.load_boms([file1, file2], ["ENG", None], workers = 1, synonym_file = str(synonyms), use_cache = False)
+	assert [bom.label for bom in boms] == ["ENG", "A02"]
+	assert sorted(boms[1].entries) == ["100-1", "100-2"]
+
+	assert logging.getLogger().handlers == handlers
+	assert bom_header.HEADER_SYNONYMS == shared
+	assert (bom_batch.worker_cache, bom_batch.worker_index) == (None, None)
+
+
+def test_run_batch(tmp_path, write_bom):
+	write_bom("A01.csv", [("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "1")])
+	write_bom("A02.csv", [("100-1", "RES", "R1,R2", "2"), ("100-3", "LED", "D1", "1")])
+	manifest = tmp_path / "manifest.json"
+	manifest.write_text(json.dumps({"pairs": [{"bom1": "A01.csv", "bom2": "A02.csv"}, {"bom1": "A01.csv", "bom2": "missing.csv"}]}))
+	pairs = bom_batch.assign_outputs(bom_batch.read_manifest(str(manifest)), str(tmp_path), ["csv"])
+	results = bom_batch.run_batch(pairs, workers = 2, use_cache = False, progress = lambda text: None,
+								index_file = str(tmp_path / "index.sqlite"))
+	assert [result["status"] for result in results] == ["ok", "error"]
+	assert (results[0]["matched"], results[0]["only1"], results[0]["only2"], results[0]["qty_changed"]) == (1, 1, 1, 1)
+	assert results[0]["index_error"] == ""
+	assert "FileNotFoundError" in results[1]["error"]
+
+	bom_batch.write_summary(results, str(tmp_path / "summary"))
+	summary = json.load(open(str(tmp_path / "summary.json")))
+	assert (summary["pairs"], summary["succeeded"], summary["failed"]) == (2, 1, 1)
+
+
+def test_concurrent_load_matches_in_process(write_bom):
+	file1 = write_bom("A01.csv", [("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "1")])
+	file2 = write_bom("A02.csv", [("100-1", "RES", "R1,R2", "2")])
+	timer = bom_batch.PhaseTimer()
+	concurrent = bom_batch.load_boms([file1, file2], workers = 2, use_cache = False, timer = timer)
+	in_process = bom_batch.load_boms([file1, file2], workers = 1, use_cache = False)
+	assert [list(bom.entries.rows()) for bom in concurrent] == [list(bom.entries.rows()) for bom in in_process]
+	assert [bom.label for bom in concurrent] == ["A01", "A02"]
+	assert timer.counters["rows"] == 3
@@ -0,0 +1,84 @@
+"""Tests of the parsed BOM cache (bom_cache.py)."""
+import os
+
+import pytest
+
+import bom_external
+import compare_bom_xlsx
+from bom_cache import BomCache
+
+ROWS = [("100-1", "RES 10K", "R1", "1"), ("100-2", "CAP 1UF", "C1", "1")]
+
+
+def test_hit_and_miss(tmp_path, write_bom):
+	cache = BomCache(str(tmp_path / "cache"), enabled = True)
+	filename = write_bom("A01.csv", ROWS)
+	parses = []
+
+	def parse(f):
+		parses.append(f)
+		return {"file": os.path.basename(f), "rows": [1, 2]}
+
+	assert cache.get_or_parse(filename, parse, "v1") == {"file": "A01.csv", "rows": [1, 2]}
+	assert cache.get_or_parse(filename, parse, "v1") == {"file": "A01.csv", "rows": [1, 2]}
+	assert (len(parses), cache.hits, cache.misses) == (1, 1, 1)
+	# Another parser fingerprint never hands back the old entry
+	cache.get_or_parse(filename, parse, "v2")
+	assert len(parses) == 2
+
+
+def test_hit_under_another_name(tmp_path, write_bom):
+	# Same contents, different file: the label comes from the file asked for
+	cache = BomCache(str(tmp_path / "cache"), enabled = True)
+	file1 = write_bom("A01.csv", ROWS)
+	file2 = write_bom("A02.csv", ROWS)
+	bom1 = compare_bom_xlsx.Bom.load(file1, cache = cache, verbose = False)
+	bom2 = compare_bom_xlsx.Bom.load(file2, cache = cache, verbose = False)
+	assert cache.hits == 1
+	assert (bom1.label, bom2.label) == ("A01", "A02")
+	bom3 = bom_external.load(file2, cache = cache, threshold = 1000)
+	assert bom3.label == "A02"
+
+
+def test_unreadable_entry_is_dropped(tmp_path):
+	cache = BomCache(str(tmp_path / "cache"), enabled = True)
+	cache.put("ab" * 32, [1])
+	with open(cache._path("ab" * 32), "wb") as f:
+		f.write(b"not a pickle")
+	assert cache.get("ab" * 32) is None
+	assert not os.path.exists(cache._path("ab" * 32))
+
+
+def test_eviction(tmp_path):
+	cache = BomCache(str(tmp_path / "cache"), max_bytes = 2000, enabled = True)
+	for i in range(10):
+		cache.put("%064x" % i, b"x" * 500)
+	assert sum(size for last_used, size, path in cache.entries()) <= 2000
+
+
+def test_eviction_keeps_a_running_total(tmp_path, monkeypatch):
+	cache = BomCache(str(tmp_path / "cache"), max_bytes = 100000, enabled = True)
+	cache.put("%064x" % 0, b"x" * 500)
+	scans = []
+	entries = cache.entries
+	monkeypatch.setattr(cache, "entries", lambda: scans.append(1) or entries())
+	for i in range(1, 10):
+		cache.put("%064x" % i, b"x" * 500)
+	assert scans == []
+	assert cache.total == sum(size for last_used, size, path in entries())
+
+
+def test_large_entry_is_not_kept(tmp_path):
+	cache = BomCache(str(tmp_path / "cache"), enabled = True, max_entry_bytes = 1000)
+	cache.put("ab" * 32, b"x" * 2000)
+	assert cache.get("ab" * 32) is None
+	cache.put("ab" * 32, b"x" * 500)
+	assert cache.get("ab" * 32) == b"x" * 500
+	assert not [name for path, dirs, files in os.walk(cache.directory) for name in files if name.endswith(".tmp")]
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path):
+	cache = BomCache(str(tmp_path / "cache"), enabled = True)
+	with pytest.raises(Exception):
+		cache.put("ab" * 32, lambda: None)		# Not picklable
+	assert [name for path, dirs, files in os.walk(cache.directory) for name in files] == []
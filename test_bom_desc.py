@@ -0,0 +1,52 @@
+"""Tests of the description similarity check (bom_desc.py)."""
+import bom_desc
+from bom_cache import BomCache
+
+
+def test_tokenize_canonical_values():
+	assert bom_desc.tokenize("CAPACITOR 0.1uF 16 V")[1] == ["100NF", "16V"]
+	assert bom_desc.tokenize("RES 4K7 0402")[1] == ["4.7K"]
+	assert bom_desc.tokenize("RESISTOR 10 K OHM")[1] == ["10K"]
+	assert bom_desc.tokenize("CONN HDR 10 pin")[0] == ["CONN", "HEADER", "10POS"]
+
+
+def test_flag():
+	scorer = bom_desc.DescriptionScorer()
+	flags = scorer.flag([("a", "CAPACITOR 0.1uF 16 V", "CAP 100nF 16V"),
+						("b", "RES 10K 0402", "RES 1K 0402"),
+						("c", "IC OPAMP", "LED RED 0603"),
+						("d", "SAME", "SAME")])
+	assert set(flags) == {"b", "c"}
+	assert scorer.score("CAP 100NF", "CAPACITOR 0.1UF") == 1.0
+
+
+def test_concurrent_saves_merge(tmp_path):
+	cache = BomCache(str(tmp_path), enabled = True)
+	scorer1 = bom_desc.DescriptionScorer(cache)
+	scorer2 = bom_desc.DescriptionScorer(cache)
+	scorer1.flag([("a", "RES 10K 0402", "RES 1K 0402")])
+	scorer2.flag([("b", "CAP 1UF X7R", "CAP 10UF X7R")])
+	scorer1.save()
+	scorer2.save()
+	saved = bom_desc.DescriptionScorer(cache).tokens
+	assert {"RES 10K 0402", "RES 1K 0402", "CAP 1UF X7R", "CAP 10UF X7R"} <= set(saved)
+
+
+def test_pruning_bounds_the_tokens(tmp_path, monkeypatch):
+	monkeypatch.setattr(bom_desc, "MAX_CACHED_DES", 4)
+	cache = BomCache(str(tmp_path), enabled = True)
+	scorer = bom_desc.DescriptionScorer(cache)
+	scorer.flag([(str(i), "PART " + str(i), "PART X" + str(i)) for i in range(10)])
+	scorer.save()
+	assert len(scorer.tokens) == 4
+	assert len(bom_desc.DescriptionScorer(cache).tokens) == 4
+	assert scorer.flag([("x", "RES 10K", "RES 1K")]) == {"x": round(scorer.score("RES 10K", "RES 1K"), 3)}
+
+
+def test_token_sets_are_bounded(monkeypatch):
+	monkeypatch.setattr(bom_desc, "MAX_TOKEN_SETS", 3)
+	scorer = bom_desc.DescriptionScorer()
+	scorer.flag([(str(i), "PART " + str(i), "PART X" + str(i)) for i in range(10)])
+	assert list(scorer.sets) == ["PART X8", "PART 9", "PART X9"]
+	# An evicted description scores the same once it is back
+	assert scorer.score("PART 0", "PART X0") == 1 / 3
@@ -0,0 +1,77 @@
+"""Tests of the out-of-core comparison (bom_external.py) against the in-memory one."""
+import json
+import os
+import pickle
+import random
+
+import pytest
+
+import bom_external
+import compare_bom_xlsx
+from bom_cache import BomCache
+
+
+@pytest.fixture
+def boms(write_bom):
+	# Shuffled BOMs with QPNs listed on several lines, changed QTY / DES / REF
+	rng = random.Random(7)
+	rows1 = [("Q%04d" % rng.randrange(400), "PART %d" % i, "R%d" % i, str(rng.randrange(1, 4))) for i in range(600)]
+	rows2 = [row for row in rows1 if rng.random() > 0.1]
+	rows2 = [(qpn, des + (" B" if rng.random() < 0.05 else ""), ref, str(int(qty) + (rng.random() < 0.1))) for qpn, des, ref, qty in rows2]
+	rows2 += [("N%04d" % i, "NEW", "", "1") for i in range(30)]
+	rng.shuffle(rows2)
+	return write_bom("A01.csv", rows1), write_bom("A02.csv", rows2)
+
+
+def records(filename):
+	return sorted(json.load(open(filename)), key = lambda r: (r["section"], r["qpn"]))
+
+
+def test_same_results_as_in_memory(tmp_path, boms, monkeypatch):
+	monkeypatch.setattr(bom_external, "RUN_ROWS", 50)
+	file1, file2 = boms
+	memory = compare_bom_xlsx.compare(compare_bom_xlsx.Bom.load(file1, "ENG"), compare_bom_xlsx.Bom.load(file2, "IFS"))
+	memory.render(str(tmp_path / "memory.json"))
+
+	bom1 = bom_external.load(file1, "ENG", threshold = 100, spill_dir = str(tmp_path))
+	bom2 = bom_external.load(file2, "IFS", threshold = 100, spill_dir = str(tmp_path))
+	assert isinstance(bom1, bom_external.ExternalBom) and len(bom1.runs) > 1
+	external = bom_external.compare(bom1, bom2)
+	external.render(str(tmp_path / "external.json"))
+
+	assert records(str(tmp_path / "external.json")) == records(str(tmp_path / "memory.json"))
+	for key in ["matched", "only1", "only2", "des_flagged", "qty_changed"]:
+		assert external.summary()[key] == memory.summary()[key], key
+
+
+def test_small_bom_stays_in_memory(boms):
+	assert isinstance(bom_external.load(boms[0], threshold = 10000), compare_bom_xlsx.Bom)
+	assert isinstance(bom_external.load(boms[0], threshold = 0), compare_bom_xlsx.Bom)
+
+
+def test_large_cached_bom_is_spilled(tmp_path, boms):
+	# A table cached by an in-memory load still honours the threshold
+	cache = BomCache(str(tmp_path / "cache"), enabled = True)
+	memory = compare_bom_xlsx.Bom.load(boms[0], cache = cache)
+	bom = bom_external.load(boms[0], cache = cache, threshold = 100, spill_dir = str(tmp_path))
+	assert cache.hits == 1
+	assert isinstance(bom, bom_external.ExternalBom)
+	assert dict(bom.entries()) == dict(memory.entries.items())
+	bom.close()
+	assert isinstance(bom_external.load(boms[0], cache = cache, threshold = 10000), compare_bom_xlsx.Bom)
+
+
+def test_spill_files_follow_the_bom(tmp_path, boms):
+	bom = bom_external.load(boms[0], threshold = 100, spill_dir = str(tmp_path))
+	directory = bom.directory
+	copy = pickle.loads(pickle.dumps(bom))
+	del bom
+	assert os.path.isdir(directory)
+	assert sum(1 for group in copy.groups()) == len(compare_bom_xlsx.Bom.load(boms[0]))
+	copy.close()
+	assert not os.path.exists(directory)
+
+
+def test_merge_join():
+	rows = list(bom_external.merge_join(iter([("A", 1), ("C", 3)]), iter([("B", 2), ("C", 4), ("D", 5)])))
+	assert rows == [("A", 1, None), ("B", None, 2), ("C", 3, 4), ("D", None, 5)]
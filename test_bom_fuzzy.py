@@ -0,0 +1,40 @@
+"""Tests of fuzzy QPN matching (bom_fuzzy.py)."""
+import bom_fuzzy
+import compare_bom_xlsx
+from compare_bom_xlsx import Bom
+
+
+def test_normalizer():
+	normalize = bom_fuzzy.QpnNormalizer()
+	assert normalize("12-3456-01 REV B") == normalize("12345601")
+	assert normalize("0012345") == "12345"
+	assert normalize("r10k_0402") == "R10K402"
+
+
+def test_rules_file(tmp_path):
+	rules_file = tmp_path / "qpn_rules.csv"
+	rules_file.write_text("# name,pattern,replacement\nvendor prefix,^ACME,\n")
+	rules = bom_fuzzy.load_rules_file(str(rules_file))
+	assert len(rules) == len(bom_fuzzy.DEFAULT_RULES) + 1
+	assert bom_fuzzy.QpnNormalizer(rules)("ACME-12345") == "12345"
+
+
+def test_pairs_are_one_to_one_best_first():
+	pairs = bom_fuzzy.fuzzy_pairs(["12-3456-01 REV B", "0099887", "ABC-1234-XYZ", "LONELY"],
+									["12345601", "99887", "ABC-1243-XYZ", "ABC-1234-XY", "NOTHING LIKE IT"])
+	assert pairs[:2] == [("12-3456-01 REV B", "12345601", 1.0), ("0099887", "99887", 1.0)]
+	assert [(p[0], p[1]) for p in pairs[2:]] == [("ABC-1234-XYZ", "ABC-1234-XY")]
+	assert 0.6 <= pairs[2][2] < 1.0
+
+
+def test_threshold():
+	assert bom_fuzzy.fuzzy_pairs(["ABCDEFGH"], ["ABCDXXXX"], threshold = 0.9) == []
+	assert bom_fuzzy.fuzzy_pairs(["ABCDEFGH"], ["ABCDXXXX"], threshold = 0.2) != []
+
+
+def test_comparison_proposes_pairs():
+	bom1 = Bom.from_rows([("100-1", "RES", "R1", "1"), ("12-3456-01", "IC", "U1", "1")], "ENG")
+	bom2 = Bom.from_rows([("100-1", "RES", "R1", "1"), ("12-3456-01 REV B", "IC", "U1", "1")], "IFS")
+	result = compare_bom_xlsx.compare(bom1, bom2, fuzzy = True)
+	assert result.fuzzy == [("12-3456-01", "12-3456-01 REV B", 1.0)]
+	assert result.summary()["fuzzy"] == 1
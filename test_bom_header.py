@@ -0,0 +1,60 @@
+"""Tests of the header classifier (bom_header.py) and of how parse_bom() uses it."""
+import re
+import zipfile
+
+import bom_header
+import compare_bom_xlsx
+
+
+def test_classify():
+	classifier = bom_header.HeaderClassifier()
+	assert classifier.classify("QPN") == "QPN"
+	assert classifier.classify("Part Description") == "DES"
+	assert classifier.classify("Reference") == "REF"
+	assert classifier.classify("Qty Per") == "QTY"
+	assert classifier.classify("Unit of Measure") == "UOM"
+	assert classifier.classify("Notes") is None
+	assert classifier.classify(None) is None
+
+
+def test_find_header_optional_columns():
+	classifier = bom_header.HeaderClassifier()
+	rows = iter([("Assembly PCBA-100", None, None),
+				("Level", "QPN", "DES", "QTY", "REF", "UOM"),
+				(1, "100-1", "RES", 2, "R1,R2", "EA")])
+	columns, r = classifier.find_header(rows)
+	assert r == 2
+	assert (columns["LEVEL"], columns["QPN"], columns["DES"], columns["QTY"], columns["REF"], columns["UOM"]) == (1, 2, 3, 4, 5, 6)
+	assert columns["SUBBOM"] == 0
+
+
+def test_find_header_stops_at_the_end_of_the_header():
+	# Once QPN/DES/QTY are found, a blank cell ends the header: a REF column
+	# far off to the right (another table) isn't taken
+	classifier = bom_header.HeaderClassifier()
+	row = ("QPN", "DES", "QTY", None) + (None,) * 50 + ("REF",)
+	columns, r = classifier.find_header(iter([row]))
+	assert r == 1
+	assert columns["REF"] == 0
+
+
+def test_find_header_missing_fields():
+	classifier = bom_header.HeaderClassifier()
+	missing, r = classifier.find_header(iter([("QPN", "DES")] * 12))
+	assert r is None
+	assert "QTY" in missing and "QPN" not in missing
+
+
+def test_stale_dimension_is_not_trusted(tmp_path, save_workbook):
+	# A writer that leaves <dimension ref="A1"/> behind
+	good = save_workbook("good.xlsx", {"BOM": [("QPN", "DES", "REF", "QTY"), ("100-1", "RES 10K", "R1", 1), ("100-2", "CAP 1UF", "C1", 1)]})
+	stale = str(tmp_path / "stale.xlsx")
+	with zipfile.ZipFile(good) as src, zipfile.ZipFile(stale, "w") as dst:
+		for item in src.infolist():
+			data = src.read(item.filename)
+			if item.filename == "xl/worksheets/sheet1.xml":
+				data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+			dst.writestr(item, data)
+
+	table = compare_bom_xlsx.parse_bom(stale, verbose = False)
+	assert [row[0] for row in table["rows"]] == ["100-1", "100-2"]
@@ -0,0 +1,70 @@
+"""Tests of the SQLite part index (bom_index.py)."""
+import threading
+
+import pytest
+
+import bom_index
+import compare_bom_xlsx
+
+
+@pytest.fixture
+def boms(write_bom):
+	rows1 = [("100-1", "RES 10K", "R1-R2", "2"), ("100-2", "CAP 1UF", "C1", "1"), ("100-3", "IC", "U1", "1")]
+	rows2 = [("100-1", "RES 10K", "R1-R3", "3"), ("100-2", "CAP 1UF", "C1", "1"), ("100-4", "LED", "D1", "1")]
+	file1 = write_bom("A01.csv", rows1)
+	file2 = write_bom("A02.csv", rows2)
+	return (compare_bom_xlsx.Bom.load(file1, "A01"), file1), (compare_bom_xlsx.Bom.load(file2, "A02"), file2)
+
+
+def test_add_is_idempotent(tmp_path, boms):
+	(bom1, file1), _ = boms
+	with bom_index.BomIndex(str(tmp_path / "index.sqlite")) as index:
+		bom_id, added = index.add(bom1, file1, "PCBA", "A01")
+		assert added
+		assert index.add(bom1, file1, "PCBA", "A01") == (bom_id, False)
+		assert index.bom(bom_id)["parts"] == 3
+
+
+def test_concurrent_add_of_the_same_bom(tmp_path, boms):
+	# Every connection gets the same id, none fails on the UNIQUE constraint
+	(bom1, file1), _ = boms
+	filename = str(tmp_path / "index.sqlite")
+	bom_index.BomIndex(filename).close()
+	results = []
+	errors = []
+
+	def add():
+		try:
+			with bom_index.BomIndex(filename) as index:
+				results.append(index.add(bom1, file1, "PCBA", "A01"))
+		except Exception as e:
+			errors.append(e)
+
+	threads = [threading.Thread(target = add) for i in range(8)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert errors == []
+	assert len(set(bom_id for bom_id, added in results)) == 1
+	assert sum(added for bom_id, added in results) == 1
+
+
+def test_resolve_where_used_and_compare(tmp_path, boms):
+	(bom1, file1), (bom2, file2) = boms
+	with bom_index.BomIndex(str(tmp_path / "index.sqlite")) as index:
+		id1, added = index.add(bom1, file1, "PCBA", "A01")
+		id2, added = index.add(bom2, file2, "PCBA", "A02")
+		assert index.resolve("PCBA@A01") == id1
+		assert index.resolve("PCBA") == id2
+		assert index.resolve(file1) == id1
+		with pytest.raises(bom_index.IndexLookupError):
+			index.resolve("PCBA@Z99")
+
+		assert [hit["qty"] for hit in index.where_used("100-1")] == ["2", "3"]
+
+		comparison = index.compare(id1, id2)
+		output = str(tmp_path / "result.jsonl")
+		comparison.render(output)
+		summary = comparison.summary()
+		assert (summary["matched"], summary["only1"], summary["only2"], summary["qty_changed"]) == (2, 1, 1, 1)
@@ -0,0 +1,113 @@
+"""Tests of multi-level BOM flattening (bom_levels.py)."""
+import threading
+
+import pytest
+
+import bom_levels
+import compare_bom_xlsx
+from bom_table import BomTable
+
+
+def flatten(rows, directory = ".", load = None):
+	# BomTable of the rolled-up rows
+	out = []
+	flattener = bom_levels.TreeFlattener(out.append, directory, load, bom_levels.SubBomLibrary())
+	for row in rows:
+		flattener(row)
+	flattener.finish()
+	return BomTable.from_rows(out)
+
+
+def test_parse_level():
+	assert [bom_levels.parse_level(t) for t in ["1", "2.0", "..3", "1.2.3", "***", "", "x"]] == [1, 2, 3, 3, 3, None, None]
+
+
+def test_quantities_are_multiplied_down_the_tree():
+	table = flatten([
+		("PCBA", "BOARD", "", "2", "1", ""),
+		("R10K", "RES", "R1,R2", "2", "2", ""),
+		("HDR", "HEADER ASSY", "", "1", "2", ""),
+		("PIN", "PIN", "", "4", "3", ""),
+		("LABEL", "LABEL", "", "1", "1", ""),
+	])
+	assert table["R10K"][2] == "4"
+	assert table["PIN"][2] == "8"
+	assert table["LABEL"][2] == "1"
+
+
+def test_blank_level_is_the_level_above():
+	# Used to close every open assembly, so C1 lost its multiplier
+	table = flatten([
+		("PCBA", "BOARD", "", "3", "1", ""),
+		("R1K", "RES", "R1", "1", "2", ""),
+		("C1U", "CAP", "C1", "2", "", ""),
+		("LABEL", "LABEL", "", "1", "1", ""),
+	])
+	assert table["C1U"][2] == "6"
+	assert table["LABEL"][2] == "1"
+
+
+SUBASSEMBLY = [
+	("SA", "SUB ASSY", "", "1", "1", ""),
+	("R10K", "RES", "R1,R2", "2", "2", ""),
+]
+
+def test_expansion_does_not_depend_on_row_order():
+	uses = [("TOP", "TOP", "", "1", "1", ""), ("SA", "SUB ASSY", "", "2", "2", "")]
+	before = flatten(uses + SUBASSEMBLY)
+	after = flatten(SUBASSEMBLY + uses)
+	assert before["R10K"][2] == after["R10K"][2] == "6"
+
+
+def test_subassembly_used_twice_lists_its_refs_once():
+	table = flatten(SUBASSEMBLY + [
+		("SA", "SUB ASSY", "", "1", "1", ""),
+		("R10K", "RES", "R9", "1", "1", ""),
+	])
+	assert table["R10K"] == ("RES", "R1,R2,R9", "5")
+
+
+def test_assembly_containing_itself():
+	with pytest.raises(bom_levels.BomTreeError):
+		flatten([
+			("A", "ASSY", "", "1", "1", ""),
+			("B", "ASSY", "", "1", "2", ""),
+			("B", "ASSY", "", "1", "1", ""),
+			("A", "ASSY", "", "1", "2", ""),
+		])
+
+
+def test_sub_bom_workbook(tmp_path, write_bom):
+	write_bom("SA.csv", [("R10K", "RES", "R1", "1"), ("C1U", "CAP", "C1", "3")])
+	load = lambda f: compare_bom_xlsx.parse_bom(f, verbose = False)
+	table = flatten([("SA", "SUB ASSY", "", "2", "1", "SA.csv")], str(tmp_path), load)
+	assert (table["R10K"][2], table["C1U"][2]) == ("2", "6")
+	with pytest.raises(bom_levels.BomTreeError):
+		flatten([("SB", "SUB ASSY", "", "1", "1", "missing.csv")], str(tmp_path), load)
+
+
+def test_library_shared_between_threads(tmp_path, write_bom):
+	# Two threads reading the same sub-BOM at once is not a loop
+	write_bom("SA.csv", [("R10K", "RES", "R1", "1")])
+	library = bom_levels.SubBomLibrary()
+	both_reading = threading.Barrier(2, timeout = 10)
+
+	def load(filename):
+		both_reading.wait()
+		return compare_bom_xlsx.parse_bom(filename, verbose = False)
+
+	results = []
+
+	def read():
+		try:
+			results.append(len(library.expansion(str(tmp_path / "SA.csv"), load)))
+		except Exception as e:
+			results.append(e)
+
+	threads = [threading.Thread(target = read) for i in range(2)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert results == [1, 1]
+	assert len(library.memo) == 1
@@ -0,0 +1,54 @@
+"""Tests of the N-way comparison of BOM revisions (bom_nway.py)."""
+import csv
+
+from openpyxl import load_workbook
+
+import bom_nway
+from compare_bom_xlsx import Bom
+
+
+def revisions():
+	return [
+		Bom.from_rows([("100-1", "RES 10K", "R1,R2", "2"), ("100-2", "CAP 1UF", "C1", "1")], "A01"),
+		Bom.from_rows([("100-1", "RES 10K", "R1-R3", "3"), ("100-2", "CAP 1UF", "C1", "1.0"), ("100-3", "LED", "D1", "1")], "A02"),
+		Bom.from_rows([("100-1", "RES 10K", "R1-R3", "3"), ("100-3", "LED RED", "D1", "1")], "A03"),
+	]
+
+
+def test_find_workbooks(tmp_path):
+	for name in ["A10.csv", "A2.xlsx", "A1.xlsx", "Nway_Results.xlsx", "~$A1.xlsx", "notes.txt"]:
+		(tmp_path / name).write_text("")
+	assert [p.split("/")[-1] for p in bom_nway.find_workbooks([str(tmp_path)])] == ["A1.xlsx", "A2.xlsx", "A10.csv"]
+
+
+def test_matrix():
+	comparison = bom_nway.compare_many(revisions())
+	assert list(comparison.matrix()) == [("100-1", "RES 10K", ["2", "3", "3"]),
+										("100-2", "CAP 1UF", ["1", "1.0", None]),
+										("100-3", "LED RED", [None, "1", "1"])]
+
+
+def test_changes():
+	changes = [(c["From"], c["To"], c["QPN"], c["Change"], c["Fields"]) for c in bom_nway.compare_many(revisions()).changes()]
+	# "1" -> "1.0" is no QTY change
+	assert changes == [("A01", "A02", "100-1", "modified", "REF,QTY"),
+					("A01", "A02", "100-3", "added", ""),
+					("A02", "A03", "100-2", "removed", ""),
+					("A02", "A03", "100-3", "modified", "DES")]
+	summary = bom_nway.compare_many(revisions()).summary()
+	assert summary["qpns"] == 3
+	assert summary["changes"]["A02 -> A03"] == {"added": 0, "removed": 1, "modified": 1}
+
+
+def test_render(tmp_path):
+	comparison = bom_nway.compare_many(revisions())
+	comparison.render(str(tmp_path / "nway.csv"))
+	rows = list(csv.reader(open(str(tmp_path / "nway.csv"), newline = "")))
+	assert rows[0] == ["QPN", "DES", "A01", "A02", "A03", "Present In"]
+	assert rows[3] == ["100-3", "LED RED", "", "1", "1", "2/3"]
+	assert len(list(csv.reader(open(str(tmp_path / "nway_changes.csv"), newline = "")))) == 5
+
+	comparison.render(str(tmp_path / "nway.xlsx"))
+	book = load_workbook(str(tmp_path / "nway.xlsx"), read_only = True)
+	assert book.sheetnames == ["Matrix", "Changes"]
+	book.close()
@@ -0,0 +1,35 @@
+"""Tests of the reference designator sets (bom_refdes.py)."""
+import bom_refdes
+from bom_refdes import diff_designators, format_refset, parse_designators
+
+
+def test_ranges_and_lists_are_the_same_set():
+	assert parse_designators("R1-R4,R7") == parse_designators("R1, R2 R3;R4,r7")
+	assert parse_designators("R1 - R4") == parse_designators("R1-4")
+	assert parse_designators("R100001-R100004").bits == {"R": (100001, 0b1111)}
+	assert len(parse_designators("R1-R4,C3,TP_GND")) == 6
+	assert not parse_designators("")
+
+
+def test_format_refset():
+	assert format_refset(parse_designators("R7,R3,R1,R2,C3,U1A")) == "C3,R1-R3,R7,U1A"
+	assert format_refset(parse_designators("R1,R2")) == "R1,R2"
+
+
+def test_diff_designators():
+	only1, only2 = diff_designators("R1-R4,R7", "R2-R5")
+	assert (format_refset(only1), format_refset(only2)) == ("R1,R7", "R5")
+	only1, only2 = diff_designators("R1-R4", "R1,R2,R3,R4")
+	assert not only1 and not only2
+
+
+def test_quantity_check():
+	assert bom_refdes.quantity_check("R1-R4", "4") == ""
+	assert bom_refdes.quantity_check("R1-R4", "3") == "4 REF vs QTY 3"
+	assert bom_refdes.quantity_check("R1-R4", "AR") == ""
+	assert bom_refdes.quantity_check("", "3") == ""
+
+
+def test_ref_delta():
+	assert bom_refdes.ref_delta(("RES", "R1-R3", "3"), ("RES", "R1,R2,R4", "2")) == ("R3", "R4", "", "3 REF vs QTY 2")
+	assert bom_refdes.ref_delta(("RES", "R1", "1"), None) == ("", "", "", "")
@@ -0,0 +1,138 @@
+"""Tests of the HTTP comparison service (bom_server.py) on a free localhost port."""
+import json
+import logging
+import os
+import threading
+import uuid
+import urllib.error
+import urllib.request
+
+import pytest
+
+import bom_server
+
+BOM1 = b"QPN,DES,REF,QTY\n100-1,RES 10K,R1-R2,2\n100-2,CAP 1UF,C1,1\n100-3,IC,U1,1\n"
+BOM2 = b"QPN,DES,REF,QTY\n100-1,RES 10K,R1-R3,3\n100-2,CAP 1UF,C1,1\n100-4,LED,D1,1\n"
+
+
+@pytest.fixture
+def server(tmp_path):
+	server = bom_server.make_server(port = 0, workers = 1, max_pending = 2, upload_dir = str(tmp_path / "uploads"), use_cache = False)
+	thread = threading.Thread(target = server.serve_forever, daemon = True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+	server.service.close()
+
+
+def url(server, path):
+	return "http://127.0.0.1:" + str(server.server_address[1]) + path
+
+def request(server, path, data = None, headers = None):
+	# (status, headers, body)
+	req = urllib.request.Request(url(server, path), data = data, headers = headers or {})
+	try:
+		with urllib.request.urlopen(req, timeout = 60) as response:
+			return response.status, response.headers, response.read()
+	except urllib.error.HTTPError as e:
+		return e.code, e.headers, e.read()
+
+def multipart(files, fields = None):
+	# (body, Content-Type) of a form with files {name: (filename, bytes)}
+	boundary = uuid.uuid4().hex
+	body = b""
+	for name, (filename, data) in files.items():
+		body += ("--" + boundary + "\r\nContent-Disposition: form-data; name=\"" + name + "\"; filename=\"" + filename
+				+ "\"\r\nContent-Type: application/octet-stream\r\n\r\n").encode() + data + b"\r\n"
+	for name, value in (fields or {}).items():
+		body += ("--" + boundary + "\r\nContent-Disposition: form-data; name=\"" + name + "\"\r\n\r\n" + value + "\r\n").encode()
+	body += ("--" + boundary + "--\r\n").encode()
+	return body, "multipart/form-data; boundary=" + boundary
+
+
+def test_upload_and_lookup(server):
+	status, headers, body = request(server, "/boms", BOM1)
+	assert status == 200
+	info = json.loads(body)
+	assert info["rows"] == 3
+	status, headers, body = request(server, "/boms/" + info["id"])
+	assert (status, json.loads(body)) == (200, info)
+	assert request(server, "/boms/" + "0" * 64)[0] == 404
+	assert request(server, "/boms/nothex")[0] == 400
+
+
+def test_unknown_upload_is_refused(server):
+	status, headers, body = request(server, "/boms", bytes(range(256)) * 4)
+	assert status == 415
+	assert os.listdir(server.service.upload_dir) == []
+	# Text in another encoding is still taken
+	assert request(server, "/boms", BOM1.replace(b"RES", "RÉS".encode("cp1252")))[0] == 200
+
+
+def test_requests_are_logged(server, caplog):
+	caplog.set_level(logging.INFO)
+	request(server, "/health")
+	assert any(("GET /health" in r.getMessage()) and ("200" in r.getMessage()) for r in caplog.records)
+
+
+def test_failed_parse_forgets_the_other(server):
+	service = server.service
+	bad = service.store(b"PK not really a workbook")
+	good = service.store(BOM2)
+	service.release([bad, good])
+	with pytest.raises(bom_server.ServiceError):
+		service.compare(bad, good)
+	assert service.inflight == {}
+
+
+def test_compare_uploads(server):
+	body, content_type = multipart({"bom1": ("A01.csv", BOM1), "bom2": ("A02.csv", BOM2)})
+	status, headers, body = request(server, "/compare", body, {"Content-Type": content_type})
+	assert status == 200
+	result = json.loads(body)
+	summary = result["summary"]
+	assert (summary["label1"], summary["label2"]) == ("A01", "A02")
+	assert (summary["matched"], summary["only1"], summary["only2"]) == (2, 1, 1)
+	assert (result["rows"][0]["bom1"]["label"], result["rows"][0]["bom2"]["label"]) == ("A01", "A02")
+
+	# Earlier uploads by id, as xlsx
+	ids = {"bom1": headers["X-BOM1-Id"], "bom2": headers["X-BOM2-Id"]}
+	status, headers, body = request(server, "/compare?format=xlsx", json.dumps(ids).encode(), {"Content-Type": "application/json"})
+	assert status == 200
+	assert body.startswith(b"PK")
+
+
+def test_same_file_names_get_unique_labels(server):
+	body, content_type = multipart({"bom1": ("bom.csv", BOM1), "bom2": ("bom.csv", BOM2)})
+	status, headers, body = request(server, "/compare", body, {"Content-Type": content_type})
+	assert status == 200
+	summary = json.loads(body)["summary"]
+	assert summary["label1"] != summary["label2"]
+
+
+def test_busy_server_answers_503(server):
+	service = server.service
+	for i in range(service.max_pending):
+		assert service.admit()
+	try:
+		status, headers, body = request(server, "/health")
+		assert status == 503
+		assert headers["Retry-After"] == "1"
+	finally:
+		for i in range(service.max_pending):
+			service.done()
+	status, headers, body = request(server, "/health")
+	stats = json.loads(body)
+	assert (status, stats["rejected"], stats["busy"]) == (200, 1, 1)
+
+
+def test_uploads_in_use_are_not_evicted(server, monkeypatch):
+	service = server.service
+	monkeypatch.setattr(bom_server, "MAX_UPLOADS", 1)
+	first = service.store(BOM1)
+	service.store(BOM2)
+	assert os.path.isfile(service.upload_path(first))
+	service.release([first])
+	service.store(BOM2 + b"100-5,FUSE,F1,1\n")
+	assert not os.path.isfile(service.upload_path(first))
@@ -0,0 +1,66 @@
+"""Tests of the BOM generator (bom_synth.py) and the benchmark bookkeeping (bom_benchmark.py)."""
+import json
+import random
+
+import pytest
+
+import bom_benchmark
+import bom_synth
+import compare_bom_xlsx
+
+
+def test_revise_rows_counts():
+	rng = random.Random(1)
+	rows = bom_synth.make_rows(200, rng)
+	assert len(set(row[0] for row in rows)) == 200
+	revised, expected = bom_synth.revise_rows(rows, rng, added_pct = 5, removed_pct = 3, modified_pct = 10)
+	assert expected == {"rows1": 200, "rows2": 204, "added": 10, "removed": 6, "modified": 20, "matched": 194}
+	assert len(revised) == expected["rows2"]
+
+
+@pytest.mark.parametrize("fmt", ["xlsx", "csv", "tsv"])
+def test_generated_pair_compares_as_expected(tmp_path, fmt):
+	path1, path2, expected = bom_synth.generate_pair(str(tmp_path), 300, seed = 3, blank_gap_every = 50, fmt = fmt)
+	bom1 = compare_bom_xlsx.Bom.load(path1, "A")
+	bom2 = compare_bom_xlsx.Bom.load(path2, "B")
+	summary = compare_bom_xlsx.compare(bom1, bom2).summary()
+	assert (summary["rows1"], summary["rows2"]) == (expected["rows1"], expected["rows2"])
+	assert (summary["matched"], summary["only1"], summary["only2"]) == (expected["matched"], expected["removed"], expected["added"])
+
+
+@pytest.mark.filterwarnings("ignore:Workbook contains no default style")
+def test_generated_workbook_reads_the_same_with_openpyxl(tmp_path):
+	path1, path2, expected = bom_synth.generate_pair(str(tmp_path), 50, seed = 4)
+	native = compare_bom_xlsx.parse_bom(path1, verbose = False, reader = "native")
+	fallback = compare_bom_xlsx.parse_bom(path1, verbose = False, reader = "openpyxl")
+	assert native["rows"] == fallback["rows"]
+	assert len(native["rows"]) == 50
+
+
+def test_run_case(tmp_path):
+	path1, path2, expected = bom_synth.generate_pair(str(tmp_path), 100, seed = 5)
+	case = {"bom1": path1, "bom2": path2, "reader": "native", "output": str(tmp_path / "out.csv"), "expected": expected}
+	result = bom_benchmark.run_case(case)
+	assert result["correct"]
+	assert result["counters"]["rows"] == expected["rows1"] + expected["rows2"]
+
+
+def test_case_names_differ_by_generator_settings():
+	case = {"rows": 1000, "header_offset": 2, "blank_gap_every": 0, "changelog": True, "added": 1.0, "removed": 1.0,
+			"modified": 2.0, "vary_headers": True, "seed": 0, "reader": "native"}
+	names = {bom_benchmark.case_name(case)}
+	for name, value in [("added", 5.0), ("removed", 0.5), ("modified", 0.0), ("vary_headers", False), ("seed", 7)]:
+		names.add(bom_benchmark.case_name(dict(case, **{name: value})))
+	assert len(names) == 6
+	assert bom_benchmark.case_name(case) == "1000r_off2_a1r1m2_s0_native"
+
+
+def test_regressions(tmp_path):
+	previous = {"phases": {"rows": 1.0, "open": 0.001}, "total_seconds": 2.0, "peak_rss_mb": 100}
+	record = {"phases": {"rows": 1.2, "open": 0.005}, "total_seconds": 2.1, "peak_rss_mb": 100}
+	assert bom_benchmark.find_regressions(record, previous) == [("rows", 1.0, 1.2, 20.0)]
+	assert bom_benchmark.find_regressions(record, None) == []
+
+	history = tmp_path / "bench_results.jsonl"
+	history.write_text(json.dumps({"case": "a", "n": 1}) + "\nnot json\n" + json.dumps({"case": "a", "n": 2}) + "\n")
+	assert bom_benchmark.load_history(str(history)) == {"a": {"case": "a", "n": 2}}
@@ -0,0 +1,94 @@
+"""Tests of the column-oriented BOM storage and the QTY parsing (bom_table.py)."""
+import math
+import pickle
+
+import pytest
+
+import bom_external
+from bom_table import BomTable, format_quantity, parse_quantities, parse_quantity, quantity_deltas, quantity_unit
+
+
+@pytest.mark.parametrize("text, value", [
+	("2", 2.0), ("2.5", 2.5), ("1,000", 1000.0), ("-3", -3.0), ("1e3", 1000.0),
+	("2 EA", 2.0), ("2 PCS.", 2.0), ("500mm", 0.5), ("1.5 M", 1.5), ("250 G", 0.25),
+])
+def test_parse_quantity(text, value):
+	assert parse_quantity(text) == pytest.approx(value)
+
+
+@pytest.mark.parametrize("text", ["", "AR", "nan", "NaN", "inf", "-Infinity", "1_000", "1e400", "1,00", "EA"])
+def test_parse_quantity_not_a_number(text):
+	assert math.isnan(parse_quantity(text))
+
+
+def test_parse_quantities():
+	values = parse_quantities(["1", "2 EA", "x", "1"])
+	assert list(values[:2]) == [1.0, 2.0] and math.isnan(values[2]) and values[3] == 1.0
+
+
+def test_format_quantity():
+	assert format_quantity(4.0) == "4"
+	assert format_quantity(2.5) == "2.5"
+	assert format_quantity(float("nan")) == ""
+	assert format_quantity(1.5, "M") == "1.5 M"
+	assert quantity_unit("500mm") == "M"
+	assert quantity_unit("2 EA") == ""
+
+
+def test_mapping():
+	table = BomTable.from_rows([("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "2 EA")])
+	assert len(table) == 2
+	assert table["100-2"] == ("CAP", "C1", "2 EA")
+	assert "100-3" not in table
+	assert list(table.rows()) == [("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "2 EA")]
+
+
+def test_duplicates_are_aggregated():
+	table = BomTable.from_rows([("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "1"),
+								("100-1", "RES 10K", "R2,R3", "2"), ("100-1", "RES", "", "1")])
+	assert table["100-1"] == ("RES", "R1,R2,R3", "4")
+	assert table.duplicates() == {"100-1": 3}
+	assert table.line_count() == 4
+	assert list(table.totals(["100-1", "100-2"])) == [4.0, 1.0]
+
+
+def test_duplicates_in_one_unit_are_summed():
+	table = BomTable.from_rows([("W1", "WIRE", "", "500mm"), ("W1", "WIRE", "", "1.5 M")])
+	assert table["W1"] == ("WIRE", "", "2 M")
+
+
+def test_duplicates_in_different_units_are_not_summed():
+	rows = [("W1", "WIRE", "", "500mm"), ("W1", "WIRE", "", "2 EA")]
+	table = BomTable.from_rows(rows)
+	assert table["W1"] == ("WIRE", "", "500mm, 2 EA")
+	assert math.isnan(table.quantity("W1"))
+	# The out of core merge aggregates the same way
+	assert bom_external.aggregate([(qpn, line, des, ref, qty) for line, (qpn, des, ref, qty) in enumerate(rows)]) == ("W1", table["W1"])
+
+
+def test_quantity_deltas():
+	table1 = BomTable.from_rows([("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "AR")])
+	table2 = {"100-1": ("RES", "R1", "0.3"), "100-2": ("CAP", "C1", "1")}
+	deltas = quantity_deltas(table1, table2, ["100-1", "100-2"])
+	assert deltas[0] == -0.7
+	assert math.isnan(deltas[1])
+
+
+def test_pickle_round_trip():
+	table = BomTable.from_rows([("100-1", "RES", "R1", "1.0"), ("100-1", "RES", "R2", "1")])
+	copy = pickle.loads(pickle.dumps(table))
+	assert copy["100-1"] == table["100-1"] == ("RES", "R1,R2", "2")
+	assert copy.quantity_text(0) == "1.0"
+
+
+def test_append_and_extend_agree():
+	rows = [("100-1", "RES", "R1", "1.0"), ("100-2", "CAP", "C1", "2 EA"), ("100-1", "RES", "R2", "1"), ("100-3", "IC", "", "AR")]
+	appended = BomTable()
+	for row in rows:
+		appended.append(*row)
+	extended = BomTable.from_rows(rows)
+	assert list(appended.rows()) == list(extended.rows()) == rows
+	assert dict(appended) == dict(extended)
+	assert (appended.index, appended.dups, appended.qty_text) == (extended.index, extended.dups, extended.qty_text)
+	# Repeated strings are stored once
+	assert extended.qpn[0] is extended.qpn[2]
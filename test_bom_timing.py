@@ -0,0 +1,70 @@
+"""Tests of the phase timers and run report (bom_timing.py), and of the verbosity levels."""
+import json
+
+import pytest
+
+import bom_timing
+import compare_bom_xlsx
+
+
+def test_phase_timer():
+	timer = bom_timing.PhaseTimer()
+	with timer.phase("rows"):
+		pass
+	with timer.phase("rows"):
+		pass
+	timer.count("rows", 10)
+	other = bom_timing.PhaseTimer()
+	with other.phase("write"):
+		pass
+	other.count("rows", 5)
+	timer.merge(other)
+	assert list(timer.phases) == ["rows", "write"]
+	assert timer.counters == {"rows": 15}
+	assert timer.total() == sum(timer.phases.values())
+
+
+def test_null_timer_records_nothing():
+	timer = bom_timing.NULL_TIMER
+	with timer.phase("rows"):
+		timer.count("rows")
+	assert (timer.phases, timer.counters, timer.total()) == ({}, {}, 0.0)
+	with pytest.raises(TypeError):
+		timer.phases["rows"] = 1.0
+
+
+def test_run_report(tmp_path):
+	timer = bom_timing.PhaseTimer()
+	timer.phases.update({"open": 0.5, "rows": 1.5})
+	timer.counters.update({"rows": 3000, "sheets_read": 1, "sheets_skipped": 2})
+	report = bom_timing.run_report(timer, elapsed = 4.0)
+	assert report["phases"]["rows"] == {"seconds": 1.5, "percent": 37.5}
+	assert report["phases"]["other"] == {"seconds": 2.0, "percent": 50.0}
+	assert (report["rows_per_second"], report["sheets_read"], report["sheets_skipped"]) == (2000, 1, 2)
+	text = bom_timing.format_report(report)
+	assert "rows read: 3000 (2000 rows/s)" in text
+	filename = str(tmp_path / "report.json")
+	bom_timing.write_report(report, filename)
+	assert json.load(open(filename)) == report
+
+
+def test_run_profiler(tmp_path):
+	profiler = bom_timing.RunProfiler(str(tmp_path / "run.prof"), trace_memory = True)
+	with profiler:
+		data = [str(i) for i in range(10000)]
+	profiler.close()
+	report = bom_timing.run_report(bom_timing.PhaseTimer(), profiler = profiler)
+	assert report["profile_file"] == str(tmp_path / "run.prof")
+	assert report["memory"]["peak_mb"] >= 0.0 and report["memory"]["top"]
+	assert (tmp_path / "run.prof").exists()
+
+
+def test_quiet_parse_prints_nothing(capsys, write_bom):
+	filename = write_bom("bom.csv", [("100-1", "RES", "R1", "1")])
+	compare_bom_xlsx.parse_bom(filename, verbose = compare_bom_xlsx.VERBOSE_QUIET)
+	assert capsys.readouterr().out == ""
+	compare_bom_xlsx.parse_bom(filename, verbose = compare_bom_xlsx.VERBOSE_NORMAL)
+	out = capsys.readouterr().out
+	assert "Opening file" in out and "Sample data" not in out
+	compare_bom_xlsx.parse_bom(filename, verbose = compare_bom_xlsx.VERBOSE_ROWS)
+	assert "Sample data" in capsys.readouterr().out
@@ -0,0 +1,53 @@
+"""Tests of watch mode (bom_watch.py)."""
+import os
+
+import bom_watch
+import compare_bom_xlsx
+
+
+def touch_later(filename):
+	# Make sure the next poll sees a new modification time
+	st = os.stat(filename)
+	os.utime(filename, ns = (st.st_atime_ns, st.st_mtime_ns + 1000000000))
+
+
+def make_watcher(tmp_path, write_bom):
+	file1 = write_bom("ENG.csv", [("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "1")])
+	file2 = write_bom("IFS.csv", [("100-1", "RES", "R1", "1")])
+	output = str(tmp_path / "Comparison_Results.csv")
+	watcher = bom_watch.BomWatcher(file1, file2, "ENG", "IFS", output, verbose = False)
+	assert watcher.start()
+	return watcher, file1, file2, output
+
+
+def test_change_is_recompared(tmp_path, write_bom):
+	watcher, file1, file2, output = make_watcher(tmp_path, write_bom)
+	assert not watcher.poll()
+	assert watcher.comparison.summary()["only1"] == 1
+
+	write_bom("IFS.csv", [("100-1", "RES", "R1", "1"), ("100-2", "CAP", "C1", "1")])
+	touch_later(file2)
+	assert watcher.poll()
+	assert watcher.comparison.summary()["only1"] == 0
+	assert "100-2" in open(output).read()
+
+
+def test_write_error_keeps_watching(tmp_path, monkeypatch, write_bom):
+	watcher, file1, file2, output = make_watcher(tmp_path, write_bom)
+	render = compare_bom_xlsx.BomComparison.render
+
+	def broken(self, filename, qty_changes_only = False):
+		raise OSError("disk full")
+
+	monkeypatch.setattr(compare_bom_xlsx.BomComparison, "render", broken)
+	write_bom("IFS.csv", [("100-1", "RES", "R1", "2")])
+	touch_later(file2)
+	watcher.poll()
+	assert watcher.unwritten
+	assert not any(name.endswith(".partial.csv") for name in os.listdir(str(tmp_path)))
+
+	# Written on the next poll once rendering works again
+	monkeypatch.setattr(compare_bom_xlsx.BomComparison, "render", render)
+	assert watcher.poll()
+	assert not watcher.unwritten
+	assert ",2," in open(output).read()
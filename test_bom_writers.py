@@ -0,0 +1,84 @@
+"""Tests of the streaming comparison writers (bom_writers.py)."""
+import csv
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+import bom_writers
+
+BOM1 = {"100-1": ("RES 10K", "R1,R2", "2"), "100-2": ("CAP 1UF", "C1", "1"), "100-3": ("IC", "U1", "1")}
+BOM2 = {"100-1": ("RES 10K", "R1,R2,R3", "3"), "100-2": ("CAP 1UF", "C1", "1"), "100-4": ("LED", "D1", "1")}
+COMPARISON = (["100-1", "100-2"], ["100-3"], ["100-4"])
+
+
+def write(filename, qty_changes_only = False):
+	with bom_writers.open_writer(filename, "ENG", "IFS") as writer:
+		bom_writers.stream_comparison([writer], BOM1, BOM2, COMPARISON, qty_changes_only = qty_changes_only)
+
+
+def test_base_class_is_abstract():
+	with pytest.raises(TypeError):
+		bom_writers.ComparisonWriter("x", "ENG", "IFS")
+
+
+def test_unsupported_format(tmp_path):
+	with pytest.raises(ValueError, match = "Unsupported output format"):
+		bom_writers.open_writer(str(tmp_path / "result.txt"), "ENG", "IFS")
+
+
+def test_json_is_one_array(tmp_path):
+	filename = str(tmp_path / "result.json")
+	write(filename)
+	records = json.load(open(filename))
+	assert [(record["section"], record["qpn"]) for record in records] == [("match", "100-1"), ("match", "100-2"), ("only1", "100-3"), ("only2", "100-4")]
+	assert records[0]["qty_delta"] == 1
+	assert records[0]["bom2"]["only_ref"] == "R3"
+	assert (records[0]["bom1"]["label"], records[0]["bom2"]["label"]) == ("ENG", "IFS")
+	assert records[2]["bom2"] is None
+
+
+def test_labels_do_not_clash(tmp_path):
+	# Equal labels, or a label named like a field, keep both entries
+	filename = str(tmp_path / "result.jsonl")
+	for label1, label2 in [("BOM", "BOM"), ("qpn", "section")]:
+		with bom_writers.open_writer(filename, label1, label2) as writer:
+			bom_writers.stream_comparison([writer], BOM1, BOM2, COMPARISON)
+		record = json.loads(open(filename).readline())
+		assert (record["section"], record["qpn"]) == ("match", "100-1")
+		assert (record["bom1"]["qty"], record["bom2"]["qty"]) == ("2", "3")
+		assert (record["bom1"]["label"], record["bom2"]["label"]) == (label1, label2)
+
+
+def test_empty_json_array(tmp_path):
+	filename = str(tmp_path / "result.json")
+	with bom_writers.open_writer(filename, "ENG", "IFS"):
+		pass
+	assert json.load(open(filename)) == []
+
+
+def test_json_lines_match_json(tmp_path):
+	write(str(tmp_path / "result.json"))
+	write(str(tmp_path / "result.jsonl"))
+	lines = [json.loads(line) for line in open(str(tmp_path / "result.jsonl"))]
+	assert lines == json.load(open(str(tmp_path / "result.json")))
+
+
+def test_csv_qty_changes_only(tmp_path):
+	filename = str(tmp_path / "result.csv")
+	write(filename, qty_changes_only = True)
+	rows = list(csv.reader(open(filename, newline = "")))
+	assert [(row[0], row[1]) for row in rows[1:]] == [("match", "100-1"), ("only1", "100-3"), ("only2", "100-4")]
+	assert rows[1][-1] == "1"
+
+
+def test_xlsx_layout(tmp_path):
+	filename = str(tmp_path / "result.xlsx")
+	write(filename)
+	sheet = load_workbook(filename).active
+	rows = list(sheet.iter_rows(values_only = True))
+	assert rows[0][:2] == ("IFS QPN", "ENG QPN")
+	assert rows[1][0] == bom_writers.section_title(bom_writers.SECTION_MATCH, "ENG", "IFS")
+	assert rows[2][:2] == ("100-1", "100-1")
+	assert rows[2][bom_writers.comparison_bom_col_offsets["QTY_DELTA"] - 1] == 1
+	assert sheet.auto_filter.ref == "A1:T" + str(len(rows))
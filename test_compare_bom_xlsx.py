@@ -0,0 +1,113 @@
+"""Tests of reading BOM workbooks and comparing them (compare_bom_xlsx.py)."""
+import subprocess
+import sys
+
+import pytest
+
+import compare_bom_xlsx
+
+
+@pytest.fixture
+def workbook(save_workbook):
+	return save_workbook("PCBA-100.xlsx", {
+		"Revisions": [("Rev", "Date"), ("A", "2020-01-01")],
+		"BOM": [("PCBA-100 rev A",), (),
+				("QPN", "DES", "REF", "QTY"),
+				("100-1", "RES 10K", "R1, R2", 2),
+				("'100-2", " CAP 1UF ", "C1", 1.0),
+				(), (),
+				("100-3", "IC", "U1", 1),
+				(), (), (),
+				("100-9", "after the end", "", 1)],
+	})
+
+
+@pytest.mark.parametrize("reader", ["native", "openpyxl"])
+def test_parse_bom(workbook, reader):
+	table = compare_bom_xlsx.parse_bom(workbook, verbose = False, reader = reader)
+	assert table["file"] == "PCBA-100.xlsx"
+	assert [sheet["name"] for sheet in table["sheets"]] == ["BOM"]
+	assert table["sheets"][0]["data_start"] == 4
+	# Cells are cleaned, and three blank rows end the sheet
+	assert table["rows"] == [("100-1", "RES 10K", "R1, R2", "2"), ("100-2", "CAP 1UF", "C1", "1"), ("100-3", "IC", "U1", "1")]
+
+
+def test_uom_column_is_folded_into_qty(save_workbook):
+	filename = save_workbook("cable.xlsx", {"BOM": [("QPN", "DES", "QTY", "UOM"), ("W1", "WIRE", 500, "mm"), ("L1", "LABEL", "2 EA", "PCS")]})
+	assert compare_bom_xlsx.parse_bom(filename, verbose = False)["rows"] == [("W1", "WIRE", "", "500 mm"), ("L1", "LABEL", "", "2 EA")]
+
+
+def test_sheet_without_header_is_skipped(save_workbook):
+	filename = save_workbook("notes.xlsx", {"Notes": [("Some", "notes")] * 20})
+	assert compare_bom_xlsx.parse_bom(filename, verbose = False)["rows"] == []
+
+
+def test_extract_row():
+	assert compare_bom_xlsx.extract_row(("A", None, " x ", 2), [1, 3, 0, 4, 9]) == ["A", "x", "", "2", ""]
+	assert compare_bom_xlsx.row_is_blank(["", "-", ""])
+	assert not compare_bom_xlsx.row_is_blank(["", "AB", ""])
+
+
+def test_is_bom_file():
+	assert compare_bom_xlsx.is_bom_file("dir/PCBA.xlsx")
+	assert compare_bom_xlsx.is_bom_file("export.csv")
+	assert not compare_bom_xlsx.is_bom_file("Comparison_Results.xlsx")
+	assert not compare_bom_xlsx.is_bom_file("~$PCBA.xlsx")
+	assert not compare_bom_xlsx.is_bom_file("notes.txt")
+
+
+# ----------------------------------------------------------------------- #
+# Bom / compare API
+# ----------------------------------------------------------------------- #
+ROWS1 = [("100-1", "RES 10K", "R1,R2", "2"), ("100-2", "CAP 1UF", "C1", "1"), ("100-3", "IC", "U1", "1")]
+ROWS2 = [("100-1", "RES 10K", "R1-R3", "3"), ("100-2", "CAP 1.0UF", "C1", "1"), ("100-4", "LED", "D1", "1")]
+
+
+def test_openpyxl_is_imported_lazily():
+	# Reading CSV exports (or only comparing) doesn't pay for openpyxl
+	code = "import sys, compare_bom_xlsx; print('openpyxl' in sys.modules)"
+	assert subprocess.check_output([sys.executable, "-c", code]).strip() == b"False"
+
+
+def test_bom_from_rows():
+	bom = compare_bom_xlsx.Bom.from_rows([("100-1", "RES", "R1", 1), ("100-1", "RES", "R2", 1)], "ENG")
+	assert (bom.label, len(bom), bom["100-1"]) == ("ENG", 1, ("RES", "R1,R2", "2"))
+	assert bom.rows == [("100-1", "RES", "R1", "1"), ("100-1", "RES", "R2", "1")]
+
+
+def test_compare():
+	bom1 = compare_bom_xlsx.Bom.from_rows(ROWS1, "ENG")
+	bom2 = compare_bom_xlsx.Bom.from_rows(ROWS2, "IFS")
+	result = compare_bom_xlsx.compare(bom1, bom2)
+	assert result.sections() == (["100-1", "100-2"], ["100-3"], ["100-4"])
+	assert result.quantity_changes() == [("100-1", 1.0)]
+	assert [(key, str(only1), str(only2)) for key, only1, only2 in result.designator_changes()] == [("100-1", "", "R3")]
+	summary = result.summary()
+	assert (summary["matched"], summary["only1"], summary["only2"], summary["qty_changed"]) == (2, 1, 1, 1)
+	assert [record["section"] for record in result.records()] == ["match", "match", "only1", "only2"]
+
+
+def test_comparisons_are_independent():
+	# Nothing is kept in module globals between comparisons
+	bom1 = compare_bom_xlsx.Bom.from_rows(ROWS1, "ENG")
+	first = compare_bom_xlsx.compare(bom1, compare_bom_xlsx.Bom.from_rows(ROWS2, "IFS"))
+	second = compare_bom_xlsx.compare(bom1, compare_bom_xlsx.Bom.from_rows(ROWS1, "ENG2"))
+	assert first.sections() == (["100-1", "100-2"], ["100-3"], ["100-4"])
+	assert second.sections() == (["100-1", "100-2", "100-3"], [], [])
+
+
+def test_update():
+	bom1 = compare_bom_xlsx.Bom.from_rows(ROWS1, "ENG")
+	result = compare_bom_xlsx.compare(bom1, compare_bom_xlsx.Bom.from_rows(ROWS2, "IFS"))
+	result.update(bom2 = compare_bom_xlsx.Bom.from_rows(ROWS1[:2], "IFS"))
+	assert result.sections() == (["100-1", "100-2"], ["100-3"], [])
+	assert result.quantity_changes() == []
+
+
+def test_load_and_render(tmp_path, workbook):
+	bom1 = compare_bom_xlsx.load_bom(workbook)
+	bom2 = compare_bom_xlsx.Bom.from_rows(ROWS2, "IFS")
+	assert bom1.label == "PCBA-100"
+	output = str(tmp_path / "result.csv")
+	compare_bom_xlsx.compare(bom1, bom2).render(output)
+	assert open(output).read().count("\nmatch,") == 2
@@ -0,0 +1,55 @@
+"""Tests of the delimited text (CSV / TSV) BOM reader (delimited_reader.py)."""
+import codecs
+
+import pytest
+
+import compare_bom_xlsx
+import delimited_reader
+
+TEXT = "PCBA-100 export\n\nQPN;DES;REF;QTY\n100-1;RÉS 10K;\"R1;R2\";2\n100-2;CAP 1µF;C1;1\n"
+ROWS = [("100-1", "RÉS 10K", "R1;R2", "2"), ("100-2", "CAP 1µF", "C1", "1")]
+
+
+@pytest.mark.parametrize("encoding, mark", [
+	("utf-8", b""), ("utf-8", codecs.BOM_UTF8), ("cp1252", b""),
+	("utf-16-le", codecs.BOM_UTF16_LE), ("utf-16-le", b""), ("utf-16-be", b""),
+])
+def test_encodings(tmp_path, encoding, mark):
+	filename = tmp_path / "export.csv"
+	filename.write_bytes(mark + TEXT.replace("\n", "\r\n").encode(encoding))
+	assert compare_bom_xlsx.parse_bom(str(filename), verbose = False)["rows"] == ROWS
+
+
+def test_is_text():
+	assert delimited_reader.is_text("QPN,DES\r\n100-1,RÉS\t10K\n".encode("cp1252"))
+	assert delimited_reader.is_text("QPN,DES\n".encode("utf-16"))
+	assert not delimited_reader.is_text(b"\x00\x01\x02\x03binary\xff\xfe")
+
+
+def test_sniff_encoding():
+	assert delimited_reader.sniff_encoding("abc".encode("utf-8")) == "utf-8"
+	assert delimited_reader.sniff_encoding("RÉS 10K".encode("cp1252")) == "cp1252"
+	# A multi-byte character cut in two by the end of the sample
+	assert delimited_reader.sniff_encoding("abcé".encode("utf-8")[:-1]) == "utf-8"
+
+
+def test_delimiters():
+	assert delimited_reader.sniff_dialect("sep=|\nQPN|DES\n", "x.csv")[0].delimiter == "|"
+	assert delimited_reader.sniff_dialect("sep=|\nQPN|DES\n", "x.csv")[1] == 1
+	assert delimited_reader.sniff_dialect("QPN,DES\n1,2\n", "x.tsv")[0].delimiter == "\t"
+	assert delimited_reader.sniff_dialect("QPN\tDES\tQTY\n1\t2\t3\n", "x.csv")[0].delimiter == "\t"
+
+
+def test_workbook_interface(tmp_path):
+	filename = tmp_path / "export.tsv"
+	filename.write_text("QPN\tDES\n100-1\tRES\n")
+	book = delimited_reader.DelimitedWorkbook(str(filename))
+	assert book.sheetnames == ["export"]
+	sheet = book["export"]
+	rows = sheet.iter_rows(values_only = True)
+	assert next(rows) == ["QPN", "DES"]
+	book.close()
+	assert rows._file.closed
+	with pytest.raises(KeyError):
+		book["other"]
+	assert delimited_reader.is_delimited("a.TAB") and not delimited_reader.is_delimited("a.xlsx")
@@ -0,0 +1,83 @@
+"""Tests of the native .xlsx reader (xlsx_native.py) against openpyxl."""
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import compare_bom_xlsx
+import xlsx_native
+
+
+@pytest.fixture
+def workbook(save_workbook):
+	return save_workbook("bom.xlsx", {
+		"BOM": [("Assembly PCBA-100",), (),
+				("QPN", "DES", "Notes", "REF", "QTY"),
+				("100-1", "RES 10K", "x", "R1,R2", 2),
+				("100-2", "CAP 1UF", None, "C1", 1.5),
+				(None, None, None, None, None),
+				(100003, "IC", True, "U1", 1),
+				(), (),
+				(None, None, None, None, "AR")],
+		"Empty": [],
+	})
+
+
+def openpyxl_rows(filename, name):
+	book = load_workbook(filename, read_only = True, data_only = True)
+	rows = list(book[name].iter_rows(values_only = True))
+	book.close()
+	return rows
+
+
+def trim(row):
+	# Rows compare without trailing blanks
+	row = list(row)
+	while row and row[-1] is None:
+		row.pop()
+	return tuple(row)
+
+
+def test_rows_match_openpyxl(workbook):
+	book = xlsx_native.NativeWorkbook(workbook)
+	assert book.sheetnames == ["BOM", "Empty"]
+	native = [trim(row) for row in book["BOM"].iter_rows(values_only = True)]
+	assert native == [trim(row) for row in openpyxl_rows(workbook, "BOM")]
+	assert list(book["Empty"].iter_rows()) == []
+	book.close()
+
+
+def test_select_columns(workbook):
+	book = xlsx_native.NativeWorkbook(workbook)
+	rows = book["BOM"].iter_rows()
+	for i in range(3):
+		next(rows)
+	rows.select_columns([1, 2, 4, 5])
+	assert next(rows) == ("100-1", "RES 10K", None, "R1,R2", 2)
+	assert next(rows) == ("100-2", "CAP 1UF", None, "C1", 1.5)
+	book.close()
+
+
+def test_cell_references():
+	assert xlsx_native.column_number("AB12") == 28
+	assert xlsx_native.row_number("AB12") == 12
+	assert xlsx_native.parse_number("3") == 3
+	assert xlsx_native.parse_number("1E-3") == 0.001
+
+
+def test_not_a_workbook(tmp_path):
+	filename = tmp_path / "bom.xlsx"
+	filename.write_bytes(b"not a zip archive")
+	with pytest.raises(xlsx_native.NativeXlsxUnsupported):
+		xlsx_native.NativeWorkbook(str(filename))
+	with zipfile.ZipFile(str(tmp_path / "empty.xlsx"), "w") as zf:
+		zf.writestr("hello.txt", "")
+	with pytest.raises(xlsx_native.NativeXlsxUnsupported):
+		xlsx_native.NativeWorkbook(str(tmp_path / "empty.xlsx"))
+
+
+def test_parse_bom_same_with_either_reader(workbook):
+	native = compare_bom_xlsx.parse_bom(workbook, verbose = False, reader = "native")
+	fallback = compare_bom_xlsx.parse_bom(workbook, verbose = False, reader = "openpyxl")
+	assert native["rows"] == fallback["rows"]
+	assert [row[0] for row in native["rows"][:3]] == ["100-1", "100-2", "100003"]
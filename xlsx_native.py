@@ -0,0 +1,297 @@
+"""
+FILE: xlsx_native.py
+
+PURPOSE:
+Lightweight .xlsx reader used as a fast path by compare_bom_xlsx.py.
+
+The sheet XML and sharedStrings.xml are streamed straight out of the
+.xlsx archive with an incremental XML parser.  Shared strings are only
+materialized as far as the highest index actually requested, and once
+the BOM header has been located only the header columns are decoded.
+
+The reader mimics the small part of the openpyxl read-only API that the
+comparison script uses (sheetnames, wb[name].iter_rows(values_only=True),
+close()).  Anything it does not understand raises NativeXlsxUnsupported
+when the workbook is opened so the caller can fall back to openpyxl.
+
+AUTHOR:
+Clinton G.
+
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+# ----------------------------------------------------------------------- #
+# XML Namespaces
+# ----------------------------------------------------------------------- #
+NS_MAIN		= "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_STRICT	= "http://purl.oclc.org/ooxml/spreadsheetml/main"
+NS_REL		= "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL	= "http://schemas.openxmlformats.org/package/2006/relationships"
+
+TAG_ROW		= "{%s}row" % NS_MAIN
+TAG_CELL	= "{%s}c" % NS_MAIN
+TAG_VALUE	= "{%s}v" % NS_MAIN
+TAG_INLINE	= "{%s}is" % NS_MAIN
+TAG_TEXT	= "{%s}t" % NS_MAIN
+TAG_RUN		= "{%s}r" % NS_MAIN
+TAG_SI		= "{%s}si" % NS_MAIN
+TAG_DIM		= "{%s}dimension" % NS_MAIN
+TAG_SHEET_DATA	= "{%s}sheetData" % NS_MAIN
+TAG_SHEET	= "{%s}sheet" % NS_MAIN
+TAG_PKG_REL	= "{%s}Relationship" % NS_PKG_REL
+
+REL_WORKSHEET		= NS_REL + "/worksheet"
+REL_SHARED_STRINGS	= NS_REL + "/sharedStrings"
+REL_OFFICE_DOC		= NS_REL + "/officeDocument"
+
+
+class NativeXlsxUnsupported(Exception):
+	# Raised when a workbook uses a feature this reader can't handle
+	pass
+
+
+# -------------------------------------- #
+# Local Methods
+# -------------------------------------- #
+def column_number(cell_ref):
+	# Convert the letters of a cell reference (i.e. "AB12") to a 1-based column
+	col = 0
+	for ch in cell_ref:
+		if "A" <= ch <= "Z":
+			col = col * 26 + (ord(ch) - 64)
+		else:
+			break
+	return col
+
+def row_number(cell_ref):
+	# Digits of a cell reference (i.e. "AB12" -> 12)
+	for i in range(len(cell_ref)):
+		if cell_ref[i].isdigit():
+			return int(cell_ref[i:])
+	return 0
+
+def parse_number(text):
+	# Mirror openpyxl: whole numbers come back as int, everything else as float
+	if ("." in text) or ("E" in text) or ("e" in text):
+		return float(text)
+	return int(text)
+
+def string_item_text(elem):
+	# Text of a <si> or <is> element.  Rich text is a list of <r> runs, each
+	# holding a <t>.  Phonetic (<rPh>) runs are ignored, as Excel does.
+	t = elem.find(TAG_TEXT)
+	if t is not None:
+		return t.text or ""
+	return "".join((run.findtext(TAG_TEXT) or "") for run in elem.iter(TAG_RUN))
+
+def resolve_target(base_dir, target):
+	# Relationship targets are either absolute in the package or relative
+	# to the part that owns the relationship
+	if target.startswith("/"):
+		return target.lstrip("/")
+	return posixpath.normpath(posixpath.join(base_dir, target))
+
+def read_relationships(zf, rels_path, base_dir):
+	# Map of relationship id -> (type, part name)
+	rels = {}
+	root = ET.fromstring(zf.read(rels_path))
+	for rel in root.iter(TAG_PKG_REL):
+		if rel.get("TargetMode") == "External":
+			continue
+		rels[rel.get("Id")] = (rel.get("Type"), resolve_target(base_dir, rel.get("Target")))
+	return rels
+
+
+# ----------------------------------------------------------------------- #
+# Shared string table -- materialized lazily, only as far as needed
+# ----------------------------------------------------------------------- #
+class SharedStrings:
+
+	def __init__(self, zf, part):
+		self._zf = zf
+		self._part = part
+		self._strings = []
+		self._items = None
+
+	def _pull(self, index):
+		if self._items is None:
+			if self._part is None:
+				raise IndexError(index)
+			self._items = ET.iterparse(self._zf.open(self._part), events = ("end",))
+		for event, elem in self._items:
+			if elem.tag == TAG_SI:
+				self._strings.append(string_item_text(elem))
+				elem.clear()
+				if index < len(self._strings):
+					return
+		raise IndexError(index)
+
+	def __getitem__(self, index):
+		if index >= len(self._strings):
+			self._pull(index)
+		return self._strings[index]
+
+
+# ----------------------------------------------------------------------- #
+# Row iterator for a single sheet
+# ----------------------------------------------------------------------- #
+class SheetRows:
+
+	def __init__(self, zf, part, shared_strings):
+		self._zf = zf
+		self._part = part
+		self._shared = shared_strings
+		self._columns = None		# None means decode every column
+		self._max_col = 0
+		self._events = None
+		self._next_row = 1
+		self._pending = None
+
+	def select_columns(self, columns):
+		# From here on only decode these (1-based) columns.  Every other
+		# cell is skipped without touching the shared string table.
+		self._columns = frozenset(c for c in columns if c > 0)
+		self._max_col = max(self._columns) if self._columns else 0
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		# Rows missing from the XML are handed back as empty tuples so that
+		# row numbering (and blank row detection) matches the sheet
+		if self._pending is not None:
+			if self._next_row < self._pending[0]:
+				self._next_row += 1
+				return ()
+			row = self._pending[1]
+			self._pending = None
+			self._next_row += 1
+			return row
+
+		if self._events is None:
+			self._events = ET.iterparse(self._zf.open(self._part), events = ("end",))
+
+		for event, elem in self._events:
+			if elem.tag != TAG_ROW:
+				continue
+			r = elem.get("r")
+			r = int(r) if r else self._next_row
+			row = self._decode_row(elem)
+			elem.clear()
+			if r > self._next_row:
+				self._pending = (r, row)
+				self._next_row += 1
+				return ()
+			self._next_row += 1
+			return row
+		raise StopIteration
+
+	def _decode_row(self, row_elem):
+		columns = self._columns
+		cells = {}
+		c = 0
+		for cell in row_elem.iter(TAG_CELL):
+			ref = cell.get("r")
+			c = column_number(ref) if ref else c + 1
+			if (columns is not None) and (c not in columns):
+				continue
+			cells[c] = self._decode_cell(cell)
+
+		if not cells:
+			return ()
+		width = max(cells) if columns is None else max(self._max_col, max(cells))
+		row = [None] * width
+		for c in cells:
+			row[c - 1] = cells[c]
+		return tuple(row)
+
+	def _decode_cell(self, cell):
+		t = cell.get("t", "n")
+		if t == "inlineStr":
+			inline = cell.find(TAG_INLINE)
+			return string_item_text(inline) if inline is not None else None
+
+		text = cell.findtext(TAG_VALUE)
+		if text is None:
+			return None
+		if t == "s":
+			return self._shared[int(text)]
+		if t == "n":
+			return parse_number(text)
+		if t == "b":
+			return text == "1"
+		return text				# "str" (formula result), "e" (error), "d" (ISO date)
+
+
+class NativeSheet:
+
+	def __init__(self, workbook, title, part):
+		self._workbook = workbook
+		self.title = title
+		self._part = part
+
+	def iter_rows(self, values_only = True):
+		return SheetRows(self._workbook._zf, self._part, self._workbook._shared)
+
+
+# ----------------------------------------------------------------------- #
+# Workbook
+# ----------------------------------------------------------------------- #
+class NativeWorkbook:
+
+	def __init__(self, filename):
+		try:
+			self._zf = zipfile.ZipFile(filename)
+		except zipfile.BadZipFile:
+			raise NativeXlsxUnsupported("Not a zip archive (encrypted or legacy format?): " + str(filename))
+
+		try:
+			self._load_structure()
+		except NativeXlsxUnsupported:
+			self._zf.close()
+			raise
+		except (KeyError, ET.ParseError) as e:
+			self._zf.close()
+			raise NativeXlsxUnsupported("Unexpected workbook structure: " + str(e))
+
+	def _load_structure(self):
+		# Locate the workbook part through the package relationships
+		workbook_part = None
+		for rel_type, target in read_relationships(self._zf, "_rels/.rels", "").values():
+			if rel_type == REL_OFFICE_DOC:
+				workbook_part = target
+		if workbook_part is None:
+			raise NativeXlsxUnsupported("No officeDocument relationship found")
+
+		root = ET.fromstring(self._zf.read(workbook_part))
+		if root.tag != "{%s}workbook" % NS_MAIN:
+			raise NativeXlsxUnsupported("Unsupported workbook namespace: " + root.tag)
+
+		base_dir = posixpath.dirname(workbook_part)
+		rels_path = posixpath.join(base_dir, "_rels", posixpath.basename(workbook_part) + ".rels")
+		rels = read_relationships(self._zf, rels_path, base_dir)
+
+		shared_part = None
+		for rel_type, target in rels.values():
+			if rel_type == REL_SHARED_STRINGS:
+				shared_part = target
+		self._shared = SharedStrings(self._zf, shared_part)
+
+		# Only worksheets are listed -- chart sheets hold no BOM data
+		self._sheets = {}
+		self.sheetnames = []
+		for sheet in root.iter(TAG_SHEET):
+			rel_type, target = rels[sheet.get("{%s}id" % NS_REL)]
+			if rel_type != REL_WORKSHEET:
+				continue
+			name = sheet.get("name")
+			self.sheetnames.append(name)
+			self._sheets[name] = NativeSheet(self, name, target)
+
+	def __getitem__(self, name):
+		return self._sheets[name]
+
+	def close(self):
+		self._zf.close()